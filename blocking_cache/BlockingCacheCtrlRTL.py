@@ -10,7 +10,7 @@ Date   : 10 February 2020
 
 from colorama                import Fore, Back, Style
 from pymtl3                  import *
-from pymtl3.stdlib.basic_rtl import RegEnRst, RegRst
+from pymtl3.stdlib.basic_rtl import RegEnRst, RegRst, Mux
 # Import generic constants used in the repo
 from constants               import *
 
@@ -110,21 +110,67 @@ class BlockingCacheCtrlRTL( Component ):
     s.status        = InPort (p.StructStatus)
     s.ctrl          = OutPort(p.StructCtrl)
 
+    if p.perf_counters:
+      s.perf_sel    = InPort (PERF_SEL_NBITS)
+      s.perf_clear  = InPort ()
+      s.perf_count  = OutPort(PERF_COUNTER_NBITS)
+
     #=====================================================================
     # Y Stage
     #=====================================================================
 
     # In Y stage we always set the memresp_rdy to high since we assume
-    # there would be no memresp unless we have sent a memreq
-    s.memresp_rdy //= y
+    # there would be no memresp unless we have sent a memreq. A nonblocking
+    # cache may get a memresp while M0 is busy, so refills wait in the
+    # memresp queue and writeback acks are dropped as they arrive. So are
+    # the acks of the writebacks drained from the write-back buffer, and
+    # the acks that come back after a refill from the victim cache
+    s.memresp_hold_M0 = Wire()
+    s.memresp_val_Y   = Wire()
+    s.vc_inject_Y     = Wire()
+    if p.nonblocking or p.wb_buffer_entries or p.victim_lines:
+      s.wb_pending = RegRst(p.bitwidth_opaque)
+      s.wb_ack_Y   = Wire()
+      s.wb_ack_Y //= lambda: ( s.memresp_en & (s.status.memresp_type_Y == WRITE)
+                               & (s.wb_pending.out != 0) )
+    if p.nonblocking:
+      s.memresp_rdy //= lambda: ( s.status.memresp_q_enq_rdy |
+                                  (s.wb_pending.out != 0) )
+      s.ctrl.memresp_q_enq_en_Y //= lambda: ( (s.memresp_en & ~s.wb_ack_Y) |
+                                              s.vc_inject_Y )
+      s.ctrl.memresp_q_deq_en_Y //= lambda: ( s.status.memresp_q_deq_rdy &
+                                              s.ctrl.memresp_reg_en_M0 )
+      s.memresp_val_Y //= s.status.memresp_q_deq_rdy
+    else:
+      s.memresp_rdy //= y
+      s.ctrl.memresp_q_enq_en_Y //= n
+      s.ctrl.memresp_q_deq_en_Y //= n
+      if p.wb_buffer_entries or p.victim_lines:
+        s.memresp_val_Y //= lambda: (s.memresp_en & ~s.wb_ack_Y) | s.vc_inject_Y
+      else:
+        s.memresp_val_Y //= s.memresp_en
+
+    # The refill from the victim cache waits for a cycle without a memresp
+    # that M0 or the memresp queue can take
+    if p.victim_lines:
+      s.vc_resp_val = RegRst(1)
+      if p.nonblocking:
+        s.vc_inject_Y //= lambda: ( s.vc_resp_val.out & ~s.memresp_en &
+                                    s.status.memresp_q_enq_rdy )
+      else:
+        s.vc_inject_Y //= lambda: ( s.vc_resp_val.out & ~s.memresp_en &
+                                    s.ctrl.memresp_reg_en_M0 )
+    else:
+      s.vc_inject_Y //= n
+    s.ctrl.vc_resp_sel_Y //= s.vc_inject_Y
 
     #=====================================================================
     # M0 Stage
     #=====================================================================
 
     s.memresp_en_M0 = m = RegEnRst(1)
-    m.in_ //= s.memresp_en
-    m.en  //= s.ctrl.reg_en_M0
+    m.in_ //= s.memresp_val_Y
+    m.en  //= s.ctrl.memresp_reg_en_M0
 
 
     # Checks if memory response if valid
@@ -173,10 +219,11 @@ class BlockingCacheCtrlRTL( Component ):
           s.FSM_state_M0_next @= M0_FSM_STATE_INIT
 
       elif s.FSM_state_M0.out == M0_FSM_STATE_READY:
-        if s.memresp_val_M0 & ((s.status.MSHR_type == WRITE) | (s.status.MSHR_type == READ)):
+        if ( s.memresp_val_M0 & ~s.is_write_hit_clean_M0 &
+             ((s.status.MSHR_type == WRITE) | (s.status.MSHR_type == READ)) ):
           # Have valid replays in the MSHR
           s.FSM_state_M0_next @= M0_FSM_STATE_REPLAY
-        elif ( s.status.MSHR_empty & s.cachereq_en ):
+        elif s.cachereq_go_M0:
           if s.status.cachereq_type_M0 == INV:
             s.FSM_state_M0_next @= M0_FSM_STATE_INV
           elif s.status.cachereq_type_M0 == FLUSH:
@@ -228,6 +275,21 @@ class BlockingCacheCtrlRTL( Component ):
 
     s.trans_M0 = Wire(TRANS_TYPE_NBITS)
 
+    # Start a request in M0: from cachereq, or for a nonblocking cache also
+    # a secondary miss retried from the MSHR or a prefetch
+    s.retry_M0       = Wire()
+    s.pf_issue_M0    = Wire()
+    s.cachereq_go_M0 = Wire()
+    if p.nonblocking:
+      s.retry_M0 //= lambda: ( (s.FSM_state_M0.out == M0_FSM_STATE_READY) &
+                               s.status.MSHR_retry_val & ~s.memresp_en_M0.out &
+                               ~s.is_write_hit_clean_M0 )
+      s.cachereq_go_M0 //= lambda: s.cachereq_en | s.retry_M0 | s.pf_issue_M0
+    else:
+      s.retry_M0 //= n
+      s.pf_issue_M0 //= n
+      s.cachereq_go_M0 //= lambda: s.status.MSHR_empty & s.cachereq_en
+
     @update
     def transaction_logic_M0():
       s.trans_M0 @= TRANS_TYPE_INVALID
@@ -267,8 +329,8 @@ class BlockingCacheCtrlRTL( Component ):
                  (s.status.MSHR_type <  INV) ):
             s.trans_M0 @= TRANS_TYPE_REPLAY_AMO
 
-        elif s.status.MSHR_empty & s.cachereq_en:
-          # Request from s.cachereq, not MSHR
+        elif s.cachereq_go_M0:
+          # Request from s.cachereq, not MSHR (or a retried secondary miss)
           if s.status.cachereq_type_M0 == INIT:
             s.trans_M0 @= TRANS_TYPE_INIT_REQ
           elif s.status.cachereq_type_M0 == READ:
@@ -296,6 +358,22 @@ class BlockingCacheCtrlRTL( Component ):
 
     s.counter_M0.count_down //= 1
     s.counter_M0.en         //= lambda: s.ctrl.reg_en_M0 & s.counter_en_M0
+    s.ctrl.flush_ptr_M0     //= s.counter_M0.out
+
+    # With the dirty-line index, flush jumps the counter to the next dirty
+    # line at the start and after each writeback instead of reading every
+    # line. Nothing dirty left means the counter lands on line 0, which
+    # ends the flush as usual. A counter that has already wrapped around
+    # means line 0 was just written back and the flush is done.
+    if p.dirty_line_index:
+      last_line = p.BitsClogNlines( p.total_num_cachelines - 1 )
+      s.counter_M0.load       //= lambda: s.ctrl.reg_en_M0 & (
+        ( s.trans_M0 == TRANS_TYPE_FLUSH_START ) |
+        ( ( s.trans_M0 == TRANS_TYPE_FLUSH_WRITE ) & ( s.counter_M0.out != last_line ) ) )
+      s.counter_M0.load_value //= s.status.flush_next_dirty_M0
+    else:
+      s.counter_M0.load       //= 0
+      s.counter_M0.load_value //= 0
 
     # When the flush ack come back, the counter has already been
     # decremented one extra time, so we need to add it back
@@ -321,8 +399,9 @@ class BlockingCacheCtrlRTL( Component ):
     # We will select MSHR dealloc output instead of incoming cachereq if:
     # 1. We have a valid memresp ( we prioritize handling refills/replays )
     # 2. We are in a middle of a replay
+    # 3. We are retrying a secondary miss (nonblocking)
     s.ctrl.cachereq_memresp_mux_sel_M0 //= lambda: ((s.FSM_state_M0.out == M0_FSM_STATE_REPLAY)
-                                                   | s.memresp_en_M0.out)
+                                                   | s.memresp_en_M0.out | s.retry_M0)
 
     # We will stall for the following conditions:
     # 1. We are initializing cache as a result of a reset
@@ -331,9 +410,79 @@ class BlockingCacheCtrlRTL( Component ):
     # 3. There is a stall in the cache due to external factors
     # 4. MSHR is not empty (for blocking cache)
     # 5. MSHR is full (for nonblocking cache)
-    s.cachereq_rdy //= lambda: ~( (s.FSM_state_M0.out == M0_FSM_STATE_INIT) |
-             s.is_write_hit_clean_M0 | s.stall_M0 | (~s.status.MSHR_empty ) |
-             s.status.MSHR_full )
+    # 6. It is a flush and the write-back buffer has not drained
+    if p.nonblocking or p.wb_buffer_entries or p.victim_lines:
+      s.wb_sent_M2  = Wire()
+      if p.wb_buffer_entries:
+        s.wb_sent_M2 //= s.ctrl.wbb_deq_en_M2
+      else:
+        s.wb_sent_M2 //= lambda: s.memreq_en & s.is_evict_M2.out
+
+      @update
+      def wb_pending_logic():
+        s.wb_pending.in_ @= s.wb_pending.out
+        if s.wb_sent_M2 & ~s.wb_ack_Y:
+          s.wb_pending.in_ @= s.wb_pending.out + 1
+        elif s.wb_ack_Y & ~s.wb_sent_M2:
+          s.wb_pending.in_ @= s.wb_pending.out - 1
+
+    s.wbb_drained = Wire()
+    if p.wb_buffer_entries or p.victim_lines:
+      s.wbb_drained //= lambda: s.status.wbb_empty & (s.wb_pending.out == 0)
+    else:
+      s.wbb_drained //= y
+
+    if not p.nonblocking:
+      s.cachereq_rdy //= lambda: ~( (s.FSM_state_M0.out == M0_FSM_STATE_INIT) |
+               s.is_write_hit_clean_M0 | s.stall_M0 | (~s.status.MSHR_empty ) |
+               s.status.MSHR_full |
+               ( (s.status.cachereq_type_M0 == FLUSH) & ~s.wbb_drained ) )
+    else:
+      # For nonblocking cache M0 must also be free of memresps, replays and
+      # retries, and we hold requests
+      # 6. to a set with an outstanding miss to another line, so the
+      #    accesses to a set stay in order
+      # 7. other than read/write until all misses and writebacks are done
+      # 8. after an AMO until its memresp comes back
+      s.drained_M0 = Wire()
+      s.drained_M0 //= lambda: ( s.status.MSHR_empty & ~s.ctrl.MSHR_alloc_en &
+                                 ~s.memresp_en_M0.out & ~s.memresp_val_Y &
+                                 (s.wb_pending.out == 0) & s.status.wbb_empty )
+
+      s.amo_pending = RegRst(1)
+
+      @update
+      def amo_pending_logic():
+        s.amo_pending.in_ @= s.amo_pending.out
+        if ~s.stall_M0:
+          if s.trans_M0 == TRANS_TYPE_AMO_REQ:
+            s.amo_pending.in_ @= 1
+          elif s.trans_M0 == TRANS_TYPE_REPLAY_AMO:
+            s.amo_pending.in_ @= 0
+
+      # M0 could take a new request. The type is that of cachereq itself,
+      # as M0 sees a prefetch instead when one is issued
+      s.cachereq_slot_M0 = Wire()
+      s.cachereq_slot_M0 //= lambda: ~( (s.FSM_state_M0.out != M0_FSM_STATE_READY) |
+               s.is_write_hit_clean_M0 | s.stall_M0 | s.memresp_en_M0.out |
+               s.status.MSHR_retry_val | s.status.MSHR_full | s.amo_pending.out )
+
+      # 9. while the prefetch candidate takes M0. It does so whenever M0
+      #    is free, unless its set has a miss or no more refills are
+      #    allowed. cachereq_en cannot decide this, as cachereq_rdy would
+      #    then depend on it
+      if p.prefetch_entries:
+        s.pf_issue_M0 //= lambda: ( s.status.pf_val_M0 & s.cachereq_slot_M0 &
+                 ~s.status.pf_busy_M0 & ~s.status.MSHR_refill_full_M1 )
+      else:
+        s.pf_issue_M0 //= n
+
+      s.cachereq_rdy //= lambda: ( s.cachereq_slot_M0 & ~s.pf_issue_M0 &
+               ~s.status.MSHR_conflict_M0 &
+               ~( (s.status.cachereq_type_Y != READ) &
+                  (s.status.cachereq_type_Y != WRITE) & ~s.drained_M0 ) )
+
+    s.ctrl.pf_issue_M0 //= s.pf_issue_M0
 
     #---------------------------------------------------------------------
     # M0 control signal table
@@ -396,9 +545,40 @@ class BlockingCacheCtrlRTL( Component ):
       s.ctrl.update_tag_cmd_M0    @= s.cs0[ CS_tag_update_cmd_M0     ]
       s.ctrl.tag_array_idx_sel_M0 @= s.cs0[ CS_tag_array_idx_sel_M0  ]
       s.ctrl.update_tag_sel_M0    @= s.cs0[ CS_update_tag_tag_sel_M0 ]
-      s.ctrl.MSHR_dealloc_en      @= s.cs0[ CS_mshr_dealloc_M0       ] & ~s.stall_M0
+      s.ctrl.MSHR_dealloc_en      @= ( s.cs0[ CS_mshr_dealloc_M0 ] | s.retry_M0 ) & ~s.stall_M0
 
     s.ctrl.reg_en_M0 //= lambda: ~s.stall_M0
+
+    s.ctrl.memresp_reg_en_M0 //= lambda: ~s.stall_M0 & ~s.memresp_hold_M0
+
+    if p.nonblocking:
+      # A memresp stays in M0 while a write hit clean or a replay uses M0
+      s.memresp_hold_M0 //= lambda: s.memresp_en_M0.out & (
+        (s.trans_M0 == TRANS_TYPE_CLEAN_HIT) |
+        (s.trans_M0 == TRANS_TYPE_REPLAY_READ) |
+        (s.trans_M0 == TRANS_TYPE_REPLAY_WRITE) )
+
+      # Which MSHR entry M0 works on
+      @update
+      def MSHR_dealloc_id_sel_logic_M0():
+        s.ctrl.MSHR_dealloc_id_sel_M0 @= 1 # entry of the current replay
+        if s.FSM_state_M0.out == M0_FSM_STATE_READY:
+          if s.memresp_en_M0.out:
+            s.ctrl.MSHR_dealloc_id_sel_M0 @= 0 # memresp opaque
+          elif ( (s.trans_M0 == TRANS_TYPE_INV_START) |
+                 (s.trans_M0 == TRANS_TYPE_FLUSH_START) ):
+            s.ctrl.MSHR_dealloc_id_sel_M0 @= 3 # drained, entry 0
+          else:
+            s.ctrl.MSHR_dealloc_id_sel_M0 @= 2 # secondary miss retry
+
+      s.ctrl.MSHR_replay_id_en_M0 //= lambda: ~s.stall_M0 & (
+        (s.trans_M0 == TRANS_TYPE_REFILL) |
+        (s.trans_M0 == TRANS_TYPE_INV_START) |
+        (s.trans_M0 == TRANS_TYPE_FLUSH_START) )
+    else:
+      s.memresp_hold_M0             //= n
+      s.ctrl.MSHR_dealloc_id_sel_M0 //= 0
+      s.ctrl.MSHR_replay_id_en_M0   //= 0
     # use higher bits of the counter to select index
     clog_asso = clog2( p.associativity )
     s.ctrl.tag_array_init_idx_M0 //= lambda: s.update_way_idx_M0[ clog_asso : p.bitwidth_num_lines ]
@@ -428,7 +608,7 @@ class BlockingCacheCtrlRTL( Component ):
       elif (s.trans_M0 == TRANS_TYPE_REPLAY_AMO) & (s.status.amo_hit_M0):
         s.ctrl.tag_array_val_M0[s.status.MSHR_ptr] @= y
       elif s.trans_M0 == TRANS_TYPE_INIT_REQ:
-        s.ctrl.tag_array_val_M0[s.status.ctrl_bit_rep_rd_M1] @= y
+        s.ctrl.tag_array_val_M0[s.victim_way_M1] @= y
       elif s.trans_M0 == TRANS_TYPE_CLEAN_HIT:
         s.ctrl.tag_array_val_M0[s.status.hit_way_M1] @= y
       elif ( (s.trans_M0 == TRANS_TYPE_READ_REQ) |
@@ -463,16 +643,34 @@ class BlockingCacheCtrlRTL( Component ):
     s.repreq_en_M1      = Wire(1)
     s.repreq_is_hit_M1  = Wire(1)
     s.repreq_hit_ptr_M1 = Wire(p.bitwidth_clog_asso)
+    s.repreq_is_inval_M1= Wire(1)
+    s.victim_way_M1     = Wire(p.bitwidth_clog_asso)
+    # Miss to a line that already has a miss in flight, or a miss parked
+    # while no more refills are allowed (nonblocking)
+    s.is_secondary_M1   = Wire(1)
+    s.is_parked_M1      = Wire(1)
+    # Secondary miss that takes over the MSHR entry of a prefetch
+    s.is_promote_M1     = Wire(1)
+    # The victim is valid and goes into the victim cache
+    s.vc_victim_M1      = Wire(1)
 
     s.stall_M1 //= lambda: s.ostall_M1 | s.ostall_M2
 
-    # TODO: Need more work
-    s.replacement_M1 = m = ReplacementPolicy(p, 0)
-    m.repreq_en      //= s.repreq_en_M1
-    m.repreq_hit_ptr //= s.repreq_hit_ptr_M1
-    m.repreq_is_hit  //= s.repreq_is_hit_M1
-    m.repreq_ptr     //= s.status.ctrl_bit_rep_rd_M1 # Read replacement mask
-    m.represp_ptr    //= s.ctrl.ctrl_bit_rep_wr_M0   # Bypass to M0 stage?
+    if p.victim_lines:
+      s.vc_victim_M1 //= lambda: s.status.ctrl_bit_val_rd_M1[s.victim_way_M1]
+    else:
+      s.vc_victim_M1 //= n
+
+    # Picks the victim from the replacement state of the set and computes
+    # the state to write back after this access
+    s.replacement_M1 = m = ReplacementPolicy(p, p.replacement_policy)
+    m.repreq_en       //= s.repreq_en_M1
+    m.repreq_hit_ptr  //= s.repreq_hit_ptr_M1
+    m.repreq_is_hit   //= s.repreq_is_hit_M1
+    m.repreq_is_inval //= s.repreq_is_inval_M1
+    m.repreq_state    //= s.status.ctrl_bit_rep_rd_M1 # Read replacement state
+    m.represp_state   //= s.ctrl.ctrl_bit_rep_wr_M0   # Bypass to M0 stage?
+    m.represp_victim  //= s.victim_way_M1
 
 
     # Selects the index offset for the Data array based on which way to
@@ -490,7 +688,7 @@ class BlockingCacheCtrlRTL( Component ):
           if s.status.inval_hit_M1:
             s.ctrl.way_offset_M1 @= s.status.hit_way_M1
           else:
-            s.ctrl.way_offset_M1 @= s.status.ctrl_bit_rep_rd_M1
+            s.ctrl.way_offset_M1 @= s.victim_way_M1
       elif s.trans_M1.out == TRANS_TYPE_AMO_REQ:
         s.ctrl.way_offset_M1 @= s.status.amo_hit_way_M1
       elif ( (s.trans_M1.out == TRANS_TYPE_FLUSH_READ) |
@@ -519,12 +717,16 @@ class BlockingCacheCtrlRTL( Component ):
     @update
     def status_logic_M1():
       s.is_evict_M1       @= n
-      s.is_dty_M1         @= s.status.ctrl_bit_dty_rd_line_M1[s.status.ctrl_bit_rep_rd_M1]
+      s.is_dty_M1         @= s.status.ctrl_bit_dty_rd_line_M1[s.victim_way_M1]
       # Bits for set associative caches
       s.repreq_is_hit_M1  @= n
+      s.repreq_is_inval_M1@= n
       s.repreq_en_M1      @= n
-      s.repreq_hit_ptr_M1 @= x
+      s.repreq_hit_ptr_M1 @= 0
       s.hit_M1            @= n
+      s.is_secondary_M1   @= n
+      s.is_parked_M1      @= n
+      s.is_promote_M1     @= n
       s.is_write_hit_clean_M0 @= n
 
       if ( (s.trans_M1.out == TRANS_TYPE_INIT_REQ) |
@@ -539,19 +741,30 @@ class BlockingCacheCtrlRTL( Component ):
           s.repreq_en_M1      @= y
           s.repreq_is_hit_M1  @= n
 
+        # A secondary miss only waits in the MSHR for the line; it neither
+        # evicts nor touches the replacement state until it is retried.
+        # Parked misses do the same until a refill comes back
+        s.is_parked_M1    @= ( ~s.hit_M1 & ~s.status.MSHR_pending_M1 &
+                               s.status.MSHR_refill_full_M1 )
+        s.is_secondary_M1 @= ( ~s.hit_M1 & s.status.MSHR_pending_M1 ) | s.is_parked_M1
+        s.is_promote_M1   @= ( ~s.hit_M1 & s.status.MSHR_pending_M1 &
+                               s.status.MSHR_pending_pf_M1 &
+                               (s.trans_M1.out != TRANS_TYPE_INIT_REQ) )
+
         # Check that we don't have a situation where ~val and dty but we're
         # still accessing the same address.
-        if ~s.status.inval_hit_M1:
+        if ~s.status.inval_hit_M1 & ~s.is_secondary_M1:
           # moyang: we are not check s.is_line_valid_M1 because for invalid
           # but dirty cache lines (due to cache invalidation), we still need
-          # to evict them
-          if ~s.hit_M1 & s.is_dty_M1:
+          # to evict them. With a victim cache clean valid lines are evicted
+          # too, into the victim cache
+          if ~s.hit_M1 & ( s.is_dty_M1 | s.vc_victim_M1 ):
             s.is_evict_M1 @= y
           elif s.hit_M1 & ~s.is_dty_M1:
             if s.trans_M1.out == TRANS_TYPE_WRITE_REQ:
               s.is_write_hit_clean_M0 @= y
 
-        if ~s.is_evict_M1:
+        if ~s.is_evict_M1 & ~s.is_secondary_M1:
           # Better to update replacement bit right away because we need it
           # for nonblocking capability. For blocking, we can also update
           # during a refill for misses
@@ -564,9 +777,11 @@ class BlockingCacheCtrlRTL( Component ):
         s.is_dty_M1 @= s.status.ctrl_bit_dty_rd_line_M1[s.status.hit_way_M1]
         s.is_evict_M1 @= s.is_dty_M1 & ( s.hit_M1 | s.status.inval_hit_M1 )
         if s.hit_M1 | s.status.inval_hit_M1:
+          # The AMO invalidates the line, so replace it next
           s.repreq_en_M1      @= y
-          s.repreq_hit_ptr_M1 @= ~s.status.hit_way_M1
+          s.repreq_hit_ptr_M1 @= s.status.hit_way_M1
           s.repreq_is_hit_M1  @= y
+          s.repreq_is_inval_M1@= y
 
       s.ctrl.ctrl_bit_rep_en_M1 @= s.repreq_en_M1 & ~s.stall_M2
 
@@ -630,6 +845,10 @@ class BlockingCacheCtrlRTL( Component ):
       s.ctrl.evict_mux_sel_M1   @= s.cs1[ CS_evict_mux_sel_M1   ]
       s.ctrl.MSHR_alloc_en      @= s.cs1[ CS_MSHR_alloc_en      ] & ~s.stall_M1
 
+    s.ctrl.MSHR_alloc_secondary //= s.is_secondary_M1
+    s.ctrl.MSHR_alloc_parked    //= s.is_parked_M1
+    s.ctrl.MSHR_alloc_promote   //= s.is_promote_M1
+
     # Logic for pipelined registers for dpath
     s.ctrl.reg_en_M1 //= lambda: (~s.stall_M1 & ~s.is_evict_M1 &
                                  (s.trans_M0 != TRANS_TYPE_CACHE_INIT))
@@ -675,13 +894,134 @@ class BlockingCacheCtrlRTL( Component ):
     m.en  //= s.ctrl_pipeline_reg_en_M2
     m.out //= s.ctrl.hit_M2[0]
 
+    s.is_secondary_M2 = m = RegEnRst(1)
+    m.in_ //= s.is_secondary_M1
+    m.en  //= s.ctrl_pipeline_reg_en_M2
+
+    s.is_promote_M2 = m = RegEnRst(1)
+    m.in_ //= s.is_promote_M1
+    m.en  //= s.ctrl_pipeline_reg_en_M2
+
     s.has_flush_sent_M2 = m = RegEnRst(1)
     m.in_ //= s.has_flush_sent_M1_bypass
     m.en  //= s.ctrl_pipeline_reg_en_M2
 
+    # An eviction writes back a dirty victim and puts a valid one into the
+    # victim cache; without a victim cache only dirty victims are evicted
+    s.evict_wb_M2 = Wire()
+    s.evict_vc_M2 = Wire()
+    if p.victim_lines:
+      s.evict_dty_M2 = m = RegEnRst(1)
+      m.in_ //= s.is_dty_M1
+      m.en  //= s.ctrl_pipeline_reg_en_M2
+
+      s.evict_val_M2 = m = RegEnRst(1)
+      m.in_ //= s.vc_victim_M1
+      m.en  //= s.ctrl_pipeline_reg_en_M2
+
+      s.evict_wb_M2 //= lambda: s.is_evict_M2.out & s.evict_dty_M2.out
+      s.evict_vc_M2 //= lambda: ( s.is_evict_M2.out & s.evict_val_M2.out &
+                                  (s.trans_M2.out != TRANS_TYPE_AMO_REQ) )
+    else:
+      s.evict_wb_M2 //= s.is_evict_M2.out
+      s.evict_vc_M2 //= n
+
     s.stall_M2  = Wire(1)
     s.stall_M2 //= s.ostall_M2
 
+    #---------------------------------------------------------------------
+    # Write-back buffer
+    #---------------------------------------------------------------------
+    # A dirty eviction goes into the write-back buffer instead of to
+    # memory, or stalls M2 while the buffer is full. The buffer drains in
+    # the cycles M2 sends no memreq. A refill or AMO to a line still in the
+    # buffer waits in M2 until it has drained; memory serves us in order
+
+    s.memreq_en_M2    = Wire()
+    s.wbb_evict_M2    = Wire()
+    s.wbb_conflict_M2 = Wire()
+    if p.wb_buffer_entries:
+      s.wbb_evict_M2    //= s.evict_wb_M2
+      s.wbb_conflict_M2 //= lambda: ( s.status.wbb_hit_M2 & ~s.is_evict_M2.out &
+        ~s.is_secondary_M2.out & ( (s.trans_M2.out == TRANS_TYPE_AMO_REQ) |
+        ( ~s.ctrl.hit_M2[0] & ( (s.trans_M2.out == TRANS_TYPE_READ_REQ) |
+                                (s.trans_M2.out == TRANS_TYPE_WRITE_REQ) ) ) ) )
+      s.ctrl.wbb_enq_en_M2 //= lambda: s.wbb_evict_M2 & ~s.status.wbb_full
+      s.ctrl.wbb_deq_en_M2 //= lambda: ( ~s.status.wbb_empty & s.memreq_rdy &
+                                         ~s.memreq_en_M2 )
+      s.memreq_en //= lambda: s.memreq_en_M2 | s.ctrl.wbb_deq_en_M2
+    else:
+      s.wbb_evict_M2       //= n
+      s.wbb_conflict_M2    //= n
+      s.ctrl.wbb_enq_en_M2 //= n
+      s.ctrl.wbb_deq_en_M2 //= n
+      s.memreq_en          //= s.memreq_en_M2
+
+    #---------------------------------------------------------------------
+    # Victim cache
+    #---------------------------------------------------------------------
+    # A clean eviction only goes into the victim cache. A read/write miss
+    # that hits there sends no memreq: the line is kept as a memresp and
+    # injected in Y, from where it refills like one from memory. M2 waits
+    # while the previous one has not gone in yet. AMOs and init requests
+    # remove the copy of their line, INV empties the victim cache
+
+    s.vc_refill_M2 = Wire()
+    s.vc_stall_M2  = Wire()
+    if p.victim_lines:
+      s.vc_refill_M2 //= lambda: ( s.status.vc_hit_M2 & ~s.is_evict_M2.out &
+        ~s.is_secondary_M2.out & ~s.ctrl.hit_M2[0] &
+        ( (s.trans_M2.out == TRANS_TYPE_READ_REQ) |
+          (s.trans_M2.out == TRANS_TYPE_WRITE_REQ) ) )
+      s.vc_stall_M2  //= lambda: s.vc_refill_M2 & s.vc_resp_val.out
+      s.ctrl.vc_ins_en_M2    //= lambda: s.evict_vc_M2 & ~s.ostall_M2
+      s.ctrl.vc_resp_en_M2   //= lambda: s.vc_refill_M2 & ~s.ostall_M2
+      s.ctrl.vc_remove_en_M2 //= lambda: ~s.ostall_M2 & ( s.vc_refill_M2 |
+        ( ~s.is_evict_M2.out & ( (s.trans_M2.out == TRANS_TYPE_AMO_REQ) |
+                                 (s.trans_M2.out == TRANS_TYPE_INIT_REQ) ) ) )
+      s.ctrl.vc_clear_M2     //= lambda: s.trans_M2.out == TRANS_TYPE_INV_START
+
+      @update
+      def vc_resp_val_logic():
+        s.vc_resp_val.in_ @= s.vc_resp_val.out
+        if s.vc_inject_Y:
+          s.vc_resp_val.in_ @= 0
+        if s.ctrl.vc_resp_en_M2:
+          s.vc_resp_val.in_ @= 1
+    else:
+      s.vc_refill_M2         //= n
+      s.vc_stall_M2          //= n
+      s.ctrl.vc_ins_en_M2    //= n
+      s.ctrl.vc_resp_en_M2   //= n
+      s.ctrl.vc_remove_en_M2 //= n
+      s.ctrl.vc_clear_M2     //= n
+
+    #---------------------------------------------------------------------
+    # Prefetcher
+    #---------------------------------------------------------------------
+    # Demand reads/writes train the prefetcher as they leave M2, secondary
+    # misses once they are retried. A miss that takes over a prefetch
+    # trains at once, as a hit on the prefetched line. A prefetch that
+    # misses is recorded as it goes out; one that hits or merges into a
+    # miss is just dropped. INV makes the prefetcher forget the prefetched
+    # lines
+
+    if p.prefetch_entries:
+      s.ctrl.pf_train_M2  //= lambda: ( ~s.ostall_M2 & ~s.is_evict_M2.out &
+        ( ~s.is_secondary_M2.out | s.is_promote_M2.out ) & ~s.status.prefetch_M2 &
+        ( (s.trans_M2.out == TRANS_TYPE_READ_REQ) |
+          (s.trans_M2.out == TRANS_TYPE_WRITE_REQ) ) )
+      s.ctrl.pf_hit_M2    //= lambda: s.ctrl.hit_M2[0] | s.is_promote_M2.out
+      s.ctrl.pf_record_M2 //= lambda: ( ~s.ostall_M2 & ~s.is_evict_M2.out &
+        ~s.is_secondary_M2.out & s.status.prefetch_M2 & ~s.ctrl.hit_M2[0] &
+        (s.trans_M2.out == TRANS_TYPE_READ_REQ) )
+      s.ctrl.pf_clear_M2  //= lambda: s.trans_M2.out == TRANS_TYPE_INV_START
+    else:
+      s.ctrl.pf_train_M2  //= n
+      s.ctrl.pf_hit_M2    //= n
+      s.ctrl.pf_record_M2 //= n
+      s.ctrl.pf_clear_M2  //= n
+
     #---------------------------------------------------------------------
     # M2 control signal table
     #---------------------------------------------------------------------
@@ -699,6 +1039,8 @@ class BlockingCacheCtrlRTL( Component ):
     def cs_table_M2():
       flush = s.has_flush_sent_M2.out
       fl_sel = b1(0) if flush else b1(1)
+      # A prefetch never sends a cacheresp, so it does not wait for one
+      pf = s.status.prefetch_M2
       #                                                                dsize_en|rdata_mux|ostall|memreq_type|memreq|cacheresp
       s.cs2                                                 @= concat( n,       b1(1),    n,     READ,       n,     n        )
       if   s.trans_M2.out == TRANS_TYPE_INVALID:      s.cs2 @= concat( n,       b1(1),    n,     READ,       n,     n        )
@@ -709,7 +1051,14 @@ class BlockingCacheCtrlRTL( Component ):
       elif s.trans_M2.out == TRANS_TYPE_FLUSH_START:  s.cs2 @= concat( n,       b1(1),    n,     READ,       n,     n        )
       elif s.trans_M2.out == TRANS_TYPE_FLUSH_WAIT:   s.cs2 @= concat( n,       b1(1),    n,     READ,       n,     n        )
       elif s.trans_M2.out == TRANS_TYPE_FLUSH_WRITE:  s.cs2 @= concat( n,       b1(1),    n,     READ,       n,     n        )
-      elif ~s.memreq_rdy|~s.cacheresp_rdy:            s.cs2 @= concat( n,       b1(1),    y,     READ,       n,     n        )
+      elif s.is_secondary_M2.out:                     s.cs2 @= concat( n,       b1(1),    n,     READ,       n,     n        )
+      elif s.wbb_evict_M2 & s.status.wbb_full:        s.cs2 @= concat( n,       b1(0),    y,     WRITE,      n,     n        )
+      elif s.wbb_evict_M2:                            s.cs2 @= concat( n,       b1(0),    n,     WRITE,      n,     n        )
+      elif s.is_evict_M2.out & ~s.evict_wb_M2:        s.cs2 @= concat( n,       b1(0),    n,     READ,       n,     n        )
+      elif s.vc_stall_M2:                             s.cs2 @= concat( n,       b1(1),    y,     READ,       n,     n        )
+      elif s.vc_refill_M2:                            s.cs2 @= concat( n,       b1(1),    n,     READ,       n,     n        )
+      elif s.wbb_conflict_M2:                         s.cs2 @= concat( n,       b1(1),    y,     READ,       n,     n        )
+      elif ~s.memreq_rdy|~s.cacheresp_rdy & ~pf:      s.cs2 @= concat( n,       b1(1),    y,     READ,       n,     n        )
       elif s.trans_M2.out == TRANS_TYPE_FLUSH_READ:   s.cs2 @= concat( n,      fl_sel,    n,     WRITE,      flush, n        )
       elif s.is_evict_M2.out:                         s.cs2 @= concat( n,       b1(0),    n,     WRITE,      y,     n        )
       elif s.trans_M2.out == TRANS_TYPE_REPLAY_READ:  s.cs2 @= concat( y,       b1(0),    n,     READ,       n,     y        )
@@ -733,8 +1082,8 @@ class BlockingCacheCtrlRTL( Component ):
         s.ctrl.memreq_type        @= s.status.cachereq_type_M2
       else:
         s.ctrl.memreq_type        @= s.cs2[ CS_memreq_type          ]
-      s.cacheresp_en              @= s.cs2[ CS_cacheresp_en         ]
-      s.memreq_en                 @= s.cs2[ CS_memreq_en            ]
+      s.cacheresp_en              @= s.cs2[ CS_cacheresp_en         ] & ~s.status.prefetch_M2
+      s.memreq_en_M2              @= s.cs2[ CS_memreq_en            ]
 
     # dpath pipeline reg en; will only en if we have a stall in M2 and if
     # we are not initing the cache since that is entirely internal
@@ -755,6 +1104,63 @@ class BlockingCacheCtrlRTL( Component ):
 
     s.ctrl.hit_M2[1] //= 0 # hit output expects 2 bits but we only use one bit
 
+    #=====================================================================
+    # Performance counters
+    #=====================================================================
+    # Accesses are counted when they leave M2; an evicting access goes
+    # through M2 twice, once for the writeback
+
+    if p.perf_counters:
+      s.perf_event = Wire(PERF_NCOUNTERS)
+
+      @update
+      def perf_event_logic():
+        s.perf_event @= 0
+        if ( ~s.ostall_M2 & ~s.is_evict_M2.out & ~s.status.prefetch_M2 &
+             ( (s.trans_M2.out == TRANS_TYPE_READ_REQ) |
+               (s.trans_M2.out == TRANS_TYPE_WRITE_REQ) ) ):
+          if s.ctrl.hit_M2[0] | s.is_promote_M2.out:
+            s.perf_event[PERF_HITS] @= 1
+          elif ~s.is_secondary_M2.out:
+            s.perf_event[PERF_MISSES] @= 1
+        if ( (s.memreq_en_M2 & (s.ctrl.memreq_type == WRITE)) |
+             s.ctrl.wbb_deq_en_M2 ):
+          s.perf_event[PERF_WRITEBACKS] @= 1
+        if ( (s.memreq_en_M2 | s.ctrl.wbb_enq_en_M2) & s.is_evict_M2.out &
+             ( (s.trans_M2.out == TRANS_TYPE_READ_REQ) |
+               (s.trans_M2.out == TRANS_TYPE_WRITE_REQ) ) ):
+          s.perf_event[PERF_EVICTIONS] @= 1
+        if ( s.memreq_en_M2 & ~s.is_evict_M2.out &
+             (s.trans_M2.out == TRANS_TYPE_AMO_REQ) ):
+          s.perf_event[PERF_AMOS] @= 1
+        s.perf_event[PERF_STALL_M1]  @= s.ostall_M1
+        s.perf_event[PERF_STALL_M2]  @= s.ostall_M2
+        s.perf_event[PERF_MSHR_FULL] @= s.status.MSHR_full
+        s.perf_event[PERF_INV_CYCLES] @= s.FSM_state_M0.out == M0_FSM_STATE_INV
+        s.perf_event[PERF_FLUSH_CYCLES] @= (
+          (s.FSM_state_M0.out == M0_FSM_STATE_FLUSH) |
+          (s.FSM_state_M0.out == M0_FSM_STATE_FLUSH_WAIT) )
+        s.perf_event[PERF_VICTIM_HITS] @= s.ctrl.vc_resp_en_M2
+        s.perf_event[PERF_PREFETCHES]  @= s.ctrl.pf_record_M2
+        s.perf_event[PERF_PF_USEFUL]   @= s.status.pf_useful_M2
+        s.perf_event[PERF_PF_USELESS]  @= s.status.pf_useless_M2
+
+      s.perf_counter = [ CounterEnRst(PERF_COUNTER_NBITS)
+                         for _ in range(PERF_NCOUNTERS) ]
+      s.perf_mux = Mux(mk_bits(PERF_COUNTER_NBITS), 2**PERF_SEL_NBITS)
+      s.perf_mux.sel //= s.perf_sel
+      s.perf_mux.out //= s.perf_count
+      for i in range(2**PERF_SEL_NBITS):
+        if i < PERF_NCOUNTERS:
+          m = s.perf_counter[i]
+          m.en         //= s.perf_event[i]
+          m.load       //= s.perf_clear
+          m.count_down //= 0
+          m.load_value //= 0
+          m.out        //= s.perf_mux.in_[i]
+        else:
+          s.perf_mux.in_[i] //= 0
+
   #=======================================================================
   # line_trace
   #=======================================================================
@@ -783,6 +1189,7 @@ class BlockingCacheCtrlRTL( Component ):
     elif s.trans_M0 == TRANS_TYPE_CLEAN_HIT:    msg_M0 += " wc"
     elif s.trans_M0 == TRANS_TYPE_REPLAY_READ:  msg_M0 += "rpr"
     elif s.trans_M0 == TRANS_TYPE_REPLAY_WRITE: msg_M0 += "rpw"
+    elif s.pf_issue_M0:                         msg_M0 += " pf"
     elif s.trans_M0 == TRANS_TYPE_READ_REQ:     msg_M0 += " rd"
     elif s.trans_M0 == TRANS_TYPE_WRITE_REQ:    msg_M0 += " wr"
     elif s.trans_M0 == TRANS_TYPE_INIT_REQ:     msg_M0 += " in"
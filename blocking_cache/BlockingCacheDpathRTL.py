@@ -10,6 +10,7 @@ Date   : 20 February 2020
 
 from pymtl3                         import *
 from pymtl3.stdlib.basic_rtl        import Mux, RegisterFile, RegEnRst, RegEn
+from pymtl3.stdlib.queues           import BypassQueueRTL
 
 # Import generic constants used in the repo
 from constants  import *
@@ -43,8 +44,38 @@ class BlockingCacheDpathRTL( Component ):
 
     # Pipeline Registers
     s.pipeline_reg_M0 = m = RegEnRst(p.MemRespType, p.MemRespType())
-    m.in_ //= s.memresp_Y
-    m.en  //= s.ctrl.reg_en_M0
+    m.en  //= s.ctrl.memresp_reg_en_M0
+
+    # A refill from the victim cache comes in as a memresp of its own in a
+    # cycle without one from memory
+    if p.victim_lines:
+      s.vc_resp_Y = Wire(p.MemRespType)
+      s.memresp_mux_Y = m = Mux(p.MemRespType, 2)
+      m.in_[0] //= s.memresp_Y
+      m.in_[1] //= s.vc_resp_Y
+      m.sel    //= s.ctrl.vc_resp_sel_Y
+      memresp = m.out
+    else:
+      memresp = s.memresp_Y
+
+    if p.nonblocking:
+      # Refills wait here when M0 is busy so that memory never waits on the
+      # pipeline; there is at most one refill per MSHR entry in flight
+      s.memresp_q_Y = m = BypassQueueRTL(p.MemRespType, p.mshr_entries)
+      m.enq.msg //= memresp
+      m.enq.en  //= s.ctrl.memresp_q_enq_en_Y
+      m.deq.en  //= s.ctrl.memresp_q_deq_en_Y
+      s.pipeline_reg_M0.in_ //= m.deq.ret
+      s.status.memresp_q_enq_rdy //= m.enq.rdy
+      s.status.memresp_q_deq_rdy //= m.deq.rdy
+    else:
+      s.pipeline_reg_M0.in_ //= memresp
+      s.status.memresp_q_enq_rdy //= 0
+      s.status.memresp_q_deq_rdy //= 0
+
+    # Writeback acks are dropped in Y
+    s.status.memresp_type_Y //= s.memresp_Y.type_
+    s.status.cachereq_type_Y //= s.cachereq_Y.type_
 
     # Forward declaration: output from MSHR
     s.MSHR_dealloc_out = Wire(p.MSHRMsg)
@@ -56,15 +87,42 @@ class BlockingCacheDpathRTL( Component ):
       s.MSHR_dealloc_out.data)
     s.status.amo_hit_M0 //= s.MSHR_dealloc_out.amo_hit
 
+    # A prefetch is a read of the line from the prefetcher that takes M0
+    # when M0 is free
+    s.pf_addr_M0 = Wire(p.bitwidth_addr)
+    if p.prefetch_entries:
+      s.pf_req_M0 = Wire(p.CacheReqType)
+      s.pf_req_M0.type_  //= READ
+      s.pf_req_M0.opaque //= 0
+      s.pf_req_M0.addr   //= s.pf_addr_M0
+      s.pf_req_M0.len    //= 0
+      s.pf_req_M0.data   //= 0
+
+      s.cachereq_pf_mux_M0 = m = Mux(p.CacheReqType, 2)
+      m.in_[0] //= s.cachereq_Y
+      m.in_[1] //= s.pf_req_M0
+      m.sel    //= s.ctrl.pf_issue_M0
+      cachereq = m.out
+    else:
+      s.pf_addr_M0 //= 0
+      cachereq = s.cachereq_Y
+
     # Chooses the cache request from proc or MSHR (memresp)
     s.cachereq_memresp_mux_M0 = m = Mux(p.CacheReqType, 2)
-    m.in_[0] //= s.cachereq_Y
+    m.in_[0] //= cachereq
     m.in_[1] //= s.MSHR_dealloc_mux_in_M0
     m.sel    //= s.ctrl.cachereq_memresp_mux_sel_M0
 
     s.cachereq_M0 = Wire(p.PipelineMsg)
     s.cachereq_M0.type_  //= s.cachereq_memresp_mux_M0.out.type_
     s.cachereq_M0.opaque //= s.cachereq_memresp_mux_M0.out.opaque
+    # Prefetches carry a flag through the pipeline and the MSHR so that
+    # they never send a cacheresp
+    if p.prefetch_entries:
+      s.cachereq_M0.prefetch //= lambda: ( s.MSHR_dealloc_out.prefetch
+        if s.ctrl.cachereq_memresp_mux_sel_M0 else s.ctrl.pf_issue_M0 )
+    else:
+      s.cachereq_M0.prefetch //= 0
 
     # Chooses addr bypassed from L1 as a result of write hit clean
     s.cachereq_addr_M1_forward = Wire(p.bitwidth_addr)
@@ -179,7 +237,8 @@ class BlockingCacheDpathRTL( Component ):
     m.wen   //= s.ctrl.ctrl_bit_rep_en_M1
 
     # Tag arrays instantiations
-    s.tag_arrays_M1 = [ SramPRTL( p.bitwidth_tag_array, p.nblocks_per_way )
+    s.tag_arrays_M1 = [ SramPRTL( p.bitwidth_tag_array, p.nblocks_per_way,
+                                  p.sparse_sram )
                         for _ in range(p.associativity) ]
     for i, m in enumerate(s.tag_arrays_M1):
       m.port0_val   //= s.ctrl.tag_array_val_M0[i]
@@ -188,6 +247,25 @@ class BlockingCacheDpathRTL( Component ):
       m.port0_wdata //= s.tag_array_wdata_M0
       m.port0_wben  //= s.ctrl.tag_array_wben_M0
 
+    # Dirty-line summary so a flush can skip clean lines. It snoops the tag
+    # array writes that update the dirty bits.
+    if p.dirty_line_index:
+      dty_wben = slice( p.bitwidth_tag, p.bitwidth_tag + p.bitwidth_dirty )
+      s.dirty_line_index_M0 = m = DirtyLineIndex(p)
+      m.widx       //= s.tag_array_idx_mux_M0.out
+      m.wdty       //= lambda: reduce_or( s.tag_array_struct_M0.dty )
+      m.search_ptr //= s.ctrl.flush_ptr_M0
+      m.next_ptr   //= s.status.flush_next_dirty_M0
+
+      @update
+      def dirty_line_index_wen_M0():
+        s.dirty_line_index_M0.wen @= 0
+        if ( ( s.ctrl.tag_array_type_M0 == wr ) &
+             ( s.ctrl.tag_array_wben_M0[ dty_wben ] != 0 ) ):
+          s.dirty_line_index_M0.wen @= s.ctrl.tag_array_val_M0
+    else:
+      s.status.flush_next_dirty_M0 //= 0
+
     # Saves output of the SRAM during stall
     s.tag_array_rdata_M1 = [ StallEngine(p.StructTagArray) for _ in range(p.associativity) ]
     for i, m in enumerate(s.tag_array_rdata_M1):
@@ -207,17 +285,71 @@ class BlockingCacheDpathRTL( Component ):
     s.MSHR_alloc_in.amo_hit //= s.MSHR_alloc_in_amo_hit_bypass.hit
     s.write_mask_M1 = Wire(p.bitwidth_dirty)
     s.MSHR_alloc_in.dirty_bits //= lambda: (s.write_mask_M1 & s.ctrl.dirty_evict_mask_M1)
-
-    # s.MSHR_alloc_id = Wire( p.BitsOpaque )
-    s.mshr = m = MSHR(p, 1)
-    m.alloc_en    //= s.ctrl.MSHR_alloc_en
-    m.alloc_in    //= s.MSHR_alloc_in
-    # m.alloc_id    //= s.MSHR_alloc_id # don't need for now; only required for nonblocking cache
-    m.full        //= s.status.MSHR_full
-    m.empty       //= s.status.MSHR_empty
-    m.dealloc_id  //= s.pipeline_reg_M0.out.opaque
-    m.dealloc_en  //= s.ctrl.MSHR_dealloc_en
-    m.dealloc_out //= s.MSHR_dealloc_out
+    s.MSHR_alloc_in.prefetch   //= s.cachereq_M1.out.prefetch
+
+    s.MSHR_alloc_id = Wire( p.BitsOpaque )
+    s.mshr = m = MSHR(p, p.mshr_entries)
+    m.alloc_en        //= s.ctrl.MSHR_alloc_en
+    m.alloc_in        //= s.MSHR_alloc_in
+    m.alloc_secondary //= s.ctrl.MSHR_alloc_secondary
+    m.alloc_parked    //= s.ctrl.MSHR_alloc_parked
+    m.alloc_promote   //= s.ctrl.MSHR_alloc_promote
+    m.alloc_id        //= s.MSHR_alloc_id
+    m.full            //= s.status.MSHR_full
+    m.empty           //= s.status.MSHR_empty
+    m.dealloc_en      //= s.ctrl.MSHR_dealloc_en
+    m.dealloc_out     //= s.MSHR_dealloc_out
+    m.pending_addr    //= s.MSHR_alloc_in.addr
+    m.pending         //= s.status.MSHR_pending_M1
+    m.pending_prefetch //= s.status.MSHR_pending_pf_M1
+    m.refill_full     //= s.status.MSHR_refill_full_M1
+    m.conflict_addr   //= s.cachereq_Y.addr
+    m.prefetch_addr   //= s.pf_addr_M0
+    m.retry_val       //= s.status.MSHR_retry_val
+
+    if p.nonblocking:
+      # The entry to deallocate comes from the memresp opaque on a refill,
+      # from the refill that started the replay, or from the secondary miss
+      # being retried. INV/FLUSH run on a drained MSHR, so they are entry 0.
+      s.MSHR_replay_id_M0 = Wire( p.BitsOpaque )
+      s.MSHR_dealloc_id_mux_M0 = m = Mux(p.bitwidth_opaque, 4)
+      m.in_[0] //= s.pipeline_reg_M0.out.opaque
+      m.in_[1] //= s.MSHR_replay_id_M0
+      m.in_[2] //= s.mshr.retry_id
+      m.in_[3] //= 0
+      m.sel    //= s.ctrl.MSHR_dealloc_id_sel_M0
+      m.out    //= s.mshr.dealloc_id
+
+      s.MSHR_replay_id_reg_M0 = m = RegEnRst(p.bitwidth_opaque)
+      m.in_ //= s.MSHR_dealloc_id_mux_M0.out
+      m.en  //= s.ctrl.MSHR_replay_id_en_M0
+      m.out //= s.MSHR_replay_id_M0
+
+      # A request to a set with a miss to another line in flight has to
+      # wait, including the miss being allocated in M1 right now
+      idx_bits = slice( p.bitwidth_offset, p.bitwidth_offset + p.bitwidth_index )
+      tag_bits = slice( p.bitwidth_offset + p.bitwidth_index, p.bitwidth_addr )
+
+      @update
+      def MSHR_conflict_M0_logic():
+        s.status.MSHR_conflict_M0 @= s.mshr.conflict
+        if ( s.ctrl.MSHR_alloc_en &
+             ( s.cachereq_Y.addr[ idx_bits ] == s.cachereq_M1.out.addr.index ) &
+             ( s.cachereq_Y.addr[ tag_bits ] != s.cachereq_M1.out.addr.tag ) ):
+          s.status.MSHR_conflict_M0 @= 1
+
+      # A prefetch waits for all the misses to its set, so it never
+      # conflicts with one
+      @update
+      def pf_busy_M0_logic():
+        s.status.pf_busy_M0 @= s.mshr.prefetch_busy
+        if ( s.ctrl.MSHR_alloc_en &
+             ( s.pf_addr_M0[ idx_bits ] == s.cachereq_M1.out.addr.index ) ):
+          s.status.pf_busy_M0 @= 1
+    else:
+      s.mshr.dealloc_id         //= s.pipeline_reg_M0.out.opaque
+      s.status.MSHR_conflict_M0 //= s.mshr.conflict
+      s.status.pf_busy_M0       //= s.mshr.prefetch_busy
 
     # Combined comparator set for both dirty line detection and hit detection
     # It has an enable to so it doesn't always look at the output of the sram
@@ -240,6 +372,15 @@ class BlockingCacheDpathRTL( Component ):
       # Bypass the current tag-array entries to M0
       s.tag_entries_M1_bypass[i] //= m.tag_entires[i]
 
+    # Valid bits of the ways, for evicting clean lines into the victim cache
+    if p.victim_lines:
+      @update
+      def ctrl_bit_val_rd_M1_logic():
+        for i in range(p.associativity):
+          s.status.ctrl_bit_val_rd_M1[i] @= s.tag_array_PU.tag_entires[i].val
+    else:
+      s.status.ctrl_bit_val_rd_M1 //= 0
+
     s.hit_way_M1_bypass //= s.tag_array_PU.hit_way
     s.write_mask_M1 //= lambda: s.tag_array_PU.tag_entires[s.ctrl.way_offset_M1].dty
 
@@ -293,6 +434,7 @@ class BlockingCacheDpathRTL( Component ):
     s.cachereq_M1_2.data   //= s.cachereq_M1.out.data
     s.cachereq_M1_2.type_  //= s.cachereq_M1.out.type_
     s.cachereq_M1_2.opaque //= s.cachereq_M1.out.opaque
+    s.cachereq_M1_2.prefetch //= s.cachereq_M1.out.prefetch
 
     # Send the M1 status signals to control
     s.status.ctrl_bit_rep_rd_M1 //= s.replacement_bits_M1.rdata
@@ -314,7 +456,8 @@ class BlockingCacheDpathRTL( Component ):
     m.in_ //= s.write_mask_M1
     m.en  //= s.ctrl.reg_en_M2
 
-    s.data_array_M2 = m = SramPRTL(p.bitwidth_cacheline, p.total_num_cachelines)
+    s.data_array_M2 = m = SramPRTL(p.bitwidth_cacheline, p.total_num_cachelines,
+                                   p.sparse_sram)
     m.port0_val   //= s.ctrl.data_array_val_M1
     m.port0_type  //= s.ctrl.data_array_type_M1
     m.port0_idx   //= s.index_offset_M1.out
@@ -346,6 +489,7 @@ class BlockingCacheDpathRTL( Component ):
 
     # Send the M2 status signals to control
     s.status.cachereq_type_M2 //= s.cachereq_M2.out.type_
+    s.status.prefetch_M2      //= s.cachereq_M2.out.prefetch
 
     # Construct the memreq signal
     # build a addr struct to zip the addr, idx, and tag together
@@ -359,12 +503,97 @@ class BlockingCacheDpathRTL( Component ):
     def memreq_addr_bits_to_bitstruct():
       s.memreq_addr_bits @= s.memreq_addr_out
 
-    s.memreq_M2.type_   //= s.ctrl.memreq_type
-    s.memreq_M2.opaque  //= s.cachereq_M2.out.opaque
-    s.memreq_M2.addr    //= s.memreq_addr_bits
-    s.memreq_M2.len     //= s.mem_req_off_len_M2.len_o
-    s.memreq_M2.wr_mask //= s.write_mask_M2.out
-    s.memreq_M2.data    //= s.read_data_mux_M2.out
+    # With a write-back buffer the memreq of M2 goes out or into the
+    # buffer, and the buffer takes the memory interface when M2 does not
+    if p.wb_buffer_entries:
+      s.memreq_pipe_M2 = Wire(p.MemReqType)
+      memreq = s.memreq_pipe_M2
+    else:
+      memreq = s.memreq_M2
+
+    memreq.type_   //= s.ctrl.memreq_type
+    if p.nonblocking:
+      # Send the MSHR id so the memresp finds its entry
+      s.MSHR_id_M2 = m = RegEnRst(p.bitwidth_opaque)
+      m.in_ //= s.MSHR_alloc_id
+      m.en  //= s.ctrl.reg_en_M2
+      memreq.opaque //= s.MSHR_id_M2.out
+    else:
+      memreq.opaque //= s.cachereq_M2.out.opaque
+    memreq.addr    //= s.memreq_addr_bits
+    memreq.len     //= s.mem_req_off_len_M2.len_o
+    memreq.wr_mask //= s.write_mask_M2.out
+    memreq.data    //= s.read_data_mux_M2.out
+
+    if p.wb_buffer_entries:
+      s.wb_buffer = m = WriteBackBuffer(p, p.wb_buffer_entries)
+      m.enq_en      //= s.ctrl.wbb_enq_en_M2
+      m.enq_msg     //= s.memreq_pipe_M2
+      m.deq_en      //= s.ctrl.wbb_deq_en_M2
+      m.search_addr //= s.memreq_addr_bits
+      s.status.wbb_full   //= m.full
+      s.status.wbb_empty  //= m.empty
+      s.status.wbb_hit_M2 //= m.search_hit
+
+      s.memreq_mux_M2 = m = Mux(p.MemReqType, 2)
+      m.in_[0] //= s.memreq_pipe_M2
+      m.in_[1] //= s.wb_buffer.deq_msg
+      m.sel    //= s.ctrl.wbb_deq_en_M2
+      m.out    //= s.memreq_M2
+    else:
+      s.status.wbb_full   //= 0
+      s.status.wbb_empty  //= 1
+      s.status.wbb_hit_M2 //= 0
+
+    # Evicted lines go into the victim cache, which is looked up with the
+    # address of the refill. On a hit the line comes back as a memresp
+    # with the opaque of the memreq it replaces
+    if p.victim_lines:
+      s.vc_keep_addr_M1 = Wire(p.bitwidth_addr)
+      @update
+      def vc_keep_addr_M1_bits_to_bitstruct():
+        s.vc_keep_addr_M1 @= s.cachereq_M1.out.addr
+
+      s.victim_cache = m = VictimCache(p, p.victim_lines)
+      m.ins_en      //= s.ctrl.vc_ins_en_M2
+      m.ins_addr    //= s.memreq_addr_bits
+      m.ins_data    //= s.stall_engine_M2.out
+      m.keep_addr   //= s.vc_keep_addr_M1
+      m.lookup_addr //= s.memreq_addr_bits
+      m.lookup_hit  //= s.status.vc_hit_M2
+      m.remove_en   //= s.ctrl.vc_remove_en_M2
+      m.clear       //= s.ctrl.vc_clear_M2
+
+      s.vc_resp_reg_M2 = m = RegEn(p.MemRespType)
+      m.in_.type_   //= READ
+      m.in_.opaque  //= memreq.opaque
+      m.in_.test    //= 0
+      m.in_.len     //= 0
+      m.in_.wr_mask //= 0
+      m.in_.data    //= s.victim_cache.lookup_data
+      m.en          //= s.ctrl.vc_resp_en_M2
+      m.out         //= s.vc_resp_Y
+    else:
+      s.status.vc_hit_M2 //= 0
+
+    # The prefetcher trains on the line of the accesses in M2 and records
+    # the line of the prefetches going out
+    if p.prefetch_entries:
+      s.prefetcher = m = Prefetcher(p, p.prefetch_entries)
+      m.access_addr //= s.memreq_addr_bits
+      m.train_en    //= s.ctrl.pf_train_M2
+      m.train_hit   //= s.ctrl.pf_hit_M2
+      m.record_en   //= s.ctrl.pf_record_M2
+      m.clear       //= s.ctrl.pf_clear_M2
+      m.issue_val   //= s.status.pf_val_M0
+      m.issue_addr  //= s.pf_addr_M0
+      m.issue_en    //= s.ctrl.pf_issue_M0
+      m.useful      //= s.status.pf_useful_M2
+      m.useless     //= s.status.pf_useless_M2
+    else:
+      s.status.pf_val_M0     //= 0
+      s.status.pf_useful_M2  //= 0
+      s.status.pf_useless_M2 //= 0
 
     # Construct the cacheresp signal
     s.cacheresp_M2.type_  //= s.cachereq_M2.out.type_
@@ -10,7 +10,9 @@ Author: Eric Tang (et396), Xiaoyu Yan (xy97)
 Date:   23 December 2019
 """
 
+import itertools
 import math
+from array import array
 
 from pymtl3 import *
 
@@ -61,13 +63,18 @@ def resp( CacheRespType, type_, opaque, test, len, data ):
 # Define AMO functions
 #-------------------------------------------------------------------------
 
-AMO_FUNS = { MemMsgType.AMO_ADD  : lambda m,a : m+a,
+# Operands and results are 32-bit words as unsigned ints
+
+def sext32( x ):
+  return x - ( 1 << 32 ) if x >> 31 else x
+
+AMO_FUNS = { MemMsgType.AMO_ADD  : lambda m,a : (m+a) & 0xffffffff,
              MemMsgType.AMO_AND  : lambda m,a : m&a,
              MemMsgType.AMO_OR   : lambda m,a : m|a,
              MemMsgType.AMO_SWAP : lambda m,a : a,
-             MemMsgType.AMO_MIN  : lambda m,a : m if m.int() < a.int() else a,
+             MemMsgType.AMO_MIN  : lambda m,a : m if sext32(m) < sext32(a) else a,
              MemMsgType.AMO_MINU : min,
-             MemMsgType.AMO_MAX  : lambda m,a : m if m.int() > a.int() else a,
+             MemMsgType.AMO_MAX  : lambda m,a : m if sext32(m) > sext32(a) else a,
              MemMsgType.AMO_MAXU : max,
              MemMsgType.AMO_XOR  : lambda m,a : m^a,
            }
@@ -82,9 +89,10 @@ AMO_FUNS = { MemMsgType.AMO_ADD  : lambda m,a : m+a,
 # in an FL model
 
 class HitMissTracker:
-  def __init__(self, size, nways, nbanks, linesize):
+  def __init__(self, size, nways, nbanks, linesize, policy='lru', victim_lines=0):
     # Compute various sizes
     self.nways = nways
+    self.policy = policy
     self.linesize = linesize
     self.nlines = int(size // linesize)
     self.nsets = int(self.nlines // self.nways)
@@ -102,59 +110,161 @@ class HitMissTracker:
     self.idx_end = self.idx_start + int(math.log(self.nsets, 2))
     self.tag_start = self.idx_end
     self.tag_end = 32
+    self.offset_mask = (1 << (self.offset_end - self.offset_start)) - 1
+    self.idx_mask = (1 << (self.idx_end - self.idx_start)) - 1
+    self.tag_mask = (1 << (self.tag_end - self.tag_start)) - 1
 
-    # Initialize the tag and valid array
-    # Both arrays are of the form line[idx][way]
-    # Note that line[idx] is a one-element array for a direct-mapped cache
-    self.line = []
-    self.valid = []
-    for n in range(self.nlines):
-      self.line.insert(n, [Bits(32, 0) for x in range(nways)])
-      self.valid.insert(n, [False for x in range(nways)])
+    # Initialize the tag array and the valid bitmap, one entry per set.
+    # The tag of way w in set idx is line[idx*nways + w] and it is valid
+    # if bit w of valid[idx] is set
+    self.line = array('Q', [0]) * (self.nsets * nways)
+    self.valid = array('Q', [0]) * self.nsets
 
     # Initialize the LRU array
-    # Implemented as an array for each set index
-    # lru[idx][0] is the most recently used
-    # lru[idx][-1] is the least recently used
-    self.lru = []
-    for n in range(self.nsets):
-      self.lru.insert(n, [x for x in range(nways)])
+    # Implemented as a use stamp for each way, the least recently used way
+    # has the smallest stamp. Way 0 starts as the least recently used like
+    # the RTL after reset
+    self.lru = array('q', list(range(nways)) * self.nsets)
+    self.lru_newest = nways
+    self.lru_oldest = 0
+
+    # Tree PLRU bits per set, in the same heap order as the RTL: bit n of
+    # plru[idx] is node n, which has children 2n+1 and 2n+2 and points to
+    # the child with the victim
+    self.plru = array('Q', [0]) * self.nsets
+
+    # FIFO pointer per set to the next way to fill
+    self.fifo = array('L', [0]) * self.nsets
+
+    # Dirty-line index: the idx*nways + way slots that hold dirty data.
+    # Flush only needs to visit these instead of walking every line
+    self.dirty = set()
+
+    # Victim cache: the (tag, idx) of the line in each entry or None, the
+    # oldest entry and the misses refilled from it. Like the RTL it holds
+    # the valid lines evicted by refills
+    self.victim = [None] * victim_lines
+    self.victim_ptr = 0
+    self.victim_hits = 0
 
   # Generate the components of an address
   # Ignores the bank bits, since they don't affect the behavior
   # (and may not even exist)
   def split_address(self, addr):
-    addr = Bits(32, addr)
-    offset = addr[self.offset_start:self.offset_end]
-    idx = addr[self.idx_start:self.idx_end]
-    tag = addr[self.tag_start:self.tag_end]
+    addr = int(addr)
+    offset = (addr >> self.offset_start) & self.offset_mask
+    idx = (addr >> self.idx_start) & self.idx_mask
+    tag = (addr >> self.tag_start) & self.tag_mask
     return (tag, idx, offset)
 
-  # Update the LRU status, given that a hit just occurred
-  def lru_hit(self, idx, way):
-    self.lru[idx].remove(way)
-    self.lru[idx].insert(0, way)
+  # Returns the valid way of the set holding tag, or -1
+  def find_way(self, tag, idx):
+    base = idx * self.nways
+    valid = self.valid[idx]
+    for way in range(self.nways):
+      if valid >> way & 1 and self.line[base + way] == tag:
+        return way
+    return -1
+
+  # Update the replacement state, given that a hit just occurred. fill is
+  # set when the way was just refilled as the victim
+  def lru_hit(self, idx, way, fill=False):
+    if self.policy == 'plru':
+      self.plru_point(idx, way, away=True)
+    elif self.policy == 'fifo':
+      if fill:
+        self.fifo[idx] = (self.fifo[idx] + 1) % self.nways
+    else:
+      self.lru[idx * self.nways + way] = self.lru_newest
+      self.lru_newest += 1
 
-  # Get the least recently used way for an index
-  # The LRU is always the last element in the list
+  # Get the way to replace for an index
+  # For LRU it is the way with the oldest stamp
   def lru_get(self, idx):
-    return self.lru[idx][-1]
+    if self.policy == 'plru':
+      bits = self.plru[idx]
+      node = 0
+      while node < self.nways - 1:
+        node = 2 * node + 1 + (bits >> node & 1)
+      return node - (self.nways - 1)
+    elif self.policy == 'fifo':
+      return self.fifo[idx]
+    base = idx * self.nways
+    stamps = self.lru[base : base + self.nways]
+    return stamps.index(min(stamps))
+
+  # Point the tree nodes on the path to way away from it or towards it
+  def plru_point(self, idx, way, away):
+    bits = self.plru[idx]
+    node = way + self.nways - 1
+    while node > 0:
+      parent = (node - 1) // 2
+      right = node == 2 * parent + 2
+      if right != away:
+        bits |= 1 << parent
+      else:
+        bits &= ~(1 << parent)
+      node = parent
+    self.plru[idx] = bits
 
   # Perform a tag check, and update lru if a hit occurs
   def tag_check(self, tag, idx):
-    for way in range(self.nways):
-      if self.valid[idx][way] and self.line[idx][way] == tag:
-        # Whenever tag check hits, update the set's lru array
-        self.lru_hit(idx, way)
-        return True
-    return False
+    way = self.find_way(tag, idx)
+    if way < 0:
+      return False
+    # Whenever tag check hits, update the set's lru array
+    self.lru_hit(idx, way)
+    return True
 
   # Update the tag array due to a value getting fetched from memory
+  # A dirty victim is written back, so it leaves the dirty-line index.
+  # Like the RTL, an invalidated but dirty line with the same tag is
+  # refilled in place instead of the victim and keeps its dirty words
   def refill(self, tag, idx):
+    base = idx * self.nways
+    if self.dirty:
+      for way in range(self.nways):
+        if base + way in self.dirty and self.line[base + way] == tag:
+          self.valid[idx] |= 1 << way
+          self.lru_hit(idx, way)
+          self.victim_lookup(tag, idx)
+          return
     victim = self.lru_get(idx)
-    self.line[idx][victim] = tag
-    self.valid[idx][victim] = True
-    self.lru_hit(idx, victim)
+    if self.victim:
+      if self.valid[idx] >> victim & 1:
+        self.victim_insert((self.line[base + victim], idx), (tag, idx))
+      self.victim_lookup(tag, idx)
+    self.line[base + victim] = tag
+    self.valid[idx] |= 1 << victim
+    self.dirty.discard(base + victim)
+    self.lru_hit(idx, victim, fill=True)
+
+  # Puts an evicted line into the victim cache: into the lowest free entry
+  # or else the oldest one, skipping the entry of keep, the line being
+  # refilled. The RTL does the same
+  def victim_insert(self, line, keep):
+    if None in self.victim:
+      self.victim[self.victim.index(None)] = line
+      return
+    slot = self.victim_ptr
+    if self.victim[slot] == keep:
+      if len(self.victim) == 1:
+        return
+      slot = (slot + 1) % len(self.victim)
+    self.victim[slot] = line
+    self.victim_ptr = (slot + 1) % len(self.victim)
+
+  # Removes the line from the victim cache, returns True if it was there
+  def victim_remove(self, line):
+    if line in self.victim:
+      self.victim[self.victim.index(line)] = None
+      return True
+    return False
+
+  # A refill that finds its line in the victim cache takes it from there
+  def victim_lookup(self, tag, idx):
+    if self.victim_remove((tag, idx)):
+      self.victim_hits += 1
 
   # Simulate accessing an address. Returns True if a hit occurred,
   # False on miss
@@ -165,37 +275,86 @@ class HitMissTracker:
       self.refill(tag, idx)
     return hit
 
+  # Make way the next one to replace. FIFO keeps its fill order
   def lru_set(self, idx, way):
-    self.lru[idx].remove(way)
-    self.lru[idx].append(way)
+    if self.policy == 'plru':
+      self.plru_point(idx, way, away=False)
+    elif self.policy == 'lru':
+      self.lru_oldest -= 1
+      self.lru[idx * self.nways + way] = self.lru_oldest
+
+  # Mark the line holding addr as dirty. Called after the access that
+  # brought the line into the cache
+  def mark_dirty(self, addr):
+    (tag, idx, offset) = self.split_address(addr)
+    way = self.find_way(tag, idx)
+    if way >= 0:
+      self.dirty.add(idx * self.nways + way)
 
+  # The line is written back if dirty and invalidated, valid or not
   def amo_req(self, addr):
     (tag, idx, offset) = self.split_address(addr)
+    base = idx * self.nways
+    self.victim_remove((tag, idx))
+    valid = self.valid[idx]
     for way in range(self.nways):
-      if self.valid[idx][way] and self.line[idx][way] == tag:
-        self.valid[idx][way] = False
+      if ((valid >> way & 1 or base + way in self.dirty) and
+          self.line[base + way] == tag):
+        self.valid[idx] = valid & ~(1 << way)
+        self.dirty.discard(base + way)
         self.lru_set( idx, way )
         break
-  
+
   def invalidate(self):
-    # invalidates all the cachelines
-    for way in range(self.nways):
-      for idx in range(self.nsets):
-        self.valid[idx][way] = False
+    # invalidates all the cachelines. Like the RTL, dirty bits are left
+    # as is so the lines are still written back on eviction or flush. The
+    # victim cache is emptied
+    self.valid = array('Q', [0]) * self.nsets
+    self.victim = [None] * len(self.victim)
+
+  def flush(self):
+    # writes back every dirty line in one step and returns how many there
+    # were
+    ndirty = len(self.dirty)
+    self.dirty.clear()
+    return ndirty
+
+  #-----------------------------------------------------------------------
+  # RTL cycle estimates
+  #-----------------------------------------------------------------------
+  # The RTL walks every line with counter_M0 for INV and FLUSH. These give
+  # the cycles from cachereq to cacheresp the RTL would take, so the FL
+  # model can apply INV/FLUSH in one step and still account for them.
+  # A dirty line adds FLUSH_WAIT for the writeback round trip plus
+  # FLUSH_WRITE on top of its FLUSH_READ.
+
+  def inv_cycles(self):
+    return self.nlines + 3
+
+  def flush_cycles(self, ndirty, latency=1):
+    return self.nlines + 3 + ndirty * (latency + 3)
 
 class ModelCache:
-  def __init__(self, size, nways, nbanks, CacheReqType, CacheRespType, MemReqType, MemRespType, mem=None):
+  def __init__(self, size, nways, nbanks, CacheReqType, CacheRespType, MemReqType, MemRespType, mem=None,
+               latency=1, policy='lru', victim_lines=0):
     # The hit/miss tracker
     self.mem_bitwidth_data = MemReqType.get_field_type("data").nbits
     self.cache_bitwidth_data = CacheReqType.get_field_type("data").nbits
     self.BitsData = mk_bits(self.cache_bitwidth_data)
     size = size*8
-    self.tracker = HitMissTracker(size, nways, nbanks, self.mem_bitwidth_data)
+    # Hits are tracked in request order. Hit-under-miss and nonblocking
+    # caches return responses out of order but keep the accesses to a set
+    # in order, so the hit bits still match; compare those unordered
+    self.tracker = HitMissTracker(size, nways, nbanks, self.mem_bitwidth_data, policy,
+                                  victim_lines)
   
     # The transactions list contains the requests and responses for
     # the stream of read/write calls on this model
     self.transactions = []
     self.opaque = 0
+    # Memory latency and the RTL cycles spent in INV/FLUSH so far
+    self.latency = latency
+    self.inv_flush_cycles = 0
     self.CacheReqType = CacheReqType
     self.CacheRespType = CacheRespType
     self.MemReqType = MemReqType
@@ -209,8 +368,10 @@ class ModelCache:
     self.idx_end = self.idx_start + int(math.log(self.nsets, 2))
     self.tag_start = self.idx_end
     self.tag_end = 32
+    self.offset_mask = (1 << self.offset_end) - 1
     
     # Unpack any initial values of memory into a dict (has easier lookup)
+    # of cacheline address to the line as an int
     #
     # zip is used here to convert the mem array into an array of
     # (addr, value) pairs (which it really should be in the first
@@ -218,12 +379,8 @@ class ModelCache:
     self.mem = {}
     if mem:
       for addr, value in zip(mem[::2], mem[1::2]):
-        offset = int(Bits32(addr)[ self.offset_start : self.offset_end ])
-        addr   = int(Bits32(addr)[ self.offset_end : 32 ])
-        if addr not in self.mem:
-          self.mem[addr] = Bits(self.mem_bitwidth_data, 0)
         # assume word mem declarations
-        self.mem[addr][ offset*8 : (offset+4)*8 ] = value
+        self.store(int(addr), 4, int(value))
 
   def check_hit(self, addr):
     # Tracker returns boolean, need to convert to 1 or 0 to use
@@ -233,82 +390,157 @@ class ModelCache:
     else:
       return 0
 
+  # Memory accesses on ints. nbytes of 0 means the full cache data width
+  def load(self, addr, nbytes):
+    if nbytes == 0:
+      nbytes = self.cache_bitwidth_data // 8
+    line = self.mem.get(addr >> self.offset_end, 0)
+    shift = (addr & self.offset_mask) * 8
+    return (line >> shift) & ((1 << nbytes * 8) - 1)
+
+  def store(self, addr, nbytes, value):
+    if nbytes == 0:
+      nbytes = self.cache_bitwidth_data // 8
+    line_addr = addr >> self.offset_end
+    shift = (addr & self.offset_mask) * 8
+    mask = ((1 << nbytes * 8) - 1) << shift
+    self.mem[line_addr] = ((self.mem.get(line_addr, 0) & ~mask) |
+                           ((value << shift) & mask))
+
+  # Applies one request to the hit/miss tracker and the memory. Returns
+  # the test and data fields of the response as ints
+  def access(self, type_, addr, len_, data):
+    if type_ == MemMsgType.READ:
+      return self.check_hit(addr), self.load(addr, len_)
+    elif type_ == MemMsgType.WRITE:
+      hit = self.check_hit(addr)
+      self.store(addr, len_, data)
+      self.tracker.mark_dirty(addr)
+      return hit, 0
+    elif type_ == MemMsgType.WRITE_INIT:
+      self.check_hit(addr)
+      self.store(addr, len_, data)
+      return 0, 0
+    elif MemMsgType.AMO_ADD <= type_ <= MemMsgType.AMO_XOR:
+      # AMO operations are on the word level only
+      self.tracker.amo_req(addr)
+      ret = self.load(addr, 4)
+      self.store(addr, 4, AMO_FUNS[type_](ret, data & 0xffffffff))
+      return 0, ret
+    elif type_ == MemMsgType.INV:
+      self.tracker.invalidate()
+      self.inv_flush_cycles += self.tracker.inv_cycles()
+      return 0, 0
+    elif type_ == MemMsgType.FLUSH:
+      ndirty = self.tracker.flush()
+      self.inv_flush_cycles += self.tracker.flush_cycles(ndirty, self.latency)
+      return 0, 0
+    assert False, "FL model: Undefined transaction type"
+
   def read(self, addr, opaque, len_):
-    hit = self.check_hit(addr)
-    new_addr = int(addr[self.offset_end:32])
-    offset = int(addr[self.offset_start:self.offset_end])
-    if new_addr not in self.mem:
-      self.mem[new_addr] = Bits(self.mem_bitwidth_data, 0)
-    if len_ == 0:
-      value = self.mem[new_addr][offset*8 : (offset+self.cache_bitwidth_data/8)*8]
-    else:
-      value = self.mem[new_addr][offset*8 : (offset + int(len_))*8 ]
-    
-    value = zext(value, self.cache_bitwidth_data)
+    hit, value = self.access(MemMsgType.READ, int(addr), int(len_), 0)
     self.transactions.append(req (self.CacheReqType, 'rd', opaque, addr, len_, 0))
-    self.transactions.append(resp(self.CacheRespType,'rd', opaque, hit,  len_, value))
+    self.transactions.append(resp(self.CacheRespType,'rd', opaque, hit,  len_, self.BitsData(value)))
     self.opaque += 1
 
   def write(self, addr, value, opaque, len_):
-    hit = self.check_hit(addr)
-    new_addr = int(addr[self.offset_end:32])
-    offset = int(addr[self.offset_start:self.offset_end])
     value = Bits(self.cache_bitwidth_data, value)
-    if new_addr not in self.mem:
-      self.mem[new_addr] = Bits(self.mem_bitwidth_data, 0)
-    if len_ == 0:
-      self.mem[new_addr][offset*8 : (offset+self.cache_bitwidth_data/8)*8] = value[0 : self.cache_bitwidth_data ]
-    else:
-      self.mem[new_addr][offset*8 : (offset + int(len_))*8] = value[0 : int(len_)*8 ]
-
+    hit, _ = self.access(MemMsgType.WRITE, int(addr), int(len_), int(value))
     self.transactions.append(req (self.CacheReqType, 'wr', opaque, addr, len_, value))
     self.transactions.append(resp(self.CacheRespType,'wr', opaque, hit,  len_, 0))
     self.opaque += 1
 
   def init(self, addr, value, opaque, len_):
-    hit = self.check_hit(addr)
-    new_addr = int(addr[self.offset_end:32])
-    offset = int(addr[self.offset_start:self.offset_end])
     value = Bits(self.cache_bitwidth_data, value)
-    if new_addr not in self.mem:
-      self.mem[new_addr] = Bits(self.mem_bitwidth_data, 0)
-    if len_ == 0:
-      self.mem[new_addr][offset*8 : (offset+self.cache_bitwidth_data/8)*8] = value
-    else:
-      self.mem[new_addr][offset*8 : (offset + int(len_))*8 ] = value
+    self.access(MemMsgType.WRITE_INIT, int(addr), int(len_), int(value))
     self.transactions.append(req(self.CacheReqType,'in', opaque, addr, len_, value))
     self.transactions.append(resp(self.CacheRespType,'in', opaque, 0, len_, 0))
     self.opaque += 1
 
   def amo(self, addr, value, opaque, len_, func):
-    # AMO operations are on the word level only
-    self.tracker.amo_req(addr)
-    new_addr = addr[self.offset_end:32]
-    offset = int(addr[self.offset_start:self.offset_end])
-    if new_addr not in self.mem:
-      self.mem[new_addr] = Bits(self.mem_bitwidth_data, 0)
-    ret = self.mem[new_addr.int()][offset * 8 : (offset + 4) * 8]
-    
-    value = trunc(value, 32)
-    amo_out = AMO_FUNS[ int(func) ]( ret, value )
-    ret = zext( ret, self.cache_bitwidth_data )
-    value = zext( value, self.cache_bitwidth_data )
-    self.mem[new_addr.int()][offset * 8 : (offset + 4) * 8] = amo_out
-    
+    _, ret = self.access(int(func), int(addr), int(len_), int(value))
+    value = zext( trunc(value, 32), self.cache_bitwidth_data )
     self.transactions.append(req (self.CacheReqType, func, opaque, addr, len_, value))
-    self.transactions.append(resp(self.CacheRespType,func, opaque, 0,    len_, ret))
+    self.transactions.append(resp(self.CacheRespType,func, opaque, 0,    len_, self.BitsData(ret)))
     self.opaque += 1
 
   def invalidate(self, opaque):
-    self.tracker.invalidate()
+    self.access(MemMsgType.INV, 0, 0, 0)
     self.transactions.append(req (self.CacheReqType, 'inv', opaque, 0, 0, 0))
     self.transactions.append(resp(self.CacheRespType, 'inv', opaque, 0, 0, 0))
     self.opaque += 1
 
   def flush(self, opaque):
+    self.access(MemMsgType.FLUSH, 0, 0, 0)
     self.transactions.append(req (self.CacheReqType, 'fl', opaque, 0, 0, 0))
     self.transactions.append(resp(self.CacheRespType, 'fl', opaque, 0, 0, 0))
     self.opaque += 1
 
+  #-----------------------------------------------------------------------
+  # Batch trace replay
+  #-----------------------------------------------------------------------
+  # Runs a whole trace given as parallel sequences of ints (lists, arrays)
+  # of request types, addresses, lengths and data without building any
+  # messages. Returns the test field of every response as array('B') and
+  # the response data as array('Q'), or as a list if the data is wider
+  # than 64 bits. Nothing is added to the transactions list.
+
+  def replay(self, types, addrs, lens, datas):
+    hits = array('B', bytes(len(types)))
+    if self.cache_bitwidth_data <= 64:
+      rdata = array('Q', [0]) * len(types)
+    else:
+      rdata = [0] * len(types)
+    access = self.access
+    for i, (type_, addr, len_, data) in enumerate(zip(types, addrs, lens, datas)):
+      hits[i], rdata[i] = access(type_, addr, len_, data)
+    self.opaque += len(types)
+    return hits, rdata
+
+  # Builds the (request, response) messages of a replayed trace only as
+  # they are needed. Opaques default to the request index
+  def iter_transactions(self, types, addrs, lens, datas, hits, rdata, opaques=None):
+    if opaques is None:
+      opaques = self.default_opaques()
+    for type_, addr, len_, data, hit, value, opaque in zip(
+        types, addrs, lens, datas, hits, rdata, opaques):
+      yield self.mk_transaction(type_, opaque, addr, len_, data, hit, value)
+
+  #-----------------------------------------------------------------------
+  # Streaming
+  #-----------------------------------------------------------------------
+  # Runs a trace given as an iterable of (type, addr, len, data) int
+  # tuples one request at a time and yields its (request, response)
+  # messages. Requests are only pulled from the trace as the consumer asks
+  # for the next pair, so a lazily generated trace is simulated in
+  # constant memory. Nothing is added to the transactions list.
+
+  def stream(self, trace, opaques=None):
+    if opaques is None:
+      opaques = self.default_opaques()
+    access = self.access
+    for (type_, addr, len_, data), opaque in zip(trace, opaques):
+      hit, value = access(type_, addr, len_, data)
+      self.opaque += 1
+      yield self.mk_transaction(type_, opaque, addr, len_, data, hit, value)
+
+  # Request index truncated to the opaque field, without an end
+  def default_opaques(self):
+    nbits_opaque = self.CacheReqType.get_field_type("opaque").nbits
+    return (i & ((1 << nbits_opaque) - 1) for i in itertools.count())
+
+  # Messages of one request given as ints. The request fields are cleaned
+  # up the same way the per-request calls do
+  def mk_transaction(self, type_, opaque, addr, len_, data, hit, value):
+    data &= (1 << self.cache_bitwidth_data) - 1
+    if MemMsgType.AMO_ADD <= type_ <= MemMsgType.AMO_XOR:
+      data &= 0xffffffff
+    elif type_ == MemMsgType.READ or type_ >= MemMsgType.INV:
+      data = 0
+    if type_ >= MemMsgType.INV:
+      addr = len_ = 0
+    return ( req (self.CacheReqType,  type_, opaque, addr, len_, data),
+             resp(self.CacheRespType, type_, opaque, hit,  len_, value) )
+
   def get_transactions(self):
     return self.transactions
@@ -14,12 +14,16 @@ from pymtl3.stdlib.mem      import MemMasterIfcRTL, MemMinionIfcRTL
 from .BlockingCacheCtrlRTL  import BlockingCacheCtrlRTL
 from .BlockingCacheDpathRTL import BlockingCacheDpathRTL
 from .CacheDerivedParams    import CacheDerivedParams
+from .cache_constants       import PERF_SEL_NBITS, PERF_COUNTER_NBITS
 
 
 class BlockingCacheRTL ( Component ):
 
   def construct( s, CacheReqType, CacheRespType, MemReqType, MemRespType,
-                 num_bytes=4096, associativity=2 ):
+                 num_bytes=4096, associativity=2, sparse_sram=False,
+                 dirty_line_index=False, replacement_policy='lru',
+                 mshr_entries=1, hit_under_miss=False, perf_counters=False,
+                 wb_buffer_entries=0, victim_lines=0, prefetch_entries=0 ):
     """
       Parameters
       ----------
@@ -34,11 +38,43 @@ class BlockingCacheRTL ( Component ):
       num_bytes     : int
           Cache size in bytes
       associativity : int
+      sparse_sram   : bool
+          Use the sparse behavioral SRAM model (simulation only)
+      dirty_line_index : bool
+          Track dirty lines so flush skips clean ones
+      replacement_policy : str
+          'lru', 'plru' (tree pseudo-LRU) or 'fifo'
+      mshr_entries  : int
+          Outstanding misses. More than one makes the cache nonblocking:
+          hits and misses to other sets are served under a miss, misses to
+          the same line are merged and responses may come back out of order
+      hit_under_miss : bool
+          Serve hits and merge misses under a single outstanding refill;
+          other misses wait in the MSHR for the refill to come back
+      perf_counters : bool
+          Count hits, misses, writebacks, stalls etc. Counter perf_sel (see
+          cache_constants) is read on perf_count, perf_clear zeroes them all
+      wb_buffer_entries : int
+          Dirty evictions wait in a buffer of this many entries and are
+          written back when the memory interface is idle, after the refill
+      victim_lines : int
+          Keep clean copies of this many evicted lines; a miss to one of
+          them is refilled from there without going to memory
+      prefetch_entries : int
+          Prefetch the next line, or one stride ahead, of the misses in
+          cycles the processor sends no request. Number of address regions
+          whose strides are tracked, and of prefetched lines whose use is
+          tracked; needs mshr_entries > 1
     """
 
     # Generate additional constants and bitstructs from the given parameters
     s.param = p = CacheDerivedParams( CacheReqType, CacheRespType, MemReqType,
-                                      MemRespType, num_bytes, associativity )
+                                      MemRespType, num_bytes, associativity,
+                                      sparse_sram, dirty_line_index,
+                                      replacement_policy, mshr_entries,
+                                      hit_under_miss, perf_counters,
+                                      wb_buffer_entries, victim_lines,
+                                      prefetch_entries )
 
     #---------------------------------------------------------------------
     # Interface
@@ -48,6 +84,11 @@ class BlockingCacheRTL ( Component ):
     s.mem_minion_ifc = MemMinionIfcRTL( CacheReqType, CacheRespType )
     # Memory-Master Interface (e.g. cache <-> main memory or lower-level cache)
     s.mem_master_ifc = MemMasterIfcRTL( MemReqType, MemRespType )
+    # Debug port for the performance counters
+    if perf_counters:
+      s.perf_sel   = InPort ( PERF_SEL_NBITS )
+      s.perf_clear = InPort ()
+      s.perf_count = OutPort( PERF_COUNTER_NBITS )
 
     #---------------------------------------------------------------------
     # Structural Composition
@@ -70,6 +111,10 @@ class BlockingCacheRTL ( Component ):
     m.memreq_rdy    //= s.mem_master_ifc.req.rdy
     m.status        //= s.cacheDpath.status
     m.ctrl          //= s.cacheDpath.ctrl
+    if perf_counters:
+      m.perf_sel    //= s.perf_sel
+      m.perf_clear  //= s.perf_clear
+      m.perf_count  //= s.perf_count
 
   # Line tracing
   def line_trace( s, level=2 ):
@@ -18,11 +18,31 @@ class CacheDerivedParams:
            f"{self.MemReqType}_{self.MemRespType}_{self.num_bytes}_{self.associativity}"
 
   def __str__( self ):
-    return f"BlockingCache_{self.num_bytes}_{self.bitwidth_cacheline}_{self.bitwidth_addr}_"\
+    name = f"BlockingCache_{self.num_bytes}_{self.bitwidth_cacheline}_{self.bitwidth_addr}_"\
            f"{self.bitwidth_data}_{self.associativity}"
+    if self.dirty_line_index:
+      name += "_dli"
+    if self.replacement_policy != 'lru':
+      name += f"_{self.replacement_policy}"
+    if self.hit_under_miss:
+      name += "_hum"
+    elif self.nonblocking:
+      name += f"_mshr{self.mshr_entries}"
+    if self.wb_buffer_entries:
+      name += f"_wbb{self.wb_buffer_entries}"
+    if self.victim_lines:
+      name += f"_vc{self.victim_lines}"
+    if self.prefetch_entries:
+      name += f"_pf{self.prefetch_entries}"
+    if self.perf_counters:
+      name += "_perf"
+    return name
 
   def __init__( self, CacheReqType, CacheRespType, MemReqType, MemRespType,
-                num_bytes, associativity ):
+                num_bytes, associativity, sparse_sram=False, dirty_line_index=False,
+                replacement_policy='lru', mshr_entries=1, hit_under_miss=False,
+                perf_counters=False, wb_buffer_entries=0, victim_lines=0,
+                prefetch_entries=0 ):
 
     self.num_bytes     = num_bytes
     self.CacheReqType  = CacheReqType
@@ -31,6 +51,63 @@ class CacheDerivedParams:
     self.MemRespType   = MemRespType
     self.associativity = associativity
 
+    #--------------------------------------------------------------------------
+    # Simulation options
+    #--------------------------------------------------------------------------
+
+    # Use the sparse behavioral SRAM model for the tag and data arrays.
+    # Simulation only, cannot be translated.
+    self.sparse_sram   = sparse_sram
+
+    #--------------------------------------------------------------------------
+    # Hardware options
+    #--------------------------------------------------------------------------
+
+    # Keep a one-bit-per-line dirty summary next to the tag arrays so that
+    # flush only visits dirty lines
+    self.dirty_line_index = dirty_line_index
+
+    # Replacement policy for set associative caches: 'lru', 'plru' or 'fifo'
+    assert replacement_policy in ( 'lru', 'plru', 'fifo' ), \
+      f"Unknown replacement policy {replacement_policy}"
+    self.replacement_policy = replacement_policy
+
+    # Number of MSHR entries. One entry is the blocking cache; with more
+    # entries hits and misses to other sets go on under outstanding misses
+    assert mshr_entries >= 1, "Need at least one MSHR entry"
+
+    # Hit under miss: the nonblocking pipeline with a single refill in
+    # flight. Misses behind it are parked in the MSHR, so we need a second
+    # entry at least
+    self.hit_under_miss = hit_under_miss
+    if hit_under_miss:
+      mshr_entries = max( mshr_entries, 2 )
+    self.mshr_entries = mshr_entries
+    self.nonblocking  = mshr_entries > 1
+    self.max_refills  = 1 if hit_under_miss else mshr_entries
+
+    # Dirty evictions wait in a write-back buffer of this many entries so
+    # that the refill goes out first; 0 sends them straight to memory
+    assert wb_buffer_entries >= 0, "Negative write-back buffer entries"
+    self.wb_buffer_entries = wb_buffer_entries
+
+    # Clean copies of this many evicted lines are kept in a victim cache,
+    # a miss that finds its line there is refilled without a memreq
+    assert victim_lines >= 0, "Negative victim cache lines"
+    self.victim_lines = victim_lines
+
+    # A next-line/stride prefetcher with this many regions and prefetched
+    # lines tracked; 0 for none. Prefetches wait in the MSHR like misses,
+    # so the cache must be nonblocking
+    assert prefetch_entries >= 0, "Negative prefetcher entries"
+    assert not prefetch_entries or self.nonblocking, \
+      "The prefetcher needs a nonblocking cache"
+    self.prefetch_entries = prefetch_entries
+
+    # Event counters in the ctrl, read through the perf_sel/perf_count
+    # debug port
+    self.perf_counters = perf_counters
+
     #--------------------------------------------------------------------------
     # Bitwidths
     #--------------------------------------------------------------------------
@@ -63,6 +140,21 @@ class CacheDerivedParams:
       self.bitwidth_clog_asso      = clog2( self.associativity )
     self.bitwidth_mem_len          = clog2( self.bitwidth_cacheline // 8 )
 
+    # The MSHR id is sent out as the memreq opaque
+    assert self.mshr_entries <= 2**self.bitwidth_opaque, \
+      f"{self.mshr_entries} MSHR entries do not fit in the memreq opaque"
+
+    # Replacement state per set: a bit per pair of ways for lru, a bit per
+    # tree node for plru and a way pointer for fifo
+    if self.associativity == 1:
+      self.bitwidth_rep            = 1
+    elif self.replacement_policy == 'lru':
+      self.bitwidth_rep            = self.associativity * ( self.associativity - 1 ) // 2
+    elif self.replacement_policy == 'plru':
+      self.bitwidth_rep            = self.associativity - 1
+    else:
+      self.bitwidth_rep            = self.bitwidth_clog_asso
+
     self.bitwidth_dirty            = self.bitwidth_cacheline // 32  # 1 dirty bit per 32-bit word
     self.bitwidth_val              = 1                              # Valid bit
 
@@ -93,6 +185,7 @@ class CacheDerivedParams:
     self.BitsAssoclog2     = mk_bits( self.bitwidth_clog_asso )
     self.BitsClogNlines    = mk_bits( clog2(self.total_num_cachelines) )
     self.BitsNlinesPerWay  = mk_bits( self.nblocks_per_way )
+    self.BitsRep           = mk_bits( self.bitwidth_rep )           # Replacement state of a set
     self.BitsMemLen        = mk_bits( self.bitwidth_mem_len )
 
     # Cifer Bits objects
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#=========================================================================
+# benchmark.py
+#=========================================================================
+# Measures the simulation throughput of BlockingCacheRTL under the test
+# harness for the configs of the random tests, with the Python simulator
+# and with the Verilator import. Prints the results as JSON:
+#
+#   {"num_trans": ..., "results": [ {"name": ..., "backend": ...,
+#     "cycles": ..., "seconds": ..., "cycles_per_sec": ...,
+#     "requests_per_sec": ..., "peak_rss_kb": ...}, ... ]}
+#
+# Each config runs in its own process so the peak RSS is its own. Only
+# the simulation loop is timed, which includes the FL model streaming the
+# expected responses. A config that cannot run (e.g. no Verilator) gets
+# an "error" instead of numbers.
+#
+# Date   : 17 October 2026
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+file_path   = os.path.abspath( __file__ )
+dir_path    = os.path.dirname( file_path )
+parent_path = os.path.dirname( dir_path )
+sys.path.insert( 0, parent_path )
+
+# name: ( associativity, line bits, data bits, size in bytes )
+configs = {
+  'dmap_size16_lineb64_datab32'     : ( 1, 64,  32,  16   ),
+  'dmap_size32_lineb128_datab64'    : ( 1, 128, 64,  32   ),
+  'dmap_size32_lineb128_datab128'   : ( 1, 128, 128, 32   ),
+  'asso2_size32_lineb64_datab32'    : ( 2, 64,  32,  32   ),
+  'asso2_size64_lineb128_datab64'   : ( 2, 128, 64,  64   ),
+  'asso2_size64_lineb128_datab128'  : ( 2, 128, 128, 64   ),
+  'asso2_size4096_lineb128_datab128': ( 2, 128, 128, 4096 ),
+  'asso2_size4096_lineb128_datab32' : ( 2, 128, 32,  4096 ),
+  'dmap_size4096_lineb128_datab128' : ( 1, 128, 128, 4096 ),
+  'dmap_size4096_lineb128_datab32'  : ( 1, 128, 32,  4096 ),
+}
+
+backends = [ 'python', 'verilog' ]
+
+#=========================================================================
+# Command line processing
+#=========================================================================
+
+def parse_cmdline():
+  p = argparse.ArgumentParser(description='Benchmark the cache simulation throughput')
+  p.add_argument( "--num-trans", default=2000, type=int, help="Requests per config" )
+  p.add_argument( "--config", action='append', choices=list( configs ),
+                  help="Config to run, may be repeated (default: all)" )
+  p.add_argument( "--backend", action='append', choices=backends,
+                  help="Backend to run, may be repeated (default: all)" )
+  p.add_argument( "--output", default="", type=str, help="JSON file (default: stdout)" )
+  # Runs a single config in this process, used for the per-config processes
+  p.add_argument( "--run", action='store_true', help=argparse.SUPPRESS )
+  opts = p.parse_args()
+  return opts
+
+#=========================================================================
+# Runs a single config
+#=========================================================================
+
+def run_config( name, backend, num_trans ):
+  from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+  from blocking_cache.test.RandomTestCases import random_stream_generator
+  from test.sim_utils import TestHarness, setup_sim, rand_mem
+
+  associativity, clw, dbw, size = configs[ name ]
+  tp = random_stream_generator( rand_mem( 0, 0xffff ), associativity, clw, dbw,
+                                size, num_trans )
+  th = TestHarness( tp.msg, None, 0, 1, 0, 0, BlockingCacheRTL,
+                    tp.CacheReqType, tp.CacheRespType, tp.MemReqType,
+                    tp.MemRespType, tp.size, tp.associativity )
+  th.elaborate()
+  th.load( tp.mem[::2], tp.mem[1::2] )
+  cmdline_opts = {
+    'test_verilog': 'zeros' if backend == 'verilog' else '',
+    'dump_vcd'    : '',
+    'dump_vtb'    : '',
+  }
+  th = setup_sim( th, cmdline_opts, sram_wrapper=( size == 4096 and backend == 'verilog' ),
+                  linetrace=False )
+
+  start = time.perf_counter()
+  while not th.done():
+    th.sim_tick()
+  seconds = time.perf_counter() - start
+
+  cycles = th.sim_cycle_count()
+  return {
+    'cycles'          : cycles,
+    'seconds'         : seconds,
+    'cycles_per_sec'  : cycles / seconds,
+    'requests_per_sec': num_trans / seconds,
+    'peak_rss_kb'     : resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss,
+  }
+
+# Runs a config in a new process in a scratch directory for the verilog
+# files
+def spawn_config( name, backend, num_trans ):
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    proc = subprocess.run(
+      [ sys.executable, file_path, '--run', '--config', name, '--backend',
+        backend, '--num-trans', str( num_trans ) ],
+      cwd=tmp_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True )
+  if proc.returncode != 0:
+    lines = proc.stderr.strip().splitlines()
+    return { 'error': lines[-1].strip() if lines else f'exit code {proc.returncode}' }
+  return json.loads( proc.stdout.strip().splitlines()[-1] )
+
+#=========================================================================
+# Runs the benchmarks
+#=========================================================================
+
+def main( opts ):
+  if opts.run:
+    print( json.dumps( run_config( opts.config[0], opts.backend[0], opts.num_trans ) ) )
+    return
+
+  results = []
+  for name in opts.config or configs:
+    associativity, clw, dbw, size = configs[ name ]
+    for backend in opts.backend or backends:
+      result = {
+        'name'         : name,
+        'backend'      : backend,
+        'associativity': associativity,
+        'line_bits'    : clw,
+        'data_bits'    : dbw,
+        'size'         : size,
+      }
+      result.update( spawn_config( name, backend, opts.num_trans ) )
+      print( name, backend, result.get( 'cycles_per_sec', 'error' ), file=sys.stderr )
+      results.append( result )
+
+  report = json.dumps( { 'num_trans': opts.num_trans, 'results': results }, indent=2 )
+  if opts.output:
+    with open( opts.output, 'w' ) as f:
+      f.write( report + '\n' )
+  else:
+    print( report )
+
+if __name__ == '__main__':
+  main( parse_cmdline() )
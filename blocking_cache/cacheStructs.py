@@ -20,17 +20,19 @@ def mk_dpath_status_struct( p ):
     'memresp_type_M0'         : p.BitsType,
     'offset_M0'               : p.BitsOffset,
     'amo_hit_M0'              : Bits1,
+    'flush_next_dirty_M0'     : p.BitsClogNlines,
 
     # M1 Dpath Signals
     'cachereq_type_M1'        : p.BitsType,
     # Tag PU outputs
     'ctrl_bit_dty_rd_line_M1' : p.BitsAssoc,
     'ctrl_bit_dty_rd_word_M1' : p.BitsAssoc,
+    'ctrl_bit_val_rd_M1'      : p.BitsAssoc,
     'hit_M1'                  : Bits1,
     'inval_hit_M1'            : Bits1,
     'hit_way_M1'              : p.BitsAssoclog2,
     ## Signals for multiway associativity
-    'ctrl_bit_rep_rd_M1'      : p.BitsAssoclog2,
+    'ctrl_bit_rep_rd_M1'      : p.BitsRep,
     'amo_hit_way_M1'          : p.BitsAssoclog2,
 
     # M2 Dpath Signals
@@ -41,7 +43,28 @@ def mk_dpath_status_struct( p ):
     'MSHR_empty'              : Bits1,
     'MSHR_type'               : p.BitsType,
     'MSHR_ptr'                : p.BitsAssoclog2,
-
+    ## Signals for nonblocking caches
+    'MSHR_conflict_M0'        : Bits1,
+    'MSHR_pending_M1'         : Bits1,
+    'MSHR_pending_pf_M1'      : Bits1,
+    'MSHR_refill_full_M1'     : Bits1,
+    'MSHR_retry_val'          : Bits1,
+    'memresp_type_Y'          : p.BitsType,
+    'memresp_q_enq_rdy'       : Bits1,
+    'memresp_q_deq_rdy'       : Bits1,
+    'cachereq_type_Y'         : p.BitsType,
+    ## Signals for the write-back buffer
+    'wbb_full'                : Bits1,
+    'wbb_empty'               : Bits1,
+    'wbb_hit_M2'              : Bits1,
+    ## Signals for the victim cache
+    'vc_hit_M2'               : Bits1,
+    ## Signals for the prefetcher
+    'pf_val_M0'               : Bits1,
+    'pf_busy_M0'              : Bits1,
+    'prefetch_M2'             : Bits1,
+    'pf_useful_M2'            : Bits1,
+    'pf_useless_M2'           : Bits1,
 
   })
   return req_cls
@@ -61,12 +84,20 @@ def mk_ctrl_signals_struct( p ):
     'update_tag_way_M0'           : p.BitsAssoclog2,
     'tag_array_type_M0'           : Bits1,
     'tag_array_wben_M0'           : p.BitsTagWben,
-    'ctrl_bit_rep_wr_M0'          : Bits1,
+    'ctrl_bit_rep_wr_M0'          : p.BitsRep,
     'update_tag_cmd_M0'           : Bits3,
     'update_tag_sel_M0'           : Bits1,
     'tag_array_idx_sel_M0'        : Bits1,
     'tag_array_init_idx_M0'       : p.BitsIdx,
     'is_amo_M0'                   : Bits1,
+    'flush_ptr_M0'                : p.BitsClogNlines,
+    'memresp_reg_en_M0'           : Bits1,
+    'MSHR_dealloc_id_sel_M0'      : Bits2,
+    'MSHR_replay_id_en_M0'        : Bits1,
+    'memresp_q_enq_en_Y'          : Bits1,
+    'memresp_q_deq_en_Y'          : Bits1,
+    'vc_resp_sel_Y'               : Bits1,
+    'pf_issue_M0'                 : Bits1,
 
     # M1 Ctrl Signals
     'reg_en_M1'            : Bits1,
@@ -93,7 +124,20 @@ def mk_ctrl_signals_struct( p ):
     'memreq_type'          : p.BitsType,
     'MSHR_alloc_en'        : Bits1,
     'MSHR_dealloc_en'      : Bits1,
+    'MSHR_alloc_secondary' : Bits1,
+    'MSHR_alloc_parked'    : Bits1,
+    'MSHR_alloc_promote'   : Bits1,
     'is_amo_M2'            : Bits1,
+    'wbb_enq_en_M2'        : Bits1,
+    'wbb_deq_en_M2'        : Bits1,
+    'vc_ins_en_M2'         : Bits1,
+    'vc_remove_en_M2'      : Bits1,
+    'vc_clear_M2'          : Bits1,
+    'vc_resp_en_M2'        : Bits1,
+    'pf_train_M2'          : Bits1,
+    'pf_hit_M2'            : Bits1,
+    'pf_record_M2'         : Bits1,
+    'pf_clear_M2'          : Bits1,
 
   })
   return req_cls
@@ -140,6 +184,7 @@ def mk_pipeline_msg( p ):
     'addr':   p.StructAddr,
     'len':    p.BitsLen,
     'data':   p.BitsCacheline,
+    'prefetch': Bits1,
   },
   namespace = {
     '__str__' : req_to_str
@@ -168,7 +213,8 @@ def mk_MSHR_msg( p ):
     'data':    p.BitsData,
     'repl':    p.BitsAssoclog2,
     'amo_hit': Bits1,
-    'dirty_bits': p.BitsDirty
+    'dirty_bits': p.BitsDirty,
+    'prefetch': Bits1,
   },
   namespace = {
     '__str__' : req_to_str
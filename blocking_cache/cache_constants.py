@@ -47,3 +47,40 @@ UpdateTagArrayUnit_CMD_FLUSH     = b3(6) # Flush this cache line
 WriteBitEnGen_CMD_NONE  = b2(0) # All bits zero - no action
 WriteBitEnGen_CMD_REQ   = b2(1) # Gen bits based on current request
 WriteBitEnGen_CMD_DIRTY = b2(2) # Gen bits based on inverted dirty bits
+
+#-------------------------------------------------------------------------
+# Performance counters
+#-------------------------------------------------------------------------
+# Counters selected by perf_sel on the debug port. Hits and misses count
+# each read/write once: a parked miss counts when it is retried, a miss
+# merged into an outstanding refill counts as a hit when it is retried.
+# Prefetches are neither
+
+PERF_COUNTER_NBITS = 32
+PERF_SEL_NBITS     = 4
+
+PERF_HITS          = 0 # read/write hits
+PERF_MISSES        = 1 # read/write misses
+PERF_EVICTIONS     = 2 # read/write misses that write back a dirty victim
+PERF_WRITEBACKS    = 3 # dirty lines written back, including AMO and flush
+PERF_AMOS          = 4 # AMOs sent to memory
+PERF_STALL_M1      = 5 # cycles M1 stalls itself (ostall_M1)
+PERF_STALL_M2      = 6 # cycles M2 stalls itself (ostall_M2)
+PERF_MSHR_FULL     = 7 # cycles the MSHR is full
+PERF_INV_CYCLES    = 8 # cycles spent invalidating
+PERF_FLUSH_CYCLES  = 9 # cycles spent flushing
+PERF_VICTIM_HITS   = 10 # misses refilled from the victim cache
+PERF_PREFETCHES    = 11 # prefetches sent to memory
+PERF_PF_USEFUL     = 12 # first demand hits on prefetched lines
+PERF_PF_USELESS    = 13 # prefetched lines evicted or forgotten unused
+PERF_NCOUNTERS     = 14
+
+#-------------------------------------------------------------------------
+# Prefetcher
+#-------------------------------------------------------------------------
+# Strides are tracked per region and prefetches stay in the region of the
+# access that triggered them
+
+PREFETCH_REGION_NBITS = 12 # 4KB regions
+PREFETCH_CONF_NBITS   = 2  # stride confidence, full when saturated
+PREFETCH_ACC_NBITS    = 3  # accuracy counter of the throttle
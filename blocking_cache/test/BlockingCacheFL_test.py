@@ -7,6 +7,7 @@ Test for Pipelined Blocking Cache FL model
 Author : Xiaoyu Yan, Eric Tang
 Date   : 17 November 2019
 """
+from pymtl3            import *
 from mem_ifcs.MemMsg   import MemMsgType, mk_mem_msg
 from ..BlockingCacheFL import ModelCache
 from .GenericTestCases import GenericTestCases
@@ -43,3 +44,60 @@ class CacheFL_Tests( GenericTestCases, InvFlushTests, AmoTests ):
         assert sink[i] == resps[i], "\n  actual:{}\nexpected:{}".format(
           resps[i], sink[i]
         )
+
+#-------------------------------------------------------------------------
+# INV/FLUSH cycle estimates
+#-------------------------------------------------------------------------
+# Expected cycles were measured on BlockingCacheRTL from cachereq to
+# cacheresp: 256B, 2-way, 128-bit lines, memory latency 4.
+
+def test_inv_flush_cycles():
+  CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32, False )
+  MemReqType, MemRespType = mk_mem_msg( 8, 32, 128, True )
+  cache = ModelCache( 256, 2, 0, CacheReqType, CacheRespType, MemReqType,
+                      MemRespType, latency=4 )
+  cache.flush( 0 )
+  assert cache.inv_flush_cycles == 19
+  for i in range( 3 ):
+    cache.write( Bits32( i * 16 ), 5, i, 0 )
+  cache.write( Bits32( 4 ), 6, 3, 0 ) # same line, still 3 dirty lines
+  cache.flush( 4 )
+  assert cache.inv_flush_cycles == 19 + 40
+  cache.flush( 5 ) # nothing left to write back
+  assert cache.inv_flush_cycles == 19 + 40 + 19
+  cache.write( Bits32( 0 ), 7, 6, 0 )
+  cache.invalidate( 7 )
+  assert cache.inv_flush_cycles == 19 + 40 + 19 + 19
+  cache.flush( 8 ) # invalid lines keep their dirty bits
+  assert cache.inv_flush_cycles == 19 + 40 + 19 + 19 + 26
+
+#-------------------------------------------------------------------------
+# Streaming
+#-------------------------------------------------------------------------
+
+def test_stream_matches_transactions():
+  CacheReqType, CacheRespType = mk_mem_msg( 8, 32, 32, False )
+  MemReqType, MemRespType = mk_mem_msg( 8, 32, 128, True )
+  mem = [ 0x00, 0x11111111, 0x24, 0x22222222, 0x48, 0x33333333 ]
+  ref = ModelCache( 64, 2, 0, CacheReqType, CacheRespType, MemReqType,
+                    MemRespType, mem )
+  ref.read( Bits32( 0x00 ), 0, 0 )
+  ref.write( Bits32( 0x24 ), 0xdeadbeef, 1, 0 )
+  ref.amo( Bits32( 0x48 ), Bits32( 5 ), 2, 0, MemMsgType.AMO_ADD )
+  ref.read( Bits32( 0x25 ), 3, 1 )
+  ref.flush( 4 )
+  ref.read( Bits32( 0x48 ), 5, 0 )
+
+  trace = iter( [ ( MemMsgType.READ,    0x00, 0, 0          ),
+                  ( MemMsgType.WRITE,   0x24, 0, 0xdeadbeef ),
+                  ( MemMsgType.AMO_ADD, 0x48, 0, 5          ),
+                  ( MemMsgType.READ,    0x25, 1, 0          ),
+                  ( MemMsgType.FLUSH,   0,    0, 0          ),
+                  ( MemMsgType.READ,    0x48, 0, 0          ) ] )
+  cache = ModelCache( 64, 2, 0, CacheReqType, CacheRespType, MemReqType,
+                      MemRespType, mem )
+  msgs = []
+  for req_msg, resp_msg in cache.stream( trace ):
+    msgs += [ req_msg, resp_msg ]
+  assert msgs == ref.get_transactions()
+  assert cache.transactions == []
@@ -7,8 +7,15 @@ Tests for Pipelined Blocking Cache RTL model
 Author : Xiaoyu Yan (xy97), Eric Tang (et396)
 Date   : 23 December 2019
 """
-from test.sim_utils     import run_sim, TestHarness
+import pytest
+from test.LatencyTracer import LatencyTracer
+from test.sim_utils     import (
+  run_sim, setup_sim, TestHarness, TransactionStream, req, resp, CacheReqType,
+  CacheRespType, MemReqType, MemRespType
+)
+from ..cache_constants  import *
 from ..BlockingCacheRTL import BlockingCacheRTL
+from ..BlockingCacheFL  import HitMissTracker
 from .GenericTestCases  import GenericTestCases
 from .AmoTests          import AmoTests
 from .InvFlushTests     import InvFlushTests
@@ -16,19 +23,286 @@ from .RandomTestCases   import RandomTests
 from .HypothesisTest    import HypothesisTests
 from .OtherCiferTests   import OtherCiferTests
 
+# Prefetches turn misses of the FL model into hits, so the test bit of the
+# responses is not checked with a prefetcher
+def resp_eq_but_test( a, b ):
+  return ( a.type_ == b.type_ and a.opaque == b.opaque and a.len == b.len and
+           a.data == b.data )
+
 class BlockingCacheRTL_Tests( GenericTestCases, InvFlushTests, AmoTests,
                               RandomTests, OtherCiferTests ):
 
+  # Extra keyword arguments passed to BlockingCacheRTL
+  cache_opts = {}
+
   def run_test( s, msgs, mem, CacheReqType, CacheRespType, MemReqType, MemRespType,
                 associativity, cacheSize, stall_prob, latency, src_delay,
                 sink_delay, cmdline_opts, trace ):
 
-    th = TestHarness( msgs[::2], msgs[1::2], stall_prob, latency,
+    if cmdline_opts['test_verilog'] and s.cache_opts.get('sparse_sram'):
+      pytest.skip( "sparse SRAM model is simulation only" )
+
+    if isinstance( msgs, TransactionStream ):
+      src_msgs, sink_msgs = msgs, None
+    else:
+      src_msgs, sink_msgs = msgs[::2], msgs[1::2]
+
+    if s.cache_opts.get('prefetch_entries'):
+      cmp_fn = resp_eq_but_test
+    else:
+      cmp_fn = lambda a, b : a == b
+
+    th = TestHarness( src_msgs, sink_msgs, stall_prob, latency,
                            src_delay, sink_delay, BlockingCacheRTL,
                            CacheReqType, CacheRespType, MemReqType,
-                           MemRespType, cacheSize, associativity )
+                           MemRespType, cacheSize, associativity,
+                           s.cache_opts,
+                           ordered=( s.cache_opts.get( 'mshr_entries', 1 ) == 1 and
+                                     not s.cache_opts.get( 'hit_under_miss' ) ),
+                           cmp_fn=cmp_fn )
     th.elaborate()
     if mem != None:
       th.load( mem[::2], mem[1::2] )
     sram_wrapper = True if cacheSize == 4096 else False
     run_sim( th, cmdline_opts, trace, sram_wrapper )
+
+class BlockingCacheRTLSparseSram_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'sparse_sram': True }
+
+class BlockingCacheRTLDirtyLineIndex_Tests( InvFlushTests ):
+  cache_opts = { 'dirty_line_index': True }
+  run_test   = BlockingCacheRTL_Tests.run_test
+
+class BlockingCacheRTLPlru_Tests( RandomTests ):
+  cache_opts = { 'replacement_policy': 'plru' }
+  run_test   = BlockingCacheRTL_Tests.run_test
+
+class BlockingCacheRTLFifo_Tests( RandomTests ):
+  cache_opts = { 'replacement_policy': 'fifo' }
+  run_test   = BlockingCacheRTL_Tests.run_test
+
+class BlockingCacheRTLNonblocking_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'mshr_entries': 4 }
+
+class BlockingCacheRTLHitUnderMiss_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'hit_under_miss': True }
+
+class BlockingCacheRTLPerfCounters_Tests( GenericTestCases ):
+  cache_opts = { 'perf_counters': True }
+  run_test   = BlockingCacheRTL_Tests.run_test
+
+  # 64B direct mapped cache with 128-bit lines; 0x100 maps to the set of
+  # 0x000 and evicts it once it is dirty
+  @pytest.mark.parametrize( "mshr_entries, mshr_full", [ ( 1, 24 ), ( 4, 0 ) ] )
+  def test_perf_counters( s, mshr_entries, mshr_full, cmdline_opts ):
+    if cmdline_opts['test_verilog']:
+      pytest.skip( "the counters are read by simulation" )
+    msgs = [
+      #    type  opq addr   len data       type  opq test len data
+      req( 'rd', 0,  0x000, 0,  0 ), resp( 'rd', 0,  0,   0,  0 ),
+      req( 'rd', 1,  0x004, 0,  0 ), resp( 'rd', 1,  1,   0,  0 ),
+      req( 'wr', 2,  0x008, 0,  5 ), resp( 'wr', 2,  1,   0,  0 ),
+      req( 'rd', 3,  0x100, 0,  0 ), resp( 'rd', 3,  0,   0,  0 ),
+      req( 'ad', 4,  0x010, 0,  1 ), resp( 'ad', 4,  0,   0,  0 ),
+      req( 'fl', 5,  0,     0,  0 ), resp( 'fl', 5,  0,   0,  0 ),
+      req( 'inv',6,  0,     0,  0 ), resp( 'inv',6,  0,   0,  0 ),
+    ]
+    th = TestHarness( msgs[::2], msgs[1::2], 0, 1, 0, 0, BlockingCacheRTL,
+                      CacheReqType, CacheRespType, MemReqType, MemRespType,
+                      64, 1, { 'perf_counters': True, 'mshr_entries': mshr_entries },
+                      ordered=( mshr_entries == 1 ) )
+    th.elaborate()
+    th.load( [ addr for addr in range( 0, 0x200, 4 ) ], [ 0 ] * 0x80 )
+    th = setup_sim( th, cmdline_opts, False, linetrace=False )
+    while not th.done():
+      th.sim_tick()
+
+    expected = {
+      PERF_HITS        : 2,
+      PERF_MISSES      : 2,
+      PERF_EVICTIONS   : 1,
+      PERF_WRITEBACKS  : 1,
+      PERF_AMOS        : 1,
+      PERF_STALL_M1    : 1,
+      PERF_STALL_M2    : 0,
+      PERF_MSHR_FULL   : mshr_full,
+      PERF_INV_CYCLES  : 4,
+      PERF_FLUSH_CYCLES: 4,
+    }
+    # perf_count follows perf_sel after a tick; the cache is idle by now
+    for sel, count in expected.items():
+      th.perf_sel @= sel
+      th.sim_tick()
+      assert th.perf_count == count, f"counter {sel}"
+
+    th.perf_clear @= 1
+    th.sim_tick()
+    th.perf_clear @= 0
+    for sel in expected:
+      th.perf_sel @= sel
+      th.sim_tick()
+      assert th.perf_count == 0
+
+class BlockingCacheRTLWbBuffer_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'wb_buffer_entries': 2 }
+
+  # 64B direct mapped cache with 128-bit lines; 0x100 maps to the set of
+  # 0x000. The refill of 0x100 goes out before the writeback of 0x000, and
+  # the AMO to the evicted 0x000 waits for its writeback
+  def test_wb_buffer_order( s, cmdline_opts ):
+    if cmdline_opts['test_verilog']:
+      pytest.skip( "the memreqs are watched by simulation" )
+    msgs = [
+      #    type  opq addr   len data       type  opq test len data
+      req( 'wr', 0,  0x000, 0,  5 ), resp( 'wr', 0,  0,   0,  0 ),
+      req( 'rd', 1,  0x100, 0,  0 ), resp( 'rd', 1,  0,   0,  0 ),
+      req( 'rd', 2,  0x000, 0,  0 ), resp( 'rd', 2,  0,   0,  5 ),
+      req( 'wr', 3,  0x000, 0,  7 ), resp( 'wr', 3,  1,   0,  0 ),
+      req( 'ad', 4,  0x000, 0,  1 ), resp( 'ad', 4,  0,   0,  7 ),
+      req( 'rd', 5,  0x000, 0,  0 ), resp( 'rd', 5,  0,   0,  8 ),
+    ]
+    th = TestHarness( msgs[::2], msgs[1::2], 0, 1, 0, 0, BlockingCacheRTL,
+                      CacheReqType, CacheRespType, MemReqType, MemRespType,
+                      64, 1, s.cache_opts )
+    th.elaborate()
+    th.load( [ addr for addr in range( 0, 0x200, 4 ) ], [ 0 ] * 0x80 )
+    th = setup_sim( th, cmdline_opts, False, linetrace=False )
+    memreqs = []
+    while not th.done():
+      th.sim_tick()
+      req_ifc = th.cache.mem_master_ifc.req
+      if req_ifc.en:
+        memreqs.append( ( int( req_ifc.msg.type_ ), int( req_ifc.msg.addr ) ) )
+
+    assert memreqs == [
+      ( MemMsgType.READ,    0x000 ),
+      ( MemMsgType.READ,    0x100 ),
+      ( MemMsgType.WRITE,   0x000 ),
+      ( MemMsgType.READ,    0x000 ),
+      ( MemMsgType.WRITE,   0x000 ),
+      ( MemMsgType.AMO_ADD, 0x000 ),
+      ( MemMsgType.READ,    0x000 ),
+    ]
+
+class BlockingCacheRTLNonblockingWbBuffer_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'mshr_entries': 4, 'wb_buffer_entries': 2 }
+
+class BlockingCacheRTLVictimCache_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'victim_lines': 2 }
+
+  # 64B direct mapped cache with 128-bit lines; 0x000 and 0x100 map to the
+  # same set and keep evicting each other into the victim cache. Only the
+  # first refill of each and the writeback of the dirty 0x000 go to memory
+  def test_victim_cache_swap( s, cmdline_opts ):
+    if cmdline_opts['test_verilog']:
+      pytest.skip( "the memreqs and counters are read by simulation" )
+    msgs = [
+      #    type  opq addr   len data       type  opq test len data
+      req( 'rd', 0,  0x000, 0,  0 ), resp( 'rd', 0,  0,   0,  0 ),
+      req( 'rd', 1,  0x100, 0,  0 ), resp( 'rd', 1,  0,   0,  0 ),
+      req( 'rd', 2,  0x000, 0,  0 ), resp( 'rd', 2,  0,   0,  0 ),
+      req( 'rd', 3,  0x104, 0,  0 ), resp( 'rd', 3,  0,   0,  0 ),
+      req( 'wr', 4,  0x000, 0,  5 ), resp( 'wr', 4,  0,   0,  0 ),
+      req( 'rd', 5,  0x100, 0,  0 ), resp( 'rd', 5,  0,   0,  0 ),
+      req( 'rd', 6,  0x000, 0,  0 ), resp( 'rd', 6,  0,   0,  5 ),
+      req( 'rd', 7,  0x004, 0,  0 ), resp( 'rd', 7,  1,   0,  0 ),
+    ]
+    th = TestHarness( msgs[::2], msgs[1::2], 0, 1, 0, 0, BlockingCacheRTL,
+                      CacheReqType, CacheRespType, MemReqType, MemRespType,
+                      64, 1, { **s.cache_opts, 'perf_counters': True } )
+    th.elaborate()
+    th.load( [ addr for addr in range( 0, 0x200, 4 ) ], [ 0 ] * 0x80 )
+    th = setup_sim( th, cmdline_opts, False, linetrace=False )
+    memreqs = []
+    while not th.done():
+      th.sim_tick()
+      req_ifc = th.cache.mem_master_ifc.req
+      if req_ifc.en:
+        memreqs.append( ( int( req_ifc.msg.type_ ), int( req_ifc.msg.addr ) ) )
+
+    assert memreqs == [
+      ( MemMsgType.READ,  0x000 ),
+      ( MemMsgType.READ,  0x100 ),
+      ( MemMsgType.WRITE, 0x000 ),
+    ]
+
+    tracker = HitMissTracker( 64 * 8, 1, 0, 128, victim_lines=2 )
+    for addr in [ 0x000, 0x100, 0x000, 0x104, 0x000, 0x100, 0x000, 0x004 ]:
+      tracker.access_address( addr )
+    assert tracker.victim_hits == 5
+
+    th.perf_sel @= PERF_VICTIM_HITS
+    th.sim_tick()
+    assert th.perf_count == tracker.victim_hits
+
+class BlockingCacheRTLNonblockingVictimCache_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'mshr_entries': 4, 'victim_lines': 2 }
+
+class BlockingCacheRTLPrefetch_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'mshr_entries': 4, 'prefetch_entries': 4 }
+
+class BlockingCacheRTLHitUnderMissPrefetch_Tests( BlockingCacheRTL_Tests ):
+  cache_opts = { 'hit_under_miss': True, 'prefetch_entries': 2 }
+
+#-------------------------------------------------------------------------
+# Strided workloads with and without the prefetcher
+#-------------------------------------------------------------------------
+# Reads a word of every stride-th line of a 4KB region on a 1KB 2-way
+# cache, with idle cycles between the reads and a slow memory. Each read
+# is to a new line, so without the prefetcher all of them miss
+
+PF_READS = 32
+
+def run_strided( stride, cache_opts, cmdline_opts ):
+  base  = 0x1000 if stride > 0 else 0x1ff0
+  addrs = [ base + i * stride * 16 + 4 for i in range( PF_READS ) ]
+  msgs  = []
+  for i, addr in enumerate( addrs ):
+    msgs += [ req( 'rd', i, addr, 0, 0 ), resp( 'rd', i, 0, 0, addr ) ]
+  tracer = LatencyTracer()
+  th = TestHarness( msgs[::2], msgs[1::2], 0, 20, 8, 0, BlockingCacheRTL,
+                    CacheReqType, CacheRespType, MemReqType, MemRespType,
+                    1024, 2, { 'mshr_entries': 8, 'perf_counters': True,
+                               **cache_opts },
+                    ordered=False, cmp_fn=resp_eq_but_test, tracer=tracer )
+  th.elaborate()
+  th.load( list( range( 0x1000, 0x2000, 4 ) ), list( range( 0x1000, 0x2000, 4 ) ) )
+  th = setup_sim( th, cmdline_opts, False, linetrace=False )
+  while not th.done() and th.sim_cycle_count() < 2000:
+    th.sim_tick()
+  assert th.done()
+  cycles = th.sim_cycle_count()
+
+  counts = {}
+  for sel in [ PERF_HITS, PERF_MISSES, PERF_PREFETCHES, PERF_PF_USEFUL,
+               PERF_PF_USELESS ]:
+    th.perf_sel @= sel
+    th.sim_tick()
+    counts[ sel ] = int( th.perf_count )
+
+  hist = {}
+  for outcome in tracer.hists[ 'rd' ].values():
+    for latency, count in outcome.items():
+      hist[ latency ] = hist.get( latency, 0 ) + count
+  return cycles, LatencyTracer.summary( hist )[ 'mean' ], counts
+
+@pytest.mark.parametrize( "stride", [ 1, 3, -2 ] )
+def test_prefetch_strided( stride, cmdline_opts ):
+  if cmdline_opts['test_verilog']:
+    pytest.skip( "the counters are read by simulation" )
+  base_cycles, base_latency, base = run_strided( stride, {}, cmdline_opts )
+  pf_cycles,   pf_latency,   pf   = run_strided( stride, { 'prefetch_entries': 4 },
+                                                 cmdline_opts )
+
+  assert base[ PERF_HITS ] == 0
+  assert base[ PERF_MISSES ] == PF_READS
+  assert base[ PERF_PREFETCHES ] == 0
+
+  # Once the stride is known every read finds its line prefetched or on
+  # the way. The first reads miss and a new region starts with a guess
+  assert pf[ PERF_HITS ] + pf[ PERF_MISSES ] == PF_READS
+  assert pf[ PERF_MISSES ] <= 3
+  assert pf[ PERF_PF_USEFUL ] >= PF_READS - 4
+  assert pf[ PERF_PF_USELESS ] <= 2
+  assert pf_latency < base_latency / 2
+  assert pf_cycles <= base_cycles
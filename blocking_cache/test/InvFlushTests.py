@@ -119,6 +119,30 @@ def flush_short():
   return SingleCacheTestParams( msg, inv_flush_mem, associativity=2, bitwidth_mem_data=128, 
                                 bitwidth_cache_data=32, cache_size=256 )
 
+def flush_sparse_dirty():
+  # few dirty lines spread over the sets; check they are written back and
+  # stay valid, and that flushing a clean cache is harmless
+  msg =  [
+    #    type   opq addr        len data         type   opq test len data
+    ( 'wr',  1,  0x00000070, 0,  0xa),  ( 'wr',  1,  0,   0,  0 ),
+    ( 'wr',  2,  0x00020030, 0,  0xb),  ( 'wr',  2,  0,   0,  0 ),
+    ( 'rd',  3,  0x00000000, 0,  0),    ( 'rd',  3,  0,   0,  0x01 ),
+    ( 'fl',  4,  0,          0,  0),    ( 'fl',  4,  0,   0,  0 ),
+    ( 'rd',  5,  0x00000070, 0,  0),    ( 'rd',  5,  1,   0,  0xa ),
+    ( 'rd',  6,  0x00020030, 0,  0),    ( 'rd',  6,  1,   0,  0xb ),
+    ( 'fl',  7,  0,          0,  0),    ( 'fl',  7,  0,   0,  0 ),        # nothing dirty
+    ( 'rd',  8,  0x00010070, 0,  0),    ( 'rd',  8,  0,   0,  0 ),
+    ( 'rd',  9,  0x00020070, 0,  0),    ( 'rd',  9,  0,   0,  0 ),        # evicts 0x70
+    ( 'rd',  10, 0x00000070, 0,  0),    ( 'rd',  10, 0,   0,  0xa ),      # was written back
+    ( 'wr',  11, 0x00000000, 0,  0xc),  ( 'wr',  11, 1,   0,  0 ),
+    ( 'fl',  12, 0,          0,  0),    ( 'fl',  12, 0,   0,  0 ),        # only line 0 dirty
+    ( 'rd',  13, 0x00030000, 0,  0),    ( 'rd',  13, 0,   0,  0xd ),
+    ( 'rd',  14, 0x00020000, 0,  0),    ( 'rd',  14, 0,   0,  0x5 ),      # evicts 0x00
+    ( 'rd',  15, 0x00000000, 0,  0),    ( 'rd',  15, 0,   0,  0xc ),
+  ]
+  return SingleCacheTestParams( msg, inv_flush_mem, associativity=2, bitwidth_mem_data=128,
+                                bitwidth_cache_data=32, cache_size=256 )
+
 def flush_last_line1():
   # tests flush on the last line of the cache
   msg =  [
@@ -355,6 +379,8 @@ class InvFlushTests:
     ("256B-2", inv_evict_short,     0,         1,      0,        0   ),
     ("256B-2", invalidation_medium, 0,         1,      0,        0   ),
     ("256B-2", flush_short,         0,         1,      0,        0   ),
+    ("256B-2", flush_sparse_dirty,  0,         1,      0,        0   ),
+    ("256B-2", flush_sparse_dirty,  0.5,       4,      0,        0   ),
     ("32B-1",  flush_last_line1,    0,         1,      0,        0   ),
     ("32B-1",  flush_last_line2,    0,         1,      0,        0   ),
     ("256B-2", inv_flush_short,     0,         1,      0,        0   ),
@@ -14,10 +14,21 @@ from .MultiCacheTestCases import MultiCacheTestCases
 from test.sim_utils import run_sim, MultiCacheTestHarness
 
 class MultiCache_Tests( MultiCacheTestCases ):
+
+  # Extra keyword arguments passed to every BlockingCacheRTL
+  cache_opts = {}
+
   def run_test( s, tp, cmdline_opts, trace=True ):
+    tp.cache_opts = s.cache_opts
     harness = MultiCacheTestHarness( BlockingCacheRTL, tp )
     harness.elaborate()
     if tp.mem != None:
       harness.load()
     sram_wrapper = False
     run_sim( harness, cmdline_opts, trace, sram_wrapper )
+
+class MultiCacheWbBuffer_Tests( MultiCache_Tests ):
+  cache_opts = { 'wb_buffer_entries': 2 }
+
+class MultiCacheVictimCache_Tests( MultiCache_Tests ):
+  cache_opts = { 'victim_lines': 2 }
@@ -14,8 +14,10 @@ import pytest
 from pymtl3 import *
 
 from test.sim_utils import (
-  obw, abw, gen_req_resp, rand_mem, SingleCacheTestParams, mk_req
+  obw, abw, gen_req_resp, rand_mem, SingleCacheTestParams, mk_req,
+  TransactionStream
 )
+from blocking_cache.BlockingCacheFL import ModelCache
 from mem_ifcs.MemMsg import mk_mem_msg, MemMsgType
 
 from constants.constants import *
@@ -33,7 +35,7 @@ random_memory = rand_mem( 0, 0xffff )
 # iterative_memory = iterative_mem( 0, 0xffff )
 
 def random_test_generator( mem, associativity, bitwidth_mem_data, bitwidth_cache_data, 
-                           size, num_trans = 200 ):
+                           size, num_trans = 200, policy = 'lru' ):
   tp = SingleCacheTestParams( False, mem, associativity, bitwidth_mem_data, 
                               bitwidth_cache_data, size )
   max_addr = int( size // 4 * 3 * tp.associativity )
@@ -90,7 +92,7 @@ def random_test_generator( mem, associativity, bitwidth_mem_data, bitwidth_cache
   reqs = mk_req( tp.CacheReqType, reqs )
 
   tp.msg = gen_req_resp( reqs, tp.mem, tp.CacheReqType, tp.CacheRespType, tp.MemReqType,
-                        tp.MemRespType, tp.associativity, tp.size )
+                        tp.MemRespType, tp.associativity, tp.size, policy )
   # print stats
   hits = 0
   for i in range( 1, num_trans, 2 ):
@@ -100,41 +102,98 @@ def random_test_generator( mem, associativity, bitwidth_mem_data, bitwidth_cache
 
   return tp
 
-def dmap_size16_lineb64_datab32():
-  return random_test_generator(random_memory, 1, 64, 32, 16, 500)
+def dmap_size16_lineb64_datab32( policy='lru' ):
+  return random_test_generator(random_memory, 1, 64, 32, 16, 500, policy=policy)
 
-def dmap_size32_lineb128_datab64():
-  return random_test_generator(random_memory, 1, 128, 64, 32, 500)
+def dmap_size32_lineb128_datab64( policy='lru' ):
+  return random_test_generator(random_memory, 1, 128, 64, 32, 500, policy=policy)
 
-def dmap_size32_lineb128_datab128():
-  return random_test_generator(random_memory, 1, 128, 128, 32, 500)
+def dmap_size32_lineb128_datab128( policy='lru' ):
+  return random_test_generator(random_memory, 1, 128, 128, 32, 500, policy=policy)
 
-def asso2_size32_lineb64_datab32():
-  return random_test_generator(random_memory, 2, 64, 32, 32, 500)
+def asso2_size32_lineb64_datab32( policy='lru' ):
+  return random_test_generator(random_memory, 2, 64, 32, 32, 500, policy=policy)
 
-def asso2_size64_lineb128_datab64():
-  return random_test_generator(random_memory, 2, 128, 64, 64, 500)
+def asso2_size64_lineb128_datab64( policy='lru' ):
+  return random_test_generator(random_memory, 2, 128, 64, 64, 500, policy=policy)
 
-def asso2_size64_lineb128_datab128():
-  return random_test_generator(random_memory, 2, 128, 128, 64, 500)
+def asso2_size64_lineb128_datab128( policy='lru' ):
+  return random_test_generator(random_memory, 2, 128, 128, 64, 500, policy=policy)
 
-def asso2_size4096_lineb128_datab128():
-  return random_test_generator(random_memory, 2, 128, 128, 4096, 200)
+def asso2_size4096_lineb128_datab128( policy='lru' ):
+  return random_test_generator(random_memory, 2, 128, 128, 4096, 200, policy=policy)
 
-def asso2_size4096_lineb128_datab32():
-  return random_test_generator(random_memory, 2, 128, 32, 4096, 200)
+def asso2_size4096_lineb128_datab32( policy='lru' ):
+  return random_test_generator(random_memory, 2, 128, 32, 4096, 200, policy=policy)
 
-def dmap_size4096_lineb128_datab128():
-  return random_test_generator(random_memory, 1, 128, 128, 4096, 200)
+def dmap_size4096_lineb128_datab128( policy='lru' ):
+  return random_test_generator(random_memory, 1, 128, 128, 4096, 200, policy=policy)
 
-def dmap_size4096_lineb128_datab32():
-  return random_test_generator(random_memory, 1, 128, 32, 4096, 200)
+def dmap_size4096_lineb128_datab32( policy='lru' ):
+  return random_test_generator(random_memory, 1, 128, 32, 4096, 200, policy=policy)
+
+def asso4_size256_lineb128_datab32( policy='lru' ):
+  return random_test_generator(random_memory, 4, 128, 32, 256, 500, policy=policy)
+
+def asso8_size512_lineb128_datab64( policy='lru' ):
+  return random_test_generator(random_memory, 8, 128, 64, 512, 500, policy=policy)
+
+#-------------------------------------------------------------------------
+# Streamed random tests
+#-------------------------------------------------------------------------
+# Long traces are generated lazily and checked against ModelCache.stream,
+# so neither the requests nor the expected responses are materialized.
+
+def random_trace( seed, num_trans, max_addr, bitwidth_cache_data ):
+  rng = random.Random( seed )
+  types = [ MemMsgType.READ, MemMsgType.WRITE, MemMsgType.AMO_ADD,
+            MemMsgType.AMO_SWAP, MemMsgType.AMO_MAXU, MemMsgType.INV,
+            MemMsgType.FLUSH ]
+  weights = [ 0.46, 0.46, 0.02, 0.01, 0.01, 0.02, 0.02 ]
+  max_len_order = clog2( bitwidth_cache_data//8 )
+  for i in range( num_trans ):
+    type_ = rng.choices( types, weights )[0]
+    if type_ == MemMsgType.INV or type_ == MemMsgType.FLUSH:
+      yield type_, 0, 0, 0
+      continue
+    data = rng.randint( 0, 0xffffffff )
+    addr = rng.randint( 0, max_addr )
+    if MemMsgType.AMO_ADD <= type_ <= MemMsgType.AMO_XOR:
+      len_ = 0 if bitwidth_cache_data == 32 else 4
+      yield type_, addr & 0xfffffffc, len_, data
+      continue
+    len_ = 2**rng.randint( 0, 2 if type_ == MemMsgType.WRITE else max_len_order )
+    addr = addr & ~( len_ - 1 )
+    # A full width access is encoded as len 0
+    yield type_, addr, len_ & ( ( bitwidth_cache_data >> 3 ) - 1 ), data
+
+def random_stream_generator( mem, associativity, bitwidth_mem_data,
+                             bitwidth_cache_data, size, num_trans, policy='lru' ):
+  tp = SingleCacheTestParams( False, mem, associativity, bitwidth_mem_data,
+                              bitwidth_cache_data, size )
+  max_addr = int( size // 4 * 3 * tp.associativity )
+  cache = ModelCache( tp.size, tp.associativity, 0, tp.CacheReqType,
+                      tp.CacheRespType, tp.MemReqType, tp.MemRespType, tp.mem,
+                      policy=policy )
+  trace = random_trace( num_trans, num_trans, max_addr, bitwidth_cache_data )
+  tp.msg = TransactionStream( cache.stream( trace ) )
+  return tp
+
+def stream_asso2_size64_lineb128_datab32( policy='lru' ):
+  return random_stream_generator(random_memory, 2, 128, 32, 64, 1000, policy=policy)
+
+def stream_dmap_size32_lineb128_datab128( policy='lru' ):
+  return random_stream_generator(random_memory, 1, 128, 128, 32, 1000, policy=policy)
 
 #-------------------------------------------------------------------------
 # Test driver
 #-------------------------------------------------------------------------
 
 class RandomTests:
+  # Options of the cache under test. The FL model that generates the
+  # expected responses follows its replacement policy
+  cache_opts = {}
+
   @pytest.mark.parametrize(
     " name,  test,                            stall_prob,latency,src_delay,sink_delay", [
     ("16B",  dmap_size16_lineb64_datab32,     0,         1,      0,        0   ),
@@ -156,10 +215,26 @@ class RandomTests:
     ("64B",  asso2_size64_lineb128_datab128,  0,         2,      1,        2   ),
     ("4KB",  asso2_size4096_lineb128_datab128,0,         2,      1,        2   ),
     ("4KB",  asso2_size4096_lineb128_datab32, 0,         2,      1,        2   ),
+    ("256B", asso4_size256_lineb128_datab32,  0,         1,      0,        0   ),
+    ("512B", asso8_size512_lineb128_datab64,  0,         1,      0,        0   ),
+    ("256B", asso4_size256_lineb128_datab32,  0,         2,      1,        2   ),
+    ("512B", asso8_size512_lineb128_datab64,  0,         2,      1,        2   ),
   ])
   def test_random( s, name, test, stall_prob, latency, src_delay, sink_delay,
                    cmdline_opts, line_trace ):
-    p = test()
+    p = test( s.cache_opts.get( 'replacement_policy', 'lru' ) )
     s.run_test( p.msg, p.mem, p.CacheReqType, p.CacheRespType, p.MemReqType, p.MemRespType, 
                 p.associativity, p.size, stall_prob, latency, src_delay, sink_delay, 
                 cmdline_opts, line_trace )
+
+  @pytest.mark.parametrize(
+    " name,  test,                                  stall_prob,latency,src_delay,sink_delay", [
+    ("64B",  stream_asso2_size64_lineb128_datab32,  0,         1,      0,        0   ),
+    ("32B",  stream_dmap_size32_lineb128_datab128,  0,         2,      1,        2   ),
+  ])
+  def test_random_stream( s, name, test, stall_prob, latency, src_delay, sink_delay,
+                          cmdline_opts, line_trace ):
+    p = test( s.cache_opts.get( 'replacement_policy', 'lru' ) )
+    s.run_test( p.msg, p.mem, p.CacheReqType, p.CacheRespType, p.MemReqType, p.MemRespType,
+                p.associativity, p.size, stall_prob, latency, src_delay, sink_delay,
+                cmdline_opts, line_trace )
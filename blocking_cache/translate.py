@@ -45,6 +45,14 @@ def parse_cmdline():
   p.add_argument( "--obw", default=8, type=int )
   p.add_argument( "--asso", default=2, type=int )
   p.add_argument( '--replace-sram', action='store_true', help="Replace SRAM model with real SRAM wrapper" )
+  p.add_argument( '--dirty-line-index', action='store_true', help="Let flush skip clean lines" )
+  p.add_argument( '--replacement-policy', default='lru', choices=[ 'lru', 'plru', 'fifo' ] )
+  p.add_argument( '--mshr-entries', default=1, type=int, help="More than one makes the cache nonblocking" )
+  p.add_argument( '--hit-under-miss', action='store_true', help="Serve hits under a single refill" )
+  p.add_argument( '--wb-buffer-entries', default=0, type=int, help="Write-back buffer entries (0 for none)" )
+  p.add_argument( '--victim-lines', default=0, type=int, help="Victim cache lines (0 for none)" )
+  p.add_argument( '--prefetch-entries', default=0, type=int, help="Prefetcher table entries (0 for none)" )
+  p.add_argument( '--perf-counters', action='store_true', help="Add the performance counter debug port" )
   opts = p.parse_args()
   return opts
 
@@ -84,9 +92,33 @@ def main( opts ):
   MemReqType, MemRespType = mk_mem_msg(opts.obw, opts.abw, opts.clw)
   # Instantiate the cache
   dut = BlockingCacheRTL( CacheReqType, CacheRespType, MemReqType,
-                          MemRespType, opts.size, opts.asso )
+                          MemRespType, opts.size, opts.asso,
+                          dirty_line_index=opts.dirty_line_index,
+                          replacement_policy=opts.replacement_policy,
+                          mshr_entries=opts.mshr_entries,
+                          hit_under_miss=opts.hit_under_miss,
+                          perf_counters=opts.perf_counters,
+                          wb_buffer_entries=opts.wb_buffer_entries,
+                          victim_lines=opts.victim_lines,
+                          prefetch_entries=opts.prefetch_entries )
   success = False
   module_name = f"BlockingCache_{opts.size}_{opts.clw}_{opts.abw}_{opts.dbw}_{opts.asso}"
+  if opts.dirty_line_index:
+    module_name += "_dli"
+  if opts.replacement_policy != 'lru':
+    module_name += f"_{opts.replacement_policy}"
+  if opts.hit_under_miss:
+    module_name += "_hum"
+  elif opts.mshr_entries > 1:
+    module_name += f"_mshr{opts.mshr_entries}"
+  if opts.wb_buffer_entries:
+    module_name += f"_wbb{opts.wb_buffer_entries}"
+  if opts.victim_lines:
+    module_name += f"_vc{opts.victim_lines}"
+  if opts.prefetch_entries:
+    module_name += f"_pf{opts.prefetch_entries}"
+  if opts.perf_counters:
+    module_name += "_perf"
   file_name = module_name + ".v"
 
   dut.set_metadata( VerilogTranslationPass.enable, True )
@@ -1,4 +1,3 @@
-  
 """
 =========================================================================
  MSHR.py
@@ -19,6 +18,24 @@ class MSHR(Component):
   Blocks if all entries all filled
 
   For blocking cache, it is 1 entry
+
+  For nonblocking cache (p.nonblocking), every entry has a valid bit and
+  its index is the id sent out as the memreq opaque, so the memresp opaque
+  picks the entry to deallocate. An entry is either
+    a primary miss   : the refill is in flight
+    a secondary miss : a later miss to the same line as a primary. It waits
+                       until the primary deallocates and is then retried
+                       through the pipeline, oldest first
+    a parked miss    : a miss while p.max_refills refills are in flight. It
+                       is retried once any primary deallocates
+  A secondary miss to the line of a prefetch takes over the prefetch entry
+  instead (alloc_promote): the refill then replays the miss, keeping the
+  way the prefetch picked.
+  The ctrl uses the lookups below to merge secondaries (pending) or take
+  over prefetches (pending_prefetch), to park
+  misses (refill_full), to hold requests to a set with a miss to another
+  line (conflict) and to hold prefetches to a set with any miss or when
+  only one entry is free (prefetch_busy).
   """
   def construct( s, p, entries ):
     s.alloc_en    = InPort ()
@@ -31,37 +48,215 @@ class MSHR(Component):
     s.dealloc_out = OutPort(p.MSHRMsg)
     s.empty       = OutPort() # high when no more secondary misses?
 
-    # Number of free MSHR Entries
-    bitwidth_entries = clog2(entries + 1)
-    s.num_entries_in  = Wire(bitwidth_entries)
-    s.num_entries_reg = m = RegRst(bitwidth_entries)
-    m.in_ //= s.num_entries_in
-
-    @update
-    def entry_logic():
-      if s.alloc_en:    # No parallel alloc/dealloc
-        s.num_entries_in @= s.num_entries_reg.out + 1
-      elif s.dealloc_en:
-        s.num_entries_in @= s.num_entries_reg.out - 1
-      else:
-        s.num_entries_in @= s.num_entries_reg.out
+    # Nonblocking cache only
+    s.alloc_secondary = InPort ()
+    s.alloc_parked    = InPort ()
+    s.alloc_promote   = InPort ()
+    s.pending_addr    = InPort (p.bitwidth_addr)
+    s.pending         = OutPort() # line of pending_addr has a miss in flight
+    s.pending_prefetch = OutPort() # that miss is a prefetch
+    s.conflict_addr   = InPort (p.bitwidth_addr)
+    s.conflict        = OutPort() # set of conflict_addr has a miss to another line
+    s.prefetch_addr   = InPort (p.bitwidth_addr)
+    s.prefetch_busy   = OutPort() # set of prefetch_addr has a miss, or one entry is free
+    s.refill_full     = OutPort() # no more refills allowed in flight
+    s.retry_val       = OutPort() # a secondary miss is ready to retry
+    s.retry_id        = OutPort(p.bitwidth_opaque)
+
+    if not p.nonblocking:
+      # Number of free MSHR Entries
+      bitwidth_entries = clog2(entries + 1)
+      s.num_entries_in  = Wire(bitwidth_entries)
+      s.num_entries_reg = m = RegRst(bitwidth_entries)
+      m.in_ //= s.num_entries_in
+
+      @update
+      def entry_logic():
+        if s.alloc_en:    # No parallel alloc/dealloc
+          s.num_entries_in @= s.num_entries_reg.out + 1
+        elif s.dealloc_en:
+          s.num_entries_in @= s.num_entries_reg.out - 1
+        else:
+          s.num_entries_in @= s.num_entries_reg.out
+
+      @update
+      def full_logic():
+        # Considered full if num entries is equal to max entries or if we
+        # have one less and are allocating an entry
+        s.full  @= (s.num_entries_reg.out == entries) | ((s.num_entries_reg.out == entries-1) & s.alloc_en)
+        s.empty @= (s.num_entries_reg.out == 0)
+
+      if entries == 1:
+        s.storage_regs = m = RegEnRst( p.MSHRMsg, p.MSHRMsg() )
+        m.in_ //= s.alloc_in
+        m.out //= s.dealloc_out
+        m.en  //= s.alloc_en
+
+        s.alloc_id //= s.alloc_in.opaque
+
+      s.pending     //= 0
+      s.pending_prefetch //= 0
+      s.conflict    //= 0
+      s.prefetch_busy //= 0
+      s.refill_full //= 0
+      s.retry_val //= 0
+      s.retry_id  //= 0
+
+    else:
+      BitsEntries = mk_bits( entries )
+      BitsOpaque  = p.BitsOpaque
+      line_bits = slice( p.bitwidth_offset, p.bitwidth_addr )
+      idx_bits  = slice( p.bitwidth_offset, p.bitwidth_offset + p.bitwidth_index )
+
+      s.entry_regs = [ RegEn( p.MSHRMsg ) for _ in range( entries ) ]
+      s.valid      = [ RegRst( Bits1 ) for _ in range( entries ) ]
+      s.secondary  = [ RegRst( Bits1 ) for _ in range( entries ) ]
+      s.parked     = [ RegRst( Bits1 ) for _ in range( entries ) ]
+      # Line is not in the cache yet
+      s.waiting    = [ RegRst( Bits1 ) for _ in range( entries ) ]
+      # older[i][j]: entry j was allocated before entry i
+      s.older      = [ RegRst( BitsEntries ) for _ in range( entries ) ]
 
-    @update
-    def full_logic():
-      # Considered full if num entries is equal to max entries or if we
-      # have one less and are allocating an entry
-      s.full  @= (s.num_entries_reg.out == entries) | ((s.num_entries_reg.out == entries-1) & s.alloc_en)
-      s.empty @= (s.num_entries_reg.out == 0)
+      s.valid_vec  = Wire( BitsEntries )
+      s.ready_vec  = Wire( BitsEntries )
+      s.free_vec   = Wire( BitsEntries )
+      s.alloc_vec  = Wire( BitsEntries )
+      s.alloc_slot = Wire( p.bitwidth_opaque )
+      s.alloc_new  = Wire( BitsEntries ) # entries taken by the alloc
+      s.alloc_msg  = Wire( p.MSHRMsg )
+      s.pending_slot = Wire( p.bitwidth_opaque )
+      s.dealloc_secondary = Wire()
+      s.free_left  = Wire( BitsEntries ) # free entries but one after alloc
+
+      for i in range( entries ):
+        s.entry_regs[i].in_ //= s.alloc_msg
+        s.entry_regs[i].en  //= s.alloc_vec[i]
+        s.valid_vec[i]      //= s.valid[i].out
+
+      s.alloc_id //= s.alloc_slot
+
+      # Allocate the lowest free entry, or rewrite the prefetch entry
+      @update
+      def alloc_slot_logic():
+        s.alloc_slot @= 0
+        for i in range( entries ):
+          if ~s.valid_vec[ entries - 1 - i ]:
+            s.alloc_slot @= BitsOpaque( entries - 1 - i )
+        if s.alloc_promote:
+          s.alloc_slot @= s.pending_slot
+        s.alloc_vec @= 0
+        if s.alloc_en:
+          for i in range( entries ):
+            if s.alloc_slot == i:
+              s.alloc_vec[i] @= 1
+        s.alloc_new @= 0
+        if ~s.alloc_promote:
+          s.alloc_new @= s.alloc_vec
+
+      @update
+      def alloc_msg_logic():
+        s.alloc_msg @= s.alloc_in
+        for i in range( entries ):
+          if s.alloc_promote & ( s.pending_slot == i ):
+            s.alloc_msg.repl       @= s.entry_regs[i].out.repl
+            s.alloc_msg.dirty_bits @= s.entry_regs[i].out.dirty_bits
+
+      @update
+      def dealloc_out_logic():
+        s.dealloc_out       @= s.entry_regs[0].out
+        s.dealloc_secondary @= s.secondary[0].out
+        for i in range( 1, entries ):
+          if s.dealloc_id == i:
+            s.dealloc_out       @= s.entry_regs[i].out
+            s.dealloc_secondary @= s.secondary[i].out
+
+      @update
+      def entry_next_state_logic():
+        for i in range( entries ):
+          s.valid[i].in_     @= s.valid[i].out
+          s.secondary[i].in_ @= s.secondary[i].out
+          s.parked[i].in_    @= s.parked[i].out
+          s.waiting[i].in_   @= s.waiting[i].out
+          # A newer entry may reuse a freed slot
+          s.older[i].in_     @= s.older[i].out & ~s.alloc_new
+          if s.dealloc_en & ( s.dealloc_id == i ):
+            s.valid[i].in_ @= 0
+          # The refill of a primary is done, wake up its secondaries and
+          # the parked misses
+          if ( s.dealloc_en & ~s.dealloc_secondary & s.secondary[i].out &
+               ( s.parked[i].out | ( s.entry_regs[i].out.addr[ line_bits ] ==
+                                     s.dealloc_out.addr[ line_bits ] ) ) ):
+            s.waiting[i].in_ @= 0
+          if s.alloc_new[i]:
+            s.valid[i].in_     @= 1
+            s.secondary[i].in_ @= s.alloc_secondary | s.alloc_parked
+            s.parked[i].in_    @= s.alloc_parked
+            s.waiting[i].in_   @= 1
+            s.older[i].in_     @= s.valid_vec
+
+      @update
+      def lookup_logic():
+        s.pending  @= 0
+        s.pending_prefetch @= 0
+        s.pending_slot     @= 0
+        s.conflict @= 0
+        s.prefetch_busy @= s.free_left == 0
+        for i in range( entries ):
+          if s.valid_vec[i]:
+            if ( s.entry_regs[i].out.addr[ idx_bits ] ==
+                 s.prefetch_addr[ idx_bits ] ):
+              s.prefetch_busy @= 1
+            if ( ~s.secondary[i].out & ( s.entry_regs[i].out.addr[ line_bits ] ==
+                                         s.pending_addr[ line_bits ] ) ):
+              s.pending @= 1
+              s.pending_prefetch @= s.entry_regs[i].out.prefetch
+              s.pending_slot     @= BitsOpaque( i )
+            if ( ( s.entry_regs[i].out.addr[ idx_bits ] ==
+                   s.conflict_addr[ idx_bits ] ) &
+                 ( s.entry_regs[i].out.addr[ line_bits ] !=
+                   s.conflict_addr[ line_bits ] ) ):
+              s.conflict @= 1
+
+      if p.max_refills < entries:
+        s.num_refills = Wire( clog2( entries + 1 ) )
+
+        @update
+        def refill_full_logic():
+          s.num_refills @= 0
+          for i in range( entries ):
+            if s.valid[i].out & ~s.secondary[i].out:
+              s.num_refills @= s.num_refills + 1
+          s.refill_full @= s.num_refills >= p.max_refills
+      else:
+        s.refill_full //= 0
 
-    if entries == 1:
-      s.storage_regs = m = RegEnRst( p.MSHRMsg, p.MSHRMsg() )
-      m.in_ //= s.alloc_in
-      m.out //= s.dealloc_out
-      m.en  //= s.alloc_en
+      # Retry the oldest secondary whose line has been refilled
+      @update
+      def retry_logic():
+        for i in range( entries ):
+          s.ready_vec[i] @= s.valid[i].out & s.secondary[i].out & ~s.waiting[i].out
+        s.retry_val @= s.ready_vec != 0
+        s.retry_id  @= 0
+        for i in range( entries ):
+          if s.ready_vec[i] & ( ( s.older[i].out & s.ready_vec ) == 0 ):
+            s.retry_id @= BitsOpaque( i )
 
-      s.alloc_id //= s.alloc_in.opaque
+      @update
+      def free_entry_logic():
+        # Full if no entry is free, or one is free and we are allocating it
+        s.free_vec @= ~s.valid_vec
+        s.full     @= ( ( s.free_vec == 0 ) |
+                        ( s.alloc_en & ( ( s.free_vec & ( s.free_vec - 1 ) ) == 0 ) ) )
+        s.empty    @= s.valid_vec == 0
+        # A prefetch leaves the last entry to the processor
+        s.free_left @= s.free_vec & ( s.free_vec - 1 )
+        if s.alloc_en:
+          s.free_left @= s.free_left & ( s.free_left - 1 )
 
   def line_trace(s):
     msg = ""
-    msg += f" c:{s.num_entries_reg.out}"
+    if hasattr( s, 'num_entries_reg' ):
+      msg += f" c:{s.num_entries_reg.out}"
+    else:
+      msg += f" v:{s.valid_vec}"
     return msg
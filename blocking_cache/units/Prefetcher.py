@@ -0,0 +1,277 @@
+"""
+=========================================================================
+ Prefetcher.py
+=========================================================================
+Next-line and stride prefetch engine next to the MSHR
+
+Date   : 17 October 2026
+"""
+
+from pymtl3                  import *
+from pymtl3.stdlib.basic_rtl import RegEn, RegRst
+
+from ..cache_constants import (
+  PREFETCH_REGION_NBITS, PREFETCH_CONF_NBITS, PREFETCH_ACC_NBITS
+)
+
+class Prefetcher( Component ):
+  """
+  Trains on the demand accesses that leave M2 and proposes the next line
+  to prefetch. The processor sends no PC, so strides are tracked per
+  region of 2**PREFETCH_REGION_NBITS bytes in a table of entries regions.
+  Misses and the first hit on a prefetched line train the region of the
+  access:
+    new region  : the candidate is the next line
+    same stride : the stride is confirmed, its confidence goes up
+    new stride  : the confidence goes down, or the stride is replaced if
+                  it is zero already
+  The candidates are the lines one stride ahead and, for each level of
+  confidence, one more stride ahead, as long as they are in the same
+  region. The ctrl takes them into M0 one by one when the pipeline has a
+  free slot (issue_en); lines prefetched already are skipped.
+
+  Prefetches that went out to memory (record_en) are remembered in a
+  second table of entries lines. A demand access to one of them is useful
+  if it hits and useless if the line has been evicted already; so is a
+  line that drops out of the table unused. An accuracy counter goes up on
+  useful and down on useless prefetches and throttles the prefetcher at
+  zero: only candidates of strides with full confidence are issued then.
+  """
+  def construct( s, p, entries ):
+    s.access_addr = InPort (p.bitwidth_addr) # access in M2
+    s.train_en    = InPort () # a demand read/write leaves M2
+    s.train_hit   = InPort ()
+    s.record_en   = InPort () # a prefetch leaves M2 for memory
+    s.clear       = InPort () # forgets the prefetched lines
+
+    s.issue_val   = OutPort()
+    s.issue_addr  = OutPort(p.bitwidth_addr)
+    s.issue_en    = InPort ()
+
+    s.useful      = OutPort()
+    s.useless     = OutPort()
+
+    assert p.bitwidth_offset < PREFETCH_REGION_NBITS < p.bitwidth_addr
+
+    lo   = p.bitwidth_offset
+    rlo  = PREFETCH_REGION_NBITS
+    hi   = p.bitwidth_addr
+    offw = rlo - lo # bits of a line within its region
+    sw   = offw + 1 # bits of a stride
+
+    BitsPtr    = mk_bits( max( 1, clog2( entries ) ) )
+    BitsValid  = mk_bits( entries )
+    BitsOff    = mk_bits( offw )
+    BitsStride = mk_bits( sw ) # in lines, signed
+    BitsConf   = mk_bits( PREFETCH_CONF_NBITS )
+    BitsAcc    = mk_bits( PREFETCH_ACC_NBITS )
+    last       = entries - 1
+
+    #---------------------------------------------------------------------
+    # Stride table
+    #---------------------------------------------------------------------
+
+    s.st_region = [ RegEn(hi - rlo)   for _ in range(entries) ]
+    s.st_last   = [ RegEn(BitsOff)    for _ in range(entries) ]
+    s.st_stride = [ RegEn(BitsStride) for _ in range(entries) ]
+    s.st_conf   = [ RegEn(BitsConf)   for _ in range(entries) ]
+    s.st_valid  = RegRst(BitsValid)
+    s.st_ptr    = RegRst(BitsPtr) # next entry to replace
+
+    # Entry of the region of the access, or the one to replace
+    s.st_hit     = Wire()
+    s.st_slot    = Wire(BitsPtr)
+    s.sel_last   = Wire(BitsOff)
+    s.sel_stride = Wire(BitsStride)
+    s.sel_conf   = Wire(BitsConf)
+
+    @update
+    def pf_lookup_logic():
+      s.st_hit     @= 0
+      s.st_slot    @= s.st_ptr.out
+      s.sel_last   @= 0
+      s.sel_stride @= 0
+      s.sel_conf   @= 0
+      for i in range(entries):
+        if s.st_valid.out[i] & ( s.st_region[i].out == s.access_addr[rlo:hi] ):
+          s.st_hit     @= 1
+          s.st_slot    @= i
+          s.sel_last   @= s.st_last[i].out
+          s.sel_stride @= s.st_stride[i].out
+          s.sel_conf   @= s.st_conf[i].out
+
+    # Trained stride and confidence, and the candidate line in the region
+    s.delta  = Wire(BitsStride)
+    s.stride = Wire(BitsStride)
+    s.conf   = Wire(BitsConf)
+    s.cand   = Wire(BitsStride)
+
+    @update
+    def pf_stride_logic():
+      s.delta  @= zext( s.access_addr[lo:rlo], sw ) - zext( s.sel_last, sw )
+      s.stride @= 1
+      s.conf   @= 0
+      if s.st_hit:
+        s.stride @= s.sel_stride
+        s.conf   @= s.sel_conf
+        if s.delta == s.sel_stride:
+          if s.sel_conf != BitsConf(-1):
+            s.conf @= s.sel_conf + 1
+        elif s.sel_conf != 0:
+          s.conf @= s.sel_conf - 1
+        elif s.delta != 0:
+          s.stride @= s.delta
+      s.cand @= zext( s.access_addr[lo:rlo], sw ) + s.stride
+
+    #---------------------------------------------------------------------
+    # Prefetched lines
+    #---------------------------------------------------------------------
+
+    s.pf_lines = [ RegEn(hi - lo) for _ in range(entries) ]
+    s.pf_valid = RegRst(BitsValid)
+    s.pf_ptr   = RegRst(BitsPtr) # next entry to replace
+
+    s.cand_val    = RegRst(1)
+    s.cand_region = RegEn(hi - rlo)
+    s.cand_addr   = Wire(p.bitwidth_addr)
+
+    s.pf_match = Wire(BitsValid)
+    s.tracked  = Wire() # the access is to a prefetched line
+    s.pending  = Wire() # the candidate is a prefetched line
+
+    @update
+    def pf_track_logic():
+      s.tracked @= 0
+      s.pending @= 0
+      for i in range(entries):
+        s.pf_match[i] @= s.pf_valid.out[i] & ( s.pf_lines[i].out == s.access_addr[lo:hi] )
+        if s.pf_match[i]:
+          s.tracked @= 1
+        if s.pf_valid.out[i] & ( s.pf_lines[i].out == s.cand_addr[lo:hi] ):
+          s.pending @= 1
+
+    s.useful  //= lambda: s.train_en & s.tracked & s.train_hit
+    s.useless //= lambda: ( ( s.train_en & s.tracked & ~s.train_hit ) |
+                            ( s.record_en & s.pf_valid.out[s.pf_ptr.out] ) )
+
+    for i in range(entries):
+      s.pf_lines[i].in_ //= s.access_addr[lo:hi]
+
+    @update
+    def pf_record_logic():
+      for i in range(entries):
+        s.pf_lines[i].en @= s.record_en & ( s.pf_ptr.out == i )
+      s.pf_ptr.in_ @= s.pf_ptr.out
+      if s.record_en:
+        if s.pf_ptr.out == last:
+          s.pf_ptr.in_ @= 0
+        else:
+          s.pf_ptr.in_ @= s.pf_ptr.out + 1
+
+    @update
+    def pf_valid_logic():
+      s.pf_valid.in_ @= s.pf_valid.out
+      if s.clear:
+        s.pf_valid.in_ @= 0
+      else:
+        for i in range(entries):
+          if s.train_en & s.pf_match[i]:
+            s.pf_valid.in_[i] @= 0
+          if s.record_en & ( s.pf_ptr.out == i ):
+            s.pf_valid.in_[i] @= 1
+
+    #---------------------------------------------------------------------
+    # Throttle
+    #---------------------------------------------------------------------
+
+    s.acc = RegRst(BitsAcc, reset_value=BitsAcc(1 << (PREFETCH_ACC_NBITS - 1)))
+
+    @update
+    def pf_acc_logic():
+      s.acc.in_ @= s.acc.out
+      if s.useful & ( s.acc.out != BitsAcc(-1) ):
+        s.acc.in_ @= s.acc.out + 1
+      elif s.useless & ( s.acc.out != 0 ):
+        s.acc.in_ @= s.acc.out - 1
+
+    #---------------------------------------------------------------------
+    # Training and candidate
+    #---------------------------------------------------------------------
+
+    s.train_go = Wire()
+    s.cand_go  = Wire()
+
+    s.train_go //= lambda: s.train_en & ( ~s.train_hit | s.tracked )
+    s.cand_go  //= lambda: ( s.train_go & ~s.cand[offw] &
+                             ~( s.st_hit & ( s.delta == 0 ) ) &
+                             ( ( s.acc.out != 0 ) | ( s.conf == BitsConf(-1) ) ) )
+
+    for i in range(entries):
+      s.st_region[i].in_ //= s.access_addr[rlo:hi]
+      s.st_last[i].in_   //= s.access_addr[lo:rlo]
+      s.st_stride[i].in_ //= s.stride
+      s.st_conf[i].in_   //= s.conf
+
+    @update
+    def pf_train_logic():
+      for i in range(entries):
+        s.st_region[i].en @= s.train_go & ( s.st_slot == i )
+        s.st_last[i].en   @= s.train_go & ( s.st_slot == i )
+        s.st_stride[i].en @= s.train_go & ( s.st_slot == i )
+        s.st_conf[i].en   @= s.train_go & ( s.st_slot == i )
+      s.st_valid.in_ @= s.st_valid.out
+      if s.train_go:
+        s.st_valid.in_[s.st_slot] @= 1
+      # A new region replaces the entries round robin
+      s.st_ptr.in_ @= s.st_ptr.out
+      if s.train_go & ~s.st_hit:
+        if s.st_ptr.out == last:
+          s.st_ptr.in_ @= 0
+        else:
+          s.st_ptr.in_ @= s.st_ptr.out + 1
+
+    # The candidate runs ahead of the access by one line per confidence
+    # level: once issued, or skipped because its line has been prefetched
+    # already, it moves on by the stride until it leaves the region
+    lw       = PREFETCH_CONF_NBITS + 1
+    BitsLeft = mk_bits( lw )
+
+    s.cand_off    = RegEn(BitsOff)
+    s.cand_stride = RegEn(BitsStride)
+    s.cand_left   = RegRst(BitsLeft) # candidates left after this one
+    s.cand_next   = Wire(BitsStride)
+    s.cand_step   = Wire()
+
+    s.cand_next //= lambda: zext( s.cand_off.out, sw ) + s.cand_stride.out
+    s.cand_step //= lambda: s.cand_val.out & ( s.issue_en | s.pending )
+
+    @update
+    def pf_cand_logic():
+      s.cand_region.en   @= s.cand_go
+      s.cand_stride.en   @= s.cand_go
+      s.cand_off.en      @= s.cand_go | s.cand_step
+      s.cand_off.in_     @= s.cand_next[0:offw]
+      s.cand_val.in_     @= s.cand_val.out
+      s.cand_left.in_    @= s.cand_left.out
+      if s.cand_go:
+        s.cand_off.in_   @= s.cand[0:offw]
+        s.cand_val.in_   @= 1
+        s.cand_left.in_  @= zext( s.conf, lw )
+      elif s.clear:
+        s.cand_val.in_   @= 0
+      elif s.cand_step:
+        s.cand_left.in_  @= s.cand_left.out - 1
+        if ( s.cand_left.out == 0 ) | s.cand_next[offw]:
+          s.cand_val.in_ @= 0
+
+    s.cand_region.in_ //= s.access_addr[rlo:hi]
+    s.cand_stride.in_ //= s.stride
+
+    zero_offset = p.BitsOffset(0)
+    s.cand_addr //= lambda: concat( s.cand_region.out, s.cand_off.out, zero_offset )
+
+    s.issue_val  //= lambda: s.cand_val.out & ~s.pending
+    s.issue_addr //= s.cand_addr
+
+  def line_trace( s ):
+    return f'pf[{s.st_valid.out}|{s.pf_valid.out}|{s.acc.out}]'
@@ -13,40 +13,145 @@ from pymtl3.stdlib.basic_rtl import RegEnRst, RegRst
 
 class ReplacementPolicy (Component):
   """
-  Given an input of histories for past accesses (LRU bits),
-  output the way number that should have its cache line
-  replaced.
+  Given the replacement state of a set, output the way number that should
+  have its cache line replaced and the next state after an access.
+
+  Supported policies (the per-set state is p.bitwidth_rep bits wide):
+    'lru'  : true LRU with an age matrix. One bit per pair of ways i < j,
+             set when way j is older than way i.
+    'plru' : tree pseudo-LRU. One bit per internal node of a binary tree
+             stored in heap order (node n has children 2n+1 and 2n+2); a
+             bit points to the child holding the victim.
+    'fifo' : round-robin pointer to the next way to fill.
+
+  For 2 ways 'lru' and 'plru' are the same single bit that holds the way
+  to replace. An access can be
+    a miss   : ~repreq_is_hit                   , the victim way is filled
+    a hit    : repreq_is_hit  & ~repreq_is_inval, repreq_hit_ptr was used
+    an inval : repreq_is_inval                  , repreq_hit_ptr was
+               invalidated and should be replaced next (not used by fifo)
 
-  Latency sensitive - do not expect to be problems?
   Base two associativity only
   """
-  def construct(s, p, policy = 0):
-    # policy 0 = LRU policy
-    # More area efficient policies include FIFO
-    s.repreq_en      = InPort()
-    s.repreq_rdy     = OutPort()
-    s.repreq_hit_ptr = InPort(p.bitwidth_clog_asso)
-    s.repreq_is_hit  = InPort()
-    s.repreq_ptr     = InPort(p.bitwidth_clog_asso)
-    s.represp_ptr    = OutPort(p.bitwidth_clog_asso)
-    
+  def construct(s, p, policy = 'lru'):
+    s.repreq_en       = InPort()
+    s.repreq_rdy      = OutPort()
+    s.repreq_hit_ptr  = InPort(p.bitwidth_clog_asso)
+    s.repreq_is_hit   = InPort()
+    s.repreq_is_inval = InPort()
+    s.repreq_state    = InPort(p.bitwidth_rep)
+    s.represp_state   = OutPort(p.bitwidth_rep)
+    s.represp_victim  = OutPort(p.bitwidth_clog_asso)
+
     s.repreq_rdy //= 1
 
-    if p.associativity == 2:
-      # if policy == 0: # LRU - flip bit when hit or miss
-      # LRU for 2 way is extra simple since we don't need
-      # to keep track
+    nways  = p.associativity
+    levels = p.bitwidth_clog_asso
+
+    # Way whose state is updated by this access
+    s.target_way = Wire(p.bitwidth_clog_asso)
+
+    @update
+    def target_way_logic():
+      if s.repreq_is_hit | s.repreq_is_inval:
+        s.target_way @= s.repreq_hit_ptr
+      else:
+        s.target_way @= s.represp_victim
+
+    if nways == 1:
+      s.represp_victim //= 0
+      s.represp_state  //= 0
+
+    elif policy == 'fifo':
+      s.represp_victim //= s.repreq_state
+
+      @update
+      def fifo_state_logic():
+        s.represp_state @= s.repreq_state
+        if ~s.repreq_is_hit & ~s.repreq_is_inval:
+          s.represp_state @= s.repreq_state + 1
+
+    elif policy == 'plru':
+      # Walk the tree from the root: node n goes to child 2n+1+bit. The
+      # leaves are numbered nways-1 ... 2*nways-2, the inner nodes fit in
+      # the low levels bits.
+      BitsNode = mk_bits( levels + 1 )
+      s.victim_node = [ Wire( BitsNode ) for _ in range( levels + 1 ) ]
+      s.target_node = [ Wire( BitsNode ) for _ in range( levels + 1 ) ]
+      # Bit of the target way that picks the child at each level
+      s.target_dir  = [ Wire() for _ in range( levels ) ]
+      for l in range( levels ):
+        s.target_dir[l] //= s.target_way[ levels - 1 - l ]
+
+      @update
+      def plru_victim_logic():
+        s.victim_node[0] @= 0
+        for l in range( levels ):
+          s.victim_node[l+1] @= ( s.victim_node[l] << 1 ) + 1 + \
+                                zext( s.repreq_state[ s.victim_node[l][0:levels] ], BitsNode )
+        s.represp_victim @= trunc( s.victim_node[levels] - ( nways - 1 ), p.BitsAssoclog2 )
+
+      # Only the nodes on the path to the target way change: on an access
+      # they point away from it, on an invalidation towards it
       @update
-      def pointer_logic():
-        s.represp_ptr @= s.repreq_ptr
-        if s.repreq_en:
-          if ~s.repreq_is_hit:
-            s.represp_ptr @= ~s.repreq_ptr
-          elif s.repreq_is_hit:
-            s.represp_ptr @= ~s.repreq_hit_ptr
+      def plru_state_logic():
+        s.target_node[0] @= 0
+        for l in range( levels ):
+          s.target_node[l+1] @= ( s.target_node[l] << 1 ) + 1 + zext( s.target_dir[l], BitsNode )
+        s.represp_state @= s.repreq_state
+        for l in range( levels ):
+          if s.repreq_is_inval:
+            s.represp_state[ s.target_node[l][0:levels] ] @= s.target_dir[l]
+          else:
+            s.represp_state[ s.target_node[l][0:levels] ] @= ~s.target_dir[l]
+
     else:
-      # Real difficult to implement LRU here
-      s.represp_ptr //= 0
+      assert policy == 'lru', f"Unknown replacement policy {policy}"
+
+      # age[i][j], i < j, is the state bit of the pair: way j is older than
+      # way i. Entries with i >= j are unused
+      s.age      = [ [ Wire() for _ in range( nways ) ] for _ in range( nways ) ]
+      s.age_next = [ [ Wire() for _ in range( nways ) ] for _ in range( nways ) ]
+      k = 0
+      for i in range( nways ):
+        for j in range( nways ):
+          if i < j:
+            s.age[i][j] //= s.repreq_state[k]
+            s.represp_state[k] //= s.age_next[i][j]
+            k += 1
+          else:
+            s.age[i][j] //= 0
+
+      s.is_oldest = [ Wire() for _ in range( nways ) ]
+
+      @update
+      def lru_victim_logic():
+        for i in range( nways ):
+          s.is_oldest[i] @= 1
+          for j in range( nways ):
+            if j > i:
+              if s.age[i][j]:
+                s.is_oldest[i] @= 0
+            elif j < i:
+              if ~s.age[j][i]:
+                s.is_oldest[i] @= 0
+        s.represp_victim @= 0
+        for i in range( nways ):
+          if s.is_oldest[ nways - 1 - i ]:
+            s.represp_victim @= nways - 1 - i
+
+      # An access makes the target the youngest way, an invalidation makes
+      # it the oldest
+      @update
+      def lru_state_logic():
+        for i in range( nways ):
+          for j in range( nways ):
+            s.age_next[i][j] @= s.age[i][j]
+            if j > i:
+              if s.target_way == i:
+                s.age_next[i][j] @= ~s.repreq_is_inval
+              elif s.target_way == j:
+                s.age_next[i][j] @= s.repreq_is_inval
 
   def line_trace( s ):
     msg = ""
@@ -0,0 +1,133 @@
+"""
+=========================================================================
+ VictimCache.py
+=========================================================================
+Fully associative victim cache next to the data array
+
+Date   : 17 October 2026
+"""
+
+from pymtl3                  import *
+from pymtl3.stdlib.basic_rtl import RegEn, RegRst
+
+class VictimCache( Component ):
+  """
+  Holds clean copies of the last lines evicted from the cache. A miss that
+  finds its line here is refilled from the entry instead of from memory
+  and the entry is removed, so the line moves back into the cache.
+
+  An insert takes the lowest free entry, or the oldest one when all are in
+  use. It never replaces the entry of keep_addr, the line of the access
+  whose eviction is being inserted, so that access still finds it; with a
+  single entry that insert is dropped.
+  """
+  def construct( s, p, entries ):
+    s.ins_en      = InPort ()
+    s.ins_addr    = InPort (p.bitwidth_addr)
+    s.ins_data    = InPort (p.bitwidth_cacheline)
+    s.keep_addr   = InPort (p.bitwidth_addr)
+
+    s.lookup_addr = InPort (p.bitwidth_addr)
+    s.lookup_hit  = OutPort()
+    s.lookup_data = OutPort(p.bitwidth_cacheline)
+
+    s.remove_en   = InPort () # removes the entry of lookup_addr
+    s.clear       = InPort () # removes all entries
+
+    BitsPtr   = mk_bits( max( 1, clog2( entries ) ) )
+    BitsValid = mk_bits( entries )
+    last      = entries - 1
+    lo        = p.bitwidth_offset
+    hi        = p.bitwidth_addr
+
+    s.addrs = [ RegEn(hi - lo)               for _ in range(entries) ]
+    s.datas = [ RegEn(p.bitwidth_cacheline) for _ in range(entries) ]
+    s.valid = RegRst(BitsValid)
+    s.ptr   = RegRst(BitsPtr) # oldest entry
+
+    for i in range(entries):
+      s.addrs[i].in_ //= s.ins_addr[lo:hi]
+      s.datas[i].in_ //= s.ins_data
+
+    # Lowest free entry
+    s.free_val  = Wire()
+    s.free_slot = Wire(BitsPtr)
+
+    @update
+    def vc_free_logic():
+      s.free_val  @= 0
+      s.free_slot @= 0
+      for i in range(entries):
+        if ~s.valid.out[i] & ~s.free_val:
+          s.free_val  @= 1
+          s.free_slot @= i
+
+    # Entry to insert into and whether the insert happens at all
+    s.keep_hit = Wire()
+    s.ins_slot = Wire(BitsPtr)
+    s.ins_go   = Wire()
+
+    @update
+    def vc_keep_logic():
+      s.keep_hit @= 0
+      for i in range(entries):
+        if ( ( s.ptr.out == i ) & s.valid.out[i] &
+             ( s.addrs[i].out == s.keep_addr[lo:hi] ) ):
+          s.keep_hit @= 1
+
+    @update
+    def vc_ins_slot_logic():
+      s.ins_slot @= s.ptr.out
+      s.ins_go   @= s.ins_en
+      if s.free_val:
+        s.ins_slot @= s.free_slot
+      elif s.keep_hit:
+        if entries == 1:
+          s.ins_go @= 0
+        elif s.ptr.out == last:
+          s.ins_slot @= 0
+        else:
+          s.ins_slot @= s.ptr.out + 1
+
+    @update
+    def vc_ins_logic():
+      for i in range(entries):
+        s.addrs[i].en @= s.ins_go & ( s.ins_slot == i )
+        s.datas[i].en @= s.ins_go & ( s.ins_slot == i )
+
+    # Replacing an entry makes the one after it the oldest
+    @update
+    def vc_ptr_logic():
+      s.ptr.in_ @= s.ptr.out
+      if s.ins_go & ~s.free_val:
+        if s.ins_slot == last:
+          s.ptr.in_ @= 0
+        else:
+          s.ptr.in_ @= s.ins_slot + 1
+
+    s.match = Wire(BitsValid)
+
+    @update
+    def vc_lookup_logic():
+      s.lookup_hit  @= 0
+      s.lookup_data @= 0
+      for i in range(entries):
+        s.match[i] @= s.valid.out[i] & ( s.addrs[i].out == s.lookup_addr[lo:hi] )
+        if s.match[i]:
+          s.lookup_hit  @= 1
+          s.lookup_data @= s.datas[i].out
+
+    @update
+    def vc_valid_logic():
+      s.valid.in_ @= s.valid.out
+      if s.clear:
+        s.valid.in_ @= 0
+      else:
+        for i in range(entries):
+          if s.remove_en & s.match[i]:
+            s.valid.in_[i] @= 0
+          if s.ins_go & ( s.ins_slot == i ):
+            s.valid.in_[i] @= 1
+
+  def line_trace( s ):
+    return f'vc[{s.valid.out}]'
@@ -0,0 +1,99 @@
+"""
+=========================================================================
+ WriteBackBuffer.py
+=========================================================================
+Write-back buffer between the cache and memory
+
+Date   : 17 October 2026
+"""
+
+from pymtl3                  import *
+from pymtl3.stdlib.basic_rtl import RegEn, RegRst
+
+class WriteBackBuffer( Component ):
+  """
+  FIFO of writeback memreqs. The cache enqueues the memreq of a dirty
+  eviction here instead of sending it, and the ctrl dequeues the oldest
+  one onto the memory interface when the pipeline does not need it, so a
+  refill goes out ahead of the writeback of its victim.
+
+  search_hit is high while any entry writes to the line of search_addr.
+  Entries only hold the dirty words of a line (wr_mask), so a read of a
+  buffered line cannot be served from here; the ctrl holds it until the
+  entry has drained and memory returns the merged line.
+  """
+  def construct( s, p, entries ):
+    s.enq_en      = InPort ()
+    s.enq_msg     = InPort (p.MemReqType)
+    s.full        = OutPort()
+
+    s.deq_en      = InPort ()
+    s.deq_msg     = OutPort(p.MemReqType)
+    s.empty       = OutPort()
+
+    s.search_addr = InPort (p.bitwidth_addr)
+    s.search_hit  = OutPort()
+
+    BitsPtr   = mk_bits( max( 1, clog2( entries ) ) )
+    BitsValid = mk_bits( entries )
+    last      = entries - 1
+    lo        = p.bitwidth_offset
+    hi        = p.bitwidth_addr
+
+    s.entries = [ RegEn(p.MemReqType) for _ in range(entries) ]
+    s.valid   = RegRst(BitsValid)
+    s.head    = RegRst(BitsPtr)
+    s.tail    = RegRst(BitsPtr)
+
+    for i in range(entries):
+      s.entries[i].in_ //= s.enq_msg
+
+    @update
+    def wbb_enq_logic():
+      for i in range(entries):
+        s.entries[i].en @= s.enq_en & ( s.tail.out == i )
+
+    @update
+    def wbb_ptr_logic():
+      s.head.in_ @= s.head.out
+      s.tail.in_ @= s.tail.out
+      if s.enq_en:
+        if s.tail.out == last:
+          s.tail.in_ @= 0
+        else:
+          s.tail.in_ @= s.tail.out + 1
+      if s.deq_en:
+        if s.head.out == last:
+          s.head.in_ @= 0
+        else:
+          s.head.in_ @= s.head.out + 1
+
+    @update
+    def wbb_valid_logic():
+      s.valid.in_ @= s.valid.out
+      for i in range(entries):
+        if s.deq_en & ( s.head.out == i ):
+          s.valid.in_[i] @= 0
+        if s.enq_en & ( s.tail.out == i ):
+          s.valid.in_[i] @= 1
+
+    s.full  //= lambda: s.valid.out == BitsValid(-1)
+    s.empty //= lambda: s.valid.out == 0
+
+    @update
+    def wbb_deq_logic():
+      s.deq_msg @= s.entries[0].out
+      for i in range(entries):
+        if s.head.out == i:
+          s.deq_msg @= s.entries[i].out
+
+    @update
+    def wbb_search_logic():
+      s.search_hit @= 0
+      for i in range(entries):
+        if ( s.valid.out[i] &
+             ( s.entries[i].out.addr[lo:hi] == s.search_addr[lo:hi] ) ):
+          s.search_hit @= 1
+
+  def line_trace( s ):
+    return f'wbb[{s.valid.out}]'
@@ -34,4 +34,17 @@ from .arithmetics import (
 
 from .registers import (
   ReplacementBitsReg,
+  DirtyLineIndex,
+)
+
+from .WriteBackBuffer import (
+  WriteBackBuffer
+)
+
+from .VictimCache import (
+  VictimCache
+)
+
+from .Prefetcher import (
+  Prefetcher
 )
@@ -14,17 +14,18 @@ class ReplacementBitsReg( Component ):
   """
   Wrapper for the replacement bits register. We need it because we need more
   control on the bit level
-  Works for 2 way asso
+  Holds p.bitwidth_rep bits of replacement state per set
   """
   def construct( s, p ):
 
-    s.wdata = InPort()
+    s.wdata = InPort( p.BitsRep )
     s.wen   = InPort()
     s.waddr = InPort( p.BitsIdx )
     s.raddr = InPort( p.BitsIdx )
-    s.rdata = OutPort()
+    s.rdata = OutPort( p.BitsRep )
 
-    s.replacement_register = m = RegEnRst( p.BitsNlinesPerWay )
+    nbits = p.bitwidth_rep
+    s.replacement_register = m = RegEnRst( mk_bits( p.nblocks_per_way * nbits ) )
     m.en //= s.wen
 
     nblocks_per_way  = p.nblocks_per_way
@@ -33,13 +34,60 @@ class ReplacementBitsReg( Component ):
     def update_register_bits():
       for i in range( nblocks_per_way ):
         if s.waddr == i:
-          s.replacement_register.in_[i] @= s.wdata
+          s.replacement_register.in_[i*nbits:i*nbits+nbits] @= s.wdata
         else:
-          s.replacement_register.in_[i] @= s.replacement_register.out[i]
+          s.replacement_register.in_[i*nbits:i*nbits+nbits] @= \
+            s.replacement_register.out[i*nbits:i*nbits+nbits]
 
-      s.rdata @= s.replacement_register.out[s.raddr]
+      s.rdata @= 0
+      for i in range( nblocks_per_way ):
+        if s.raddr == i:
+          s.rdata @= s.replacement_register.out[i*nbits:i*nbits+nbits]
 
   def line_trace( s ):
     msg = ""
     msg += f'bits[{s.replacement_register.out}]'
     return msg
+
+class DirtyLineIndex( Component ):
+  """
+  One bit per cache line, set while the line holds any dirty word. It
+  mirrors the dirty bits written into the tag arrays so a flush can jump
+  straight to the next dirty line instead of reading every entry. Lines
+  are numbered index * associativity + way, the order counter_M0 walks
+  them in.
+  """
+  def construct( s, p ):
+
+    s.wen        = InPort( p.BitsAssoc )      # dirty bits written, per way
+    s.widx       = InPort( p.BitsIdx )
+    s.wdty       = InPort()                   # new entry has dirty words
+    s.search_ptr = InPort( p.BitsClogNlines )
+    s.next_ptr   = OutPort( p.BitsClogNlines ) # highest dirty line <= search_ptr
+
+    s.dirty_lines = m = RegRst( mk_bits( p.total_num_cachelines ) )
+
+    nblocks_per_way = p.nblocks_per_way
+    associativity   = p.associativity
+    total_num_lines = p.total_num_cachelines
+    BitsClogNlines  = p.BitsClogNlines
+
+    @update
+    def update_dirty_lines():
+      s.dirty_lines.in_ @= s.dirty_lines.out
+      for i in range( nblocks_per_way ):
+        for j in range( associativity ):
+          if s.wen[j] & ( s.widx == i ):
+            s.dirty_lines.in_[ i * associativity + j ] @= s.wdty
+
+    # No dirty line at or below search_ptr also returns 0; reading line 0
+    # is how the flush FSM finishes anyway
+    @update
+    def next_dirty_line():
+      s.next_ptr @= 0
+      for i in range( total_num_lines ):
+        if s.dirty_lines.out[i] & ( s.search_ptr >= BitsClogNlines(i) ):
+          s.next_ptr @= BitsClogNlines(i)
+
+  def line_trace( s ):
+    return f'dty[{s.dirty_lines.out}]'
@@ -0,0 +1,159 @@
+"""
+=========================================================================
+Prefetcher_test.py
+=========================================================================
+Trains the prefetcher on strided misses and checks the candidates it
+issues and how it scores the prefetched lines
+
+Date   : 17 October 2026
+"""
+
+from pymtl3 import *
+from mem_ifcs.MemMsg import mk_mem_msg
+from blocking_cache.CacheDerivedParams import CacheDerivedParams
+
+from ..Prefetcher import Prefetcher
+
+obw  = 8   # Short name for opaque bitwidth
+abw  = 32  # Short name for addr bitwidth
+clw  = 128
+
+def mk_prefetcher( entries ):
+  CacheReqType, CacheRespType = mk_mem_msg( obw, abw, 32 )
+  MemReqType, MemRespType = mk_mem_msg( obw, abw, clw )
+  p = CacheDerivedParams( CacheReqType, CacheRespType, MemReqType, MemRespType,
+                          1024, 2, mshr_entries=4,
+                          prefetch_entries=entries )
+  dut = Prefetcher( p, entries )
+  dut.elaborate()
+  dut.apply( DefaultPassGroup() )
+  dut.sim_reset()
+  return dut
+
+def idle( dut ):
+  dut.train_en  @= 0
+  dut.train_hit @= 0
+  dut.record_en @= 0
+  dut.clear     @= 0
+  dut.issue_en  @= 0
+
+def train( dut, addr, hit=0 ):
+  idle( dut )
+  dut.access_addr @= addr
+  dut.train_en    @= 1
+  dut.train_hit   @= hit
+  dut.sim_eval_combinational()
+  useful, useless = int( dut.useful ), int( dut.useless )
+  dut.sim_tick()
+  idle( dut )
+  dut.sim_eval_combinational()
+  return useful, useless
+
+def record( dut, addr ):
+  idle( dut )
+  dut.access_addr @= addr
+  dut.record_en   @= 1
+  dut.sim_eval_combinational()
+  useless = int( dut.useless )
+  dut.sim_tick()
+  idle( dut )
+  dut.sim_eval_combinational()
+  return useless
+
+# Issues the candidates one by one; skipping a line takes a cycle too
+def drain( dut, ncycles=8 ):
+  addrs = []
+  for _ in range( ncycles ):
+    dut.issue_en @= dut.issue_val
+    if dut.issue_val:
+      addrs.append( int( dut.issue_addr ) )
+    dut.sim_tick()
+    dut.issue_en @= 0
+    dut.sim_eval_combinational()
+  return addrs
+
+def test_prefetch_stride():
+  dut = mk_prefetcher( 4 )
+
+  # A new region guesses the next line
+  train( dut, 0x1004 )
+  assert drain( dut ) == [ 0x1010 ]
+
+  # A different stride replaces the guess at no confidence, the same one
+  # raises the confidence and the candidates run further ahead
+  train( dut, 0x1020 )
+  assert drain( dut ) == [ 0x1040 ]
+  train( dut, 0x1040 )
+  assert drain( dut ) == [ 0x1060, 0x1080 ]
+  train( dut, 0x1060 )
+  assert drain( dut ) == [ 0x1080, 0x10a0, 0x10c0 ]
+
+  # One odd access lowers the confidence but keeps the stride
+  train( dut, 0x1070 )
+  assert drain( dut ) == [ 0x1090, 0x10b0 ]
+
+  # Negative strides, and no candidates beyond the region
+  train( dut, 0x2ff0 )
+  train( dut, 0x2fd0 )
+  assert drain( dut ) == [ 0x2fb0 ]
+  train( dut, 0x2010 )
+  assert not dut.issue_val
+
+def test_prefetch_lines():
+  dut = mk_prefetcher( 2 )
+
+  # Prefetched lines are skipped as candidates
+  train( dut, 0x1000 )
+  assert drain( dut ) == [ 0x1010 ]
+  assert record( dut, 0x1010 ) == 0
+  assert record( dut, 0x1020 ) == 0
+
+  # The first hit on a prefetched line is useful and trains the region, a
+  # miss on one is useless, later hits are plain hits
+  assert train( dut, 0x1010, hit=1 ) == ( 1, 0 )
+  assert drain( dut ) == [ 0x1030 ]
+  assert train( dut, 0x1010, hit=1 ) == ( 0, 0 )
+  assert not dut.issue_val
+  assert train( dut, 0x1020, hit=0 ) == ( 0, 1 )
+
+  # A line that drops out of the table unused is useless
+  assert record( dut, 0x1030 ) == 0
+  assert record( dut, 0x1040 ) == 0
+  assert record( dut, 0x1050 ) == 1
+
+  # A clear forgets all of them; none is scored
+  idle( dut )
+  dut.clear @= 1
+  dut.sim_tick()
+  idle( dut )
+  dut.sim_eval_combinational()
+  assert not dut.issue_val
+  assert train( dut, 0x1050, hit=1 ) == ( 0, 0 )
+
+def test_prefetch_throttle():
+  dut = mk_prefetcher( 4 )
+
+  # Useless prefetches bring the accuracy down to zero; then only strides
+  # with full confidence issue candidates
+  for i in range( 4 ):
+    addr = 0x1000 * ( i + 1 )
+    train( dut, addr )
+    assert drain( dut ) == [ addr + 0x10 ]
+    record( dut, addr + 0x10 )
+    assert train( dut, addr + 0x10 ) == ( 0, 1 )
+    drain( dut )
+
+  train( dut, 0x6000 )
+  assert not dut.issue_val
+  for addr in [ 0x6020, 0x6040, 0x6060 ]:
+    train( dut, addr )
+    assert not dut.issue_val
+  train( dut, 0x6080 )
+  assert drain( dut ) == [ 0x60a0, 0x60c0, 0x60e0, 0x6100 ]
+
+  # A useful prefetch opens it up again
+  record( dut, 0x60a0 )
+  assert train( dut, 0x60a0, hit=1 ) == ( 1, 0 )
+  drain( dut )
+  train( dut, 0x7000 )
+  assert drain( dut ) == [ 0x7010 ]
@@ -0,0 +1,62 @@
+"""
+=========================================================================
+ReplacementPolicy_test.py
+=========================================================================
+Checks the replacement policies against the HitMissTracker in the FL
+model on a random stream of misses, hits and invalidations to one set
+
+Author : Xiaoyu Yan (xy97), Eric Tang (et396)
+Date   : 26 March 2020
+"""
+
+import random
+import pytest
+
+from pymtl3 import *
+from mem_ifcs.MemMsg import mk_mem_msg
+from blocking_cache.CacheDerivedParams import CacheDerivedParams
+from blocking_cache.BlockingCacheFL    import HitMissTracker
+
+from ..ReplacementPolicy import ReplacementPolicy
+
+obw  = 8   # Short name for opaque bitwidth
+abw  = 32  # Short name for addr bitwidth
+clw  = 128
+
+@pytest.mark.parametrize( "policy", [ 'lru', 'plru', 'fifo' ] )
+@pytest.mark.parametrize( "associativity", [ 1, 2, 4, 8 ] )
+def test_replacement_policy( policy, associativity ):
+  CacheReqType, CacheRespType = mk_mem_msg( obw, abw, 32 )
+  MemReqType, MemRespType = mk_mem_msg( obw, abw, clw )
+  p = CacheDerivedParams( CacheReqType, CacheRespType, MemReqType, MemRespType,
+                          clw // 8 * associativity * 2, associativity,
+                          replacement_policy=policy )
+  dut = ReplacementPolicy( p, policy )
+  dut.elaborate()
+  dut.apply( DefaultPassGroup() )
+  dut.sim_reset()
+
+  # One set, so the state is looked up at index 0 only
+  tracker = HitMissTracker( clw * associativity, associativity, 0, clw, policy )
+
+  rng   = random.Random( 0xdeadbeef )
+  state = 0
+  for _ in range( 500 ):
+    kind = rng.choice( [ 'miss', 'hit', 'inval' ] )
+    way  = rng.randrange( associativity )
+    dut.repreq_en       @= 1
+    dut.repreq_state    @= state
+    dut.repreq_is_hit   @= kind != 'miss'
+    dut.repreq_is_inval @= kind == 'inval'
+    dut.repreq_hit_ptr  @= way
+    dut.sim_eval_combinational()
+
+    assert dut.represp_victim == tracker.lru_get( 0 )
+
+    if kind == 'miss':
+      tracker.lru_hit( 0, tracker.lru_get( 0 ), fill=True )
+    elif kind == 'hit':
+      tracker.lru_hit( 0, way )
+    else:
+      tracker.lru_set( 0, way )
+    state = dut.represp_state.clone()
@@ -0,0 +1,71 @@
+"""
+=========================================================================
+VictimCache_test.py
+=========================================================================
+Checks the victim cache against the one in the HitMissTracker of the FL
+model on a random stream of inserts, lookups, removes and clears
+
+Date   : 17 October 2026
+"""
+
+import random
+import pytest
+
+from pymtl3 import *
+from mem_ifcs.MemMsg import mk_mem_msg
+from blocking_cache.CacheDerivedParams import CacheDerivedParams
+from blocking_cache.BlockingCacheFL    import HitMissTracker
+
+from ..VictimCache import VictimCache
+
+obw  = 8   # Short name for opaque bitwidth
+abw  = 32  # Short name for addr bitwidth
+clw  = 128
+
+@pytest.mark.parametrize( "entries", [ 1, 2, 3, 4 ] )
+def test_victim_cache( entries ):
+  CacheReqType, CacheRespType = mk_mem_msg( obw, abw, 32 )
+  MemReqType, MemRespType = mk_mem_msg( obw, abw, clw )
+  p = CacheDerivedParams( CacheReqType, CacheRespType, MemReqType, MemRespType,
+                          64, 1, victim_lines=entries )
+  dut = VictimCache( p, entries )
+  dut.elaborate()
+  dut.apply( DefaultPassGroup() )
+  dut.sim_reset()
+
+  # Only the victim cache of the tracker is used; its lines are (tag, idx)
+  # pairs, here the line address and 0
+  tracker = HitMissTracker( 64 * 8, 1, 0, clw, victim_lines=entries )
+  data    = {}
+
+  rng   = random.Random( 0xdeadbeef )
+  lines = list( range( entries + 2 ) )
+  for _ in range( 500 ):
+    kind = rng.choices( [ 'insert', 'remove', 'lookup', 'clear' ], [ 8, 3, 3, 1 ] )[0]
+    line = rng.choice( lines )
+    keep = rng.choice( lines )
+    # The cache never inserts a line it already holds
+    if kind == 'insert' and ( line, 0 ) in tracker.victim:
+      kind = 'lookup'
+    dut.ins_en      @= kind == 'insert'
+    dut.ins_addr    @= line << 4
+    dut.ins_data    @= rng.getrandbits( clw )
+    dut.keep_addr   @= keep << 4
+    dut.lookup_addr @= line << 4
+    dut.remove_en   @= kind == 'remove'
+    dut.clear       @= kind == 'clear'
+    dut.sim_eval_combinational()
+
+    assert dut.lookup_hit == ( ( line, 0 ) in tracker.victim )
+    if dut.lookup_hit:
+      assert dut.lookup_data == data[ line ]
+
+    if kind == 'insert':
+      tracker.victim_insert( ( line, 0 ), ( keep, 0 ) )
+      if ( line, 0 ) in tracker.victim:
+        data[ line ] = dut.ins_data.clone()
+    elif kind == 'remove':
+      tracker.victim_remove( ( line, 0 ) )
+    elif kind == 'clear':
+      tracker.invalidate()
+    dut.sim_tick()
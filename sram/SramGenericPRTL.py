@@ -42,14 +42,13 @@ class SramGenericPRTL( Component ):
     def read_logic():
       s.dout_next @= s.ram[ s.A1 ] if (~s.CSB1 & s.WEB1) else s.dout
 
-    # write path
+    # write path: apply the bit mask to the whole word at once
     @update
     def write_logic():
       for i in range( num_words ):
         s.ram_next[i] @= s.ram[i]
-      for i in range( num_bits ):
-        if ~s.CSB1 & ~s.WEB1 & s.WBM1[i]:
-          s.ram_next[s.A1][i] @= s.I1[i]
+      if ~s.CSB1 & ~s.WEB1:
+        s.ram_next[s.A1] @= ( s.ram[s.A1] & ~s.WBM1 ) | ( s.I1 & s.WBM1 )
 
     @update
     def comb_logic():
@@ -63,3 +62,53 @@ class SramGenericPRTL( Component ):
 
   def line_trace( s ):
     return f"(WE={~s.WEB1} OE={~s.OEB1} A1={s.A1} I1A={s.I1} O1={s.O1} s.WBM1={s.WBM1})"
+
+#-------------------------------------------------------------------------
+# SramGenericSparsePRTL
+#-------------------------------------------------------------------------
+# Simulation-only behavioral model with the same interface as
+# SramGenericPRTL. The array is a dict that only holds rows that have been
+# written, and a write applies the bit mask to the whole row at once, so
+# the per-cycle cost does not depend on num_words or num_bits. This model
+# cannot be translated; it is selected through SramPRTL( sparse=True ).
+
+class SramGenericSparsePRTL( Component ):
+
+  def construct( s, num_bits = 32, num_words = 256 ):
+
+    addr_width = clog2( num_words )      # address width
+    dtype      = mk_bits( num_bits )
+
+    s.CE1  = InPort ( Bits1 )               # clk
+    s.WEB1 = InPort ( Bits1 )               # bar( write en )
+    s.OEB1 = InPort ( Bits1 )               # bar( out en )
+    s.CSB1 = InPort ( Bits1 )               # bar( whole SRAM en )
+    s.A1   = InPort ( mk_bits(addr_width) ) # address
+    s.I1   = InPort ( dtype )               # write data
+    s.O1   = OutPort( dtype )               # read data
+    s.WBM1 = InPort ( mk_bits( num_bits ) ) # bit-level write mask
+
+    # memory array: row index -> row value, untouched rows read as 0
+
+    s.ram = {}
+    zero  = dtype(0)
+
+    # read path
+
+    s.dout = Wire( dtype )
+
+    @update
+    def comb_logic():
+      s.O1 @= s.dout if ~s.OEB1 else 0
+
+    @update_ff
+    def update_sram():
+      if ~s.CSB1:
+        idx = int(s.A1)
+        if s.WEB1:
+          s.dout <<= s.ram.get( idx, zero )
+        else:
+          s.ram[idx] = ( s.ram.get( idx, zero ) & ~s.WBM1 ) | ( s.I1 & s.WBM1 )
+
+  def line_trace( s ):
+    return f"(WE={~s.WEB1} OE={~s.OEB1} A1={s.A1} I1A={s.I1} O1={s.O1} s.WBM1={s.WBM1})"
@@ -20,14 +20,17 @@
 #  port0_wben    I          write bit enable (1 = enabled)
 #  port0_rdata   O          read data output
 #
+# Setting sparse=True swaps the generic RTL model for the simulation-only
+# SramGenericSparsePRTL. Translation should always use the default.
+#
 
 from pymtl3          import *
 
-from .SramGenericPRTL import SramGenericPRTL
+from .SramGenericPRTL import SramGenericPRTL, SramGenericSparsePRTL
 
 class SramPRTL( Component ):
 
-  def construct( s, num_bits = 32, num_words = 256 ):
+  def construct( s, num_bits = 32, num_words = 256, sparse = False ):
 
     idx_nbits = clog2( num_words )       # address width
 
@@ -48,7 +51,10 @@ class SramPRTL( Component ):
       s.port0_val_bar  @= ~s.port0_val
       s.port0_type_bar @= ~s.port0_type
 
-    s.sram = m = SramGenericPRTL( num_bits, num_words )
+    if sparse:
+      s.sram = m = SramGenericSparsePRTL( num_bits, num_words )
+    else:
+      s.sram = m = SramGenericPRTL( num_bits, num_words )
     connect( m.CE1,  s.clk            )
     connect( m.CSB1, s.port0_val_bar  ) # CSB1 low-active
     connect( m.OEB1, 0                )
@@ -0,0 +1,56 @@
+"""
+=========================================================================
+SramGenericPRTL_bench.py
+=========================================================================
+Microbenchmark for the SRAM simulation models. Drives SramPRTL with a
+random read/write stream and reports simulated ticks per second for each
+line width, for both the generic RTL model and the sparse behavioral one.
+
+  % python -m sram.test.SramGenericPRTL_bench
+  % python -m sram.test.SramGenericPRTL_bench --nbits 128 512 --ncycles 5000
+"""
+
+import argparse
+import random
+import time
+
+from pymtl3 import *
+
+from sram.SramPRTL import SramPRTL
+
+def bench( num_bits, num_words, ncycles, sparse ):
+  m = SramPRTL( num_bits, num_words, sparse=sparse )
+  m.elaborate()
+  m.apply( DefaultPassGroup() )
+  m.sim_reset()
+
+  # Pre-generate the stimulus so only the simulation is timed
+  rng  = random.Random( 0xdeadbeef )
+  reqs = [ ( rng.randint( 0, 1 ), rng.randint( 0, num_words - 1 ),
+             rng.getrandbits( num_bits ), rng.getrandbits( num_bits ) )
+           for _ in range( ncycles ) ]
+
+  start = time.perf_counter()
+  for type_, idx, wdata, wben in reqs:
+    m.port0_val   @= 1
+    m.port0_type  @= type_
+    m.port0_idx   @= idx
+    m.port0_wdata @= wdata
+    m.port0_wben  @= wben
+    m.sim_tick()
+  elapsed = time.perf_counter() - start
+  return ncycles / elapsed
+
+if __name__ == "__main__":
+  p = argparse.ArgumentParser( description=__doc__,
+                               formatter_class=argparse.RawDescriptionHelpFormatter )
+  p.add_argument( "--nbits",   type=int, nargs="+", default=[ 128, 256, 512 ] )
+  p.add_argument( "--nwords",  type=int, default=256 )
+  p.add_argument( "--ncycles", type=int, default=2000 )
+  opts = p.parse_args()
+
+  print( f"{'nbits':>6} {'nwords':>7} {'generic ticks/s':>16} {'sparse ticks/s':>15}" )
+  for num_bits in opts.nbits:
+    generic = bench( num_bits, opts.nwords, opts.ncycles, False )
+    sparse  = bench( num_bits, opts.nwords, opts.ncycles, True  )
+    print( f"{num_bits:>6} {opts.nwords:>7} {generic:>16.1f} {sparse:>15.1f}" )
@@ -0,0 +1,45 @@
+"""
+=========================================================================
+SramGenericPRTL_test.py
+=========================================================================
+Checks the sparse behavioral SRAM model against the generic RTL model by
+driving both with the same random read/write stimulus.
+"""
+
+import pytest
+import random
+
+from pymtl3 import *
+
+from sram.SramPRTL import SramPRTL
+
+def run_lockstep( num_bits, num_words, ncycles ):
+  rtl    = SramPRTL( num_bits, num_words )
+  sparse = SramPRTL( num_bits, num_words, sparse=True )
+  for m in [ rtl, sparse ]:
+    m.elaborate()
+    m.apply( DefaultPassGroup() )
+    m.sim_reset()
+
+  for _ in range( ncycles ):
+    val   = random.randint( 0, 1 )
+    type_ = random.randint( 0, 1 )
+    idx   = random.randint( 0, num_words - 1 )
+    wdata = random.getrandbits( num_bits )
+    wben  = random.choice( [ 0, ( 1 << num_bits ) - 1,
+                             random.getrandbits( num_bits ) ] )
+    for m in [ rtl, sparse ]:
+      m.port0_val   @= val
+      m.port0_type  @= type_
+      m.port0_idx   @= idx
+      m.port0_wdata @= wdata
+      m.port0_wben  @= wben
+      m.sim_tick()
+    assert rtl.port0_rdata == sparse.port0_rdata
+
+@pytest.mark.parametrize( "num_bits, num_words", [
+  ( 26,  128 ),
+  ( 128, 256 ),
+])
+def test_sparse_matches_rtl( num_bits, num_words ):
+  run_lockstep( num_bits, num_words, 500 )
@@ -0,0 +1,147 @@
+"""
+========================================================================
+BankedMemoryCL
+========================================================================
+A behavioral test memory with the same interface as MemoryCL that models
+the timing of a banked main memory:
+
+- nbanks banks interleaved every bank_nbytes. A bank accepts a new
+  request bank_busy cycles after the previous one, so requests to a busy
+  bank wait at the head of their port.
+- Each bank keeps one open row of row_nbytes. An access to the open row
+  takes latency cycles, any other access row_miss_penalty more cycles and
+  keeps the bank busy for them too.
+- A data bus shared by all ports that moves at most bytes_per_cycle bytes
+  per cycle (0 for unlimited).
+
+Responses of a port are returned in order. With no bank conflicts, only
+row hits and unlimited bandwidth the timing is that of MemoryCL.
+
+Date   : 17 October 2026
+"""
+
+from collections import deque
+
+from pymtl3 import *
+from pymtl3.stdlib.mem import mk_mem_msg, MemMinionIfcCL
+from pymtl3.stdlib.delays import DelayPipeDeqCL, StallCL
+
+from .MemoryCL   import serve_req
+from .MmapMemory import MmapMemoryFL
+
+class BankedMemoryCL( Component ):
+
+  # Magical methods
+
+  def read_mem( s, addr, size ):
+    return s.mem.read_mem( addr, size )
+
+  def write_mem( s, addr, data ):
+    return s.mem.write_mem( addr, data )
+
+  def write_words( s, addrs, data_ints ):
+    return s.mem.write_words( addrs, data_ints )
+
+  def load_image( s, addr, image ):
+    return s.mem.load_image( addr, image )
+
+  def load_elf( s, path ):
+    return s.mem.load_elf( path )
+
+  # Actual stuff
+  def construct( s, nports, mem_ifc_dtypes=[mk_mem_msg(8,32,32), mk_mem_msg(8,32,32)],
+                 stall_prob=0, latency=1, mem_nbytes=2**20, mem_path=None,
+                 nbanks=8, bank_nbytes=16, bank_busy=1, row_nbytes=1024,
+                 row_miss_penalty=4, bytes_per_cycle=0 ):
+    assert latency >= 1
+    assert row_nbytes % bank_nbytes == 0
+
+    # Local constants
+
+    s.nports = nports
+    req_classes  = [ x for (x,y) in mem_ifc_dtypes ]
+    resp_classes = [ y for (x,y) in mem_ifc_dtypes ]
+
+    s.mem = MmapMemoryFL( mem_nbytes, mem_path )
+
+    # Interface
+
+    s.ifc = [ MemMinionIfcCL( req_classes[i], resp_classes[i] ) for i in range(nports) ]
+
+    # Queues
+
+    s.req_stalls = [ StallCL( stall_prob, i ) for i in range(nports) ]
+    s.req_qs     = [ DelayPipeDeqCL( 1 )      for i in range(nports) ]
+    # ( ready cycle, response ) of the requests served by each port
+    s.resp_qs    = [ deque()                  for i in range(nports) ]
+
+    for i in range(nports):
+      s.req_stalls[i].recv //= s.ifc[i].req
+      s.req_qs[i].enq      //= s.req_stalls[i].send
+
+    # Timing state
+
+    s.cycle      = 0
+    s.bank_free  = [ 0 ] * nbanks    # cycle each bank accepts a request
+    s.open_row   = [ None ] * nbanks
+    s.bus_free   = 0                 # cycle the data bus is free
+    s.port_ready = [ 0 ] * nports    # ready cycle of the last response
+
+    # Statistics
+    s.row_hits       = 0
+    s.row_misses     = 0
+    s.bank_conflicts = 0             # cycles a request waited on its bank
+
+    @update_once
+    def up_mem():
+
+      for i in range(s.nports):
+
+        # Serve the request at the head of the port once its bank is free
+
+        if s.req_qs[i].deq.rdy():
+          req  = s.req_qs[i].peek()
+          addr = int(req.addr)
+          bank = ( addr // bank_nbytes ) % nbanks
+          if s.bank_free[bank] > s.cycle:
+            s.bank_conflicts += 1
+          else:
+            s.req_qs[i].deq()
+            resp = serve_req( s.mem, req, resp_classes[i] )
+
+            row = addr // ( row_nbytes * nbanks )
+            access = latency - 1
+            busy   = bank_busy
+            if s.open_row[bank] == row:
+              s.row_hits += 1
+            else:
+              s.row_misses += 1
+              s.open_row[bank] = row
+              access += row_miss_penalty
+              busy   += row_miss_penalty
+            s.bank_free[bank] = s.cycle + busy
+
+            ready = s.cycle + access
+            if bytes_per_cycle:
+              nbytes = int(req.len) or req.data.nbits >> 3
+              ncycles = ( nbytes + bytes_per_cycle - 1 ) // bytes_per_cycle
+              ready = max( ready, s.bus_free ) + ncycles - 1
+              s.bus_free = ready + 1
+
+            ready = max( ready, s.port_ready[i] )
+            s.port_ready[i] = ready
+            s.resp_qs[i].append( ( ready, resp ) )
+
+        # Return the oldest response once it is ready
+
+        if s.resp_qs[i] and s.resp_qs[i][0][0] <= s.cycle and s.ifc[i].resp.rdy():
+          s.ifc[i].resp( s.resp_qs[i].popleft()[1] )
+
+      s.cycle += 1
+
+  #-----------------------------------------------------------------------
+  # line_trace
+  #-----------------------------------------------------------------------
+
+  def line_trace( s ):
+    return "|".join( [ f"{q.line_trace()}{len(r)}" for q, r in zip(s.req_qs, s.resp_qs) ] )
@@ -0,0 +1,134 @@
+"""
+=========================================================================
+BankedMemoryCL_test.py
+=========================================================================
+Tests for the banked memory model
+
+Date   : 17 October 2026
+"""
+
+import pytest
+
+from pymtl3 import *
+from pymtl3.stdlib.mem import MemMsgType, mk_mem_msg
+from pymtl3.stdlib.test_utils import TestSrcCL, TestSinkCL
+
+from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+from blocking_cache.test.GenericTestCases import wr_miss_1wd_cn
+from blocking_cache.test.MultiCacheTestCases import rd_wr_2c, multicache_mem
+
+from test.sim_utils import (
+  run_sim, TestHarness, MultiCacheTestHarness, CacheTestParams,
+  CacheReqType, CacheRespType, MemReqType, MemRespType
+)
+from test.MemoryCL import MemoryCL
+from test.BankedMemoryCL import BankedMemoryCL
+
+#-------------------------------------------------------------------------
+# TestHarness
+#-------------------------------------------------------------------------
+
+class MemTestHarness( Component ):
+
+  def construct( s, MemModel, nports, src_msgs, sink_msgs, latency, mem_opts ):
+    PortType = mk_mem_msg( 8, 32, 32 )
+    s.srcs  = [ TestSrcCL( PortType[0], src_msgs[i] ) for i in range(nports) ]
+    s.mem   = MemModel( nports, [PortType]*nports, latency=latency, **mem_opts )
+    s.sinks = [ TestSinkCL( PortType[1], sink_msgs[i] ) for i in range(nports) ]
+    for i in range(nports):
+      s.srcs[i].send  //= s.mem.ifc[i].req
+      s.mem.ifc[i].resp //= s.sinks[i].recv
+
+  def done( s ):
+    return all( [ x.done() for x in s.srcs + s.sinks ] )
+
+  def line_trace( s ):
+    return s.mem.line_trace()
+
+req_cls, resp_cls = mk_mem_msg( 8, 32, 32 )
+
+# Writes then reads a word at each address
+def wr_rd_msgs( addrs ):
+  src_msgs, sink_msgs = [], []
+  for i, addr in enumerate( addrs ):
+    src_msgs  += [ req_cls( MemMsgType.WRITE, i, addr, 0, i + 1 ),
+                   req_cls( MemMsgType.READ,  i, addr, 0, 0     ) ]
+    sink_msgs += [ resp_cls( MemMsgType.WRITE, i, 0, 0, 0     ),
+                   resp_cls( MemMsgType.READ,  i, 0, 0, i + 1 ) ]
+  return src_msgs, sink_msgs
+
+def run_mem( MemModel, addrs, nports=1, latency=1, **mem_opts ):
+  msgs = [ wr_rd_msgs( [ addr + 0x4000 * i for addr in addrs ] )
+           for i in range( nports ) ]
+  th = MemTestHarness( MemModel, nports, [ x for x, y in msgs ],
+                       [ y for x, y in msgs ], latency, mem_opts )
+  th.elaborate()
+  th.apply( DefaultPassGroup() )
+  th.sim_reset()
+  while not th.done() and th.sim_cycle_count() < 1000:
+    th.sim_tick()
+  assert th.done()
+  return th.sim_cycle_count(), th.mem
+
+#-------------------------------------------------------------------------
+# Timing
+#-------------------------------------------------------------------------
+
+@pytest.mark.parametrize( "latency", [ 1, 3 ] )
+def test_matches_memorycl( latency ):
+  addrs = [ 0x0, 0x4, 0x10, 0x24 ]
+  # A single open row and no bank conflicts behaves like MemoryCL
+  cycles, mem = run_mem( BankedMemoryCL, addrs, latency=latency, nbanks=1,
+                         row_miss_penalty=0 )
+  assert cycles == run_mem( MemoryCL, addrs, latency=latency )[0]
+  assert mem.row_misses == 1 and mem.bank_conflicts == 0
+
+def test_row_misses():
+  # Alternates between two rows of bank 0
+  addrs = [ 0x0, 0x2000, 0x10, 0x2010 ]
+  row_hit_cycles, _ = run_mem( BankedMemoryCL, addrs, row_miss_penalty=0 )
+  cycles, mem = run_mem( BankedMemoryCL, addrs, row_miss_penalty=4 )
+  assert mem.row_misses == 4 and mem.row_hits == 4
+  assert cycles > row_hit_cycles
+
+def test_bank_conflicts():
+  # Two ports hitting the same bank serialize on it
+  addrs = [ 0x0, 0x80, 0x100 ]
+  cycles, mem = run_mem( BankedMemoryCL, addrs, nports=2, nbanks=1,
+                         row_nbytes=0x8000, row_miss_penalty=0, bank_busy=3 )
+  assert mem.bank_conflicts > 0
+  assert cycles > run_mem( BankedMemoryCL, addrs, nports=2, nbanks=1,
+                           row_nbytes=0x8000, row_miss_penalty=0 )[0]
+
+def test_bandwidth():
+  addrs = [ 0x0, 0x10, 0x20, 0x30 ]
+  cycles = [ run_mem( BankedMemoryCL, addrs, nports=2, row_miss_penalty=0,
+                      bytes_per_cycle=bpc )[0] for bpc in [ 0, 4, 1 ] ]
+  assert cycles[0] < cycles[1] < cycles[2]
+
+#-------------------------------------------------------------------------
+# Harnesses
+#-------------------------------------------------------------------------
+
+def test_harness( cmdline_opts ):
+  p = wr_miss_1wd_cn()
+  th = TestHarness( p.msg[::2], p.msg[1::2], 0, 2, 0, 0, BlockingCacheRTL,
+                    p.CacheReqType, p.CacheRespType, p.MemReqType,
+                    p.MemRespType, p.size, p.associativity,
+                    MemModel=BankedMemoryCL,
+                    mem_opts={ 'row_miss_penalty': 10, 'bytes_per_cycle': 4 } )
+  th.elaborate()
+  th.load( p.mem[::2], p.mem[1::2] )
+  run_sim( th, cmdline_opts, False, False )
+  assert th.mem.row_misses > 0
+
+def test_multicache_harness( cmdline_opts ):
+  associativities, cache_sizes, msgs = rd_wr_2c()
+  tp = CacheTestParams( msgs, multicache_mem(), CacheReqType, CacheRespType,
+                        MemReqType, MemRespType, associativities, cache_sizes,
+                        latency=2, MemModel=BankedMemoryCL,
+                        mem_opts={ 'nbanks': 2, 'bank_busy': 4 } )
+  th = MultiCacheTestHarness( BlockingCacheRTL, tp )
+  th.elaborate()
+  th.load()
+  run_sim( th, cmdline_opts, False, False )
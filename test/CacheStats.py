@@ -0,0 +1,157 @@
+"""
+=========================================================================
+CacheStats.py
+=========================================================================
+Collects statistics of a BlockingCacheRTL simulation by sampling the
+ctrl signals once per cycle, e.g. pass it to run_sim:
+
+  stats = CacheStats( th.cache )
+  run_sim( th, cmdline_opts, trace, sram_wrapper, stats=stats )
+  stats.write_json( 'stats.json' )
+
+Only integer counters are updated per cycle, so it can stay on for long
+runs. Hits and misses are counted like the hardware performance
+counters. Python simulation only: an imported Verilog model has no
+internal signals to sample.
+
+Date   : 17 October 2026
+"""
+
+import csv
+import json
+
+from mem_ifcs.MemMsg import MemMsgType
+from blocking_cache import BlockingCacheCtrlRTL as ctrl_module
+
+# Transaction type names by value, from the TRANS_TYPE_* constants
+TRANS_TYPE_NAMES = [ None ] * ( 1 << ctrl_module.TRANS_TYPE_NBITS )
+for name, value in vars( ctrl_module ).items():
+  if name.startswith( 'TRANS_TYPE_' ) and name != 'TRANS_TYPE_NBITS':
+    TRANS_TYPE_NAMES[ value ] = name[ len( 'TRANS_TYPE_' ): ]
+
+READ_REQ  = ctrl_module.TRANS_TYPE_READ_REQ
+WRITE_REQ = ctrl_module.TRANS_TYPE_WRITE_REQ
+
+STALLS = [ 'ostall_M1', 'ostall_M2', 'cachereq_not_rdy', 'mshr_full' ]
+
+class CacheStats:
+  def __init__( self, cache ):
+    self.ctrl        = cache.cacheCtrl
+    self.dpath       = cache.cacheDpath
+    self.mshr        = cache.cacheDpath.mshr
+    self.nonblocking = cache.param.nonblocking
+    self.line_bytes  = cache.param.bitwidth_cacheline // 8
+
+    self.cycles = 0
+    # Transaction type histograms of M0, M1 and M2 indexed by type
+    self.trans  = [ [ 0 ] * len( TRANS_TYPE_NAMES ) for _ in range( 3 ) ]
+    self.hits   = 0
+    self.misses = 0
+    self.stalls = dict.fromkeys( STALLS, 0 )
+    # Memory requests by type and memory responses
+    self.memreqs  = {}
+    self.memresps = 0
+    # Cycle of each outstanding read/write miss by MSHR entry and a
+    # histogram of the cycles from MSHR alloc to dealloc
+    self.miss_alloc   = {}
+    self.miss_latency = {}
+
+  # Records the current cycle; call once per cycle after sim_tick
+  def sample( self ):
+    ctrl = self.ctrl
+    self.cycles += 1
+
+    trans_M2 = int( ctrl.trans_M2.out )
+    self.trans[0][ int( ctrl.trans_M0 ) ] += 1
+    self.trans[1][ int( ctrl.trans_M1.out ) ] += 1
+    self.trans[2][ trans_M2 ] += 1
+
+    ostall_M2 = ctrl.ostall_M2
+    if ( ( trans_M2 == READ_REQ or trans_M2 == WRITE_REQ ) and
+         not ostall_M2 and not ctrl.is_evict_M2.out and
+         not ctrl.status.prefetch_M2 ):
+      if ctrl.ctrl.hit_M2[0] or ctrl.is_promote_M2.out:
+        self.hits += 1
+      elif not ctrl.is_secondary_M2.out:
+        self.misses += 1
+
+    if ctrl.ostall_M1:
+      self.stalls['ostall_M1'] += 1
+    if ostall_M2:
+      self.stalls['ostall_M2'] += 1
+    if not ctrl.cachereq_rdy:
+      self.stalls['cachereq_not_rdy'] += 1
+    if ctrl.status.MSHR_full:
+      self.stalls['mshr_full'] += 1
+
+    if ctrl.memreq_en:
+      memreq_type = int( self.dpath.memreq_M2.type_ )
+      self.memreqs[ memreq_type ] = self.memreqs.get( memreq_type, 0 ) + 1
+    if ctrl.memresp_en:
+      self.memresps += 1
+
+    if ctrl.ctrl.MSHR_dealloc_en:
+      entry = int( self.mshr.dealloc_id ) if self.nonblocking else 0
+      alloc_cycle = self.miss_alloc.pop( entry, None )
+      if alloc_cycle is not None:
+        latency = self.cycles - alloc_cycle
+        self.miss_latency[ latency ] = self.miss_latency.get( latency, 0 ) + 1
+    if ( ctrl.ctrl.MSHR_alloc_en and not ctrl.ctrl.MSHR_alloc_secondary and
+         self.dpath.MSHR_alloc_in.type_ <= MemMsgType.WRITE and
+         not self.dpath.MSHR_alloc_in.prefetch ):
+      entry = int( self.mshr.alloc_id ) if self.nonblocking else 0
+      self.miss_alloc[ entry ] = self.cycles
+
+  #-----------------------------------------------------------------------
+  # Results
+  #-----------------------------------------------------------------------
+
+  def to_dict( self ):
+    cycles   = max( self.cycles, 1 )
+    accesses = self.hits + self.misses
+    memreqs  = sum( self.memreqs.values() )
+    refills  = self.memreqs.get( MemMsgType.READ, 0 )
+    writebacks = self.memreqs.get( MemMsgType.WRITE, 0 )
+    return {
+      'cycles'  : self.cycles,
+      'trans'   : { stage: { TRANS_TYPE_NAMES[i]: count
+                             for i, count in enumerate( hist ) if count }
+                    for stage, hist in zip( [ 'M0', 'M1', 'M2' ], self.trans ) },
+      'hits'    : self.hits,
+      'misses'  : self.misses,
+      'hit_rate': self.hits / accesses if accesses else 0.0,
+      'miss_latency': { str( latency ): self.miss_latency[ latency ]
+                        for latency in sorted( self.miss_latency ) },
+      'stalls'  : dict( self.stalls ),
+      'memory'  : {
+        'reqs'            : memreqs,
+        'refills'         : refills,
+        'writebacks'      : writebacks,
+        'amos'            : memreqs - refills - writebacks,
+        'resps'           : self.memresps,
+        'req_utilization' : memreqs / cycles,
+        'resp_utilization': self.memresps / cycles,
+        'line_bytes'      : ( refills + writebacks ) * self.line_bytes,
+      },
+    }
+
+  def write_json( self, path ):
+    with open( path, 'w' ) as f:
+      json.dump( self.to_dict(), f, indent=2 )
+      f.write( '\n' )
+
+  # One row per value: group, key, value
+  def write_csv( self, path ):
+    with open( path, 'w', newline='' ) as f:
+      writer = csv.writer( f )
+      writer.writerow( [ 'group', 'key', 'value' ] )
+      for group, value in self.to_dict().items():
+        if isinstance( value, dict ):
+          for key, sub in value.items():
+            if isinstance( sub, dict ):
+              for sub_key, count in sub.items():
+                writer.writerow( [ f'{group}.{key}', sub_key, count ] )
+            else:
+              writer.writerow( [ group, key, sub ] )
+        else:
+          writer.writerow( [ group, '', value ] )
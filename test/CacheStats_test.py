@@ -0,0 +1,53 @@
+"""
+=========================================================================
+CacheStats_test.py
+=========================================================================
+Checks the simulation statistics against the hardware counters
+
+Date   : 17 October 2026
+"""
+
+import pytest
+
+from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+from blocking_cache.cache_constants import *
+from blocking_cache.test.RandomTestCases import random_stream_generator
+
+from test.sim_utils import run_sim, rand_mem, TestHarness
+from test.CacheStats import CacheStats
+
+@pytest.mark.parametrize( "mshr_entries", [ 1, 4 ] )
+def test_stats( tmp_path, mshr_entries, cmdline_opts ):
+  if cmdline_opts['test_verilog']:
+    pytest.skip( "statistics need python simulation" )
+  tp = random_stream_generator( rand_mem( 0, 0x3ff ), 2, 128, 32, 64, 200 )
+  th = TestHarness( tp.msg, None, 0, 2, 0, 0, BlockingCacheRTL,
+                    tp.CacheReqType, tp.CacheRespType, tp.MemReqType,
+                    tp.MemRespType, tp.size, tp.associativity,
+                    { 'perf_counters': True, 'mshr_entries': mshr_entries },
+                    ordered=( mshr_entries == 1 ) )
+  th.elaborate()
+  th.load( tp.mem[::2], tp.mem[1::2] )
+  stats = CacheStats( th.cache )
+  run_sim( th, cmdline_opts, False, False, stats=stats )
+
+  def perf_count( sel ):
+    th.perf_sel @= sel
+    th.sim_tick()
+    return int( th.perf_count )
+
+  result = stats.to_dict()
+  assert result['hits'] == perf_count( PERF_HITS )
+  assert result['misses'] == perf_count( PERF_MISSES )
+  assert result['hits'] + result['misses'] > 0
+  assert result['memory']['writebacks'] == perf_count( PERF_WRITEBACKS )
+  assert result['memory']['amos'] == perf_count( PERF_AMOS )
+  assert result['stalls']['ostall_M1'] == perf_count( PERF_STALL_M1 )
+  assert result['stalls']['mshr_full'] == perf_count( PERF_MSHR_FULL )
+  assert sum( result['miss_latency'].values() ) > 0
+  assert all( sum( hist.values() ) == stats.cycles
+              for hist in result['trans'].values() )
+
+  stats.write_json( tmp_path / 'stats.json' )
+  stats.write_csv( tmp_path / 'stats.csv' )
+  assert ( tmp_path / 'stats.csv' ).read_text().startswith( 'group,key,value' )
@@ -0,0 +1,123 @@
+"""
+=========================================================================
+LatencyTracer.py
+=========================================================================
+Measures the latency of every cache request from the cycle the processor
+sends it (req.en) to the cycle its response is received (resp.en),
+matched by opaque. Pass one to the TestHarness:
+
+  tracer = LatencyTracer( 'latency.csv' )
+  th = TestHarness( ..., tracer=tracer )
+  run_sim( th, cmdline_opts, trace, sram_wrapper )
+  tracer.close()
+  tracer.write_json( 'latency.json' )
+
+Latencies are kept as histograms by request type and hit/miss, so memory
+use is bounded by the distinct latencies rather than the run length. With
+an output file every completed request is also written as a CSV row
+(issue cycle, opaque, type, hit, latency) as it completes.
+
+Date   : 17 October 2026
+"""
+
+import csv
+import json
+from collections import deque
+
+from mem_ifcs.MemMsg import MemMsgType
+
+# Histogram key of each request type, all AMOs share one
+TYPE_NAMES = {
+  MemMsgType.READ      : 'rd',
+  MemMsgType.WRITE     : 'wr',
+  MemMsgType.WRITE_INIT: 'in',
+  MemMsgType.LR        : 'lr',
+  MemMsgType.SC        : 'sc',
+  MemMsgType.INV       : 'inv',
+  MemMsgType.FLUSH     : 'flush',
+}
+for type_ in range( MemMsgType.AMO_ADD, MemMsgType.AMO_XOR + 1 ):
+  TYPE_NAMES[ type_ ] = 'amo'
+
+class LatencyTracer:
+  def __init__( self, output=None ):
+    self.cycle = 0
+    # Issue cycles and types of the requests in flight by opaque, oldest
+    # first in case an opaque is reused
+    self.in_flight = {}
+    # hists[ type name ][ 'hit' or 'miss' ][ latency ] = count
+    self.hists  = {}
+    self.file   = None
+    self.writer = None
+    if output:
+      self.file   = open( output, 'w', newline='' )
+      self.writer = csv.writer( self.file )
+      self.writer.writerow( [ 'issue', 'opaque', 'type', 'hit', 'latency' ] )
+
+  # Records the handshakes of the current cycle, called by the ProcModel
+  # at every clock edge
+  def sample( self, req_en, req_msg, resp_en, resp_msg ):
+    if resp_en:
+      opaque  = int( resp_msg.opaque )
+      pending = self.in_flight.get( opaque )
+      assert pending, f"Response with opaque {opaque:#x} has no request in flight"
+      issue, name = pending.popleft()
+      if not pending:
+        del self.in_flight[ opaque ]
+      hit     = int( resp_msg.test[0] )
+      latency = self.cycle - issue
+      hist    = self.hists.setdefault( name, { 'hit': {}, 'miss': {} } )[
+                  'hit' if hit else 'miss' ]
+      hist[ latency ] = hist.get( latency, 0 ) + 1
+      if self.writer:
+        self.writer.writerow( [ issue, opaque, name, hit, latency ] )
+
+    if req_en:
+      self.in_flight.setdefault( int( req_msg.opaque ), deque() ).append(
+        ( self.cycle, TYPE_NAMES[ int( req_msg.type_ ) ] ) )
+
+    self.cycle += 1
+
+  def close( self ):
+    if self.file:
+      self.file.close()
+      self.file = self.writer = None
+
+  #-----------------------------------------------------------------------
+  # Results
+  #-----------------------------------------------------------------------
+
+  # Smallest latency that at least fraction of the requests are within
+  @staticmethod
+  def percentile( hist, fraction ):
+    total = sum( hist.values() )
+    count = 0
+    for latency in sorted( hist ):
+      count += hist[ latency ]
+      if count >= fraction * total:
+        return latency
+    return 0
+
+  @staticmethod
+  def summary( hist ):
+    total = sum( hist.values() )
+    return {
+      'count': total,
+      'mean' : sum( l * n for l, n in hist.items() ) / total if total else 0.0,
+      'p50'  : LatencyTracer.percentile( hist, 0.5 ),
+      'p99'  : LatencyTracer.percentile( hist, 0.99 ),
+      'max'  : max( hist, default=0 ),
+      'hist' : { str( l ): hist[ l ] for l in sorted( hist ) },
+    }
+
+  def to_dict( self ):
+    return {
+      name: { outcome: self.summary( hist ) for outcome, hist in outcomes.items()
+              if hist }
+      for name, outcomes in self.hists.items()
+    }
+
+  def write_json( self, path ):
+    with open( path, 'w' ) as f:
+      json.dump( self.to_dict(), f, indent=2 )
+      f.write( '\n' )
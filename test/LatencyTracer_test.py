@@ -0,0 +1,62 @@
+"""
+=========================================================================
+LatencyTracer_test.py
+=========================================================================
+Tests for the per-request latency tracing
+
+Date   : 17 October 2026
+"""
+
+import csv
+
+import pytest
+
+from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+from blocking_cache.test.GenericTestCases import wr_miss_1wd_cn
+from blocking_cache.test.RandomTestCases import random_stream_generator
+
+from test.sim_utils import run_sim, rand_mem, TestHarness
+from test.LatencyTracer import LatencyTracer
+
+def test_latency( tmp_path, cmdline_opts ):
+  p = wr_miss_1wd_cn()
+  tracer = LatencyTracer( tmp_path / 'latency.csv' )
+  th = TestHarness( p.msg[::2], p.msg[1::2], 0, 1, 0, 0, BlockingCacheRTL,
+                    p.CacheReqType, p.CacheRespType, p.MemReqType,
+                    p.MemRespType, p.size, p.associativity, tracer=tracer )
+  th.elaborate()
+  th.load( p.mem[::2], p.mem[1::2] )
+  run_sim( th, cmdline_opts, False, False )
+  tracer.close()
+
+  result = tracer.to_dict()
+  assert set( result ) == { 'wr', 'rd' }
+  assert set( result['wr'] ) == { 'miss' } and result['wr']['miss']['count'] == 1
+  assert set( result['rd'] ) == { 'hit' } and result['rd']['hit']['count'] == 2
+  assert result['wr']['miss']['p50'] > result['rd']['hit']['max'] > 0
+  assert not tracer.in_flight
+
+  with open( tmp_path / 'latency.csv' ) as f:
+    rows = list( csv.DictReader( f ) )
+  assert [ int( row['opaque'] ) for row in rows ] == [ 0, 1, 2 ]
+  assert [ row['type'] for row in rows ] == [ 'wr', 'rd', 'rd' ]
+  assert int( rows[0]['latency'] ) == result['wr']['miss']['max']
+
+@pytest.mark.parametrize( "mshr_entries", [ 1, 4 ] )
+def test_latency_stream( mshr_entries, cmdline_opts ):
+  tp = random_stream_generator( rand_mem( 0, 0x3ff ), 2, 128, 32, 64, 200 )
+  tracer = LatencyTracer()
+  th = TestHarness( tp.msg, None, 0, 2, 0, 0, BlockingCacheRTL,
+                    tp.CacheReqType, tp.CacheRespType, tp.MemReqType,
+                    tp.MemRespType, tp.size, tp.associativity,
+                    { 'mshr_entries': mshr_entries },
+                    ordered=( mshr_entries == 1 ), tracer=tracer )
+  th.elaborate()
+  th.load( tp.mem[::2], tp.mem[1::2] )
+  run_sim( th, cmdline_opts, False, False )
+
+  result = tracer.to_dict()
+  assert sum( outcome['count'] for outcomes in result.values()
+              for outcome in outcomes.values() ) == 200
+  assert result['rd']['miss']['p99'] >= result['rd']['miss']['p50']
+  assert not tracer.in_flight
@@ -9,14 +9,107 @@ in the interface.
 
 Modified for Cifer Tapeout to include write bits
 
+The memory is an MmapMemoryFL, anonymous or backed by the sparse file at
+mem_path, so large address spaces only cost the pages touched.
+
+By default every port is served every cycle. To model contention on a
+shared memory, arbitration selects how the ports share max_grants
+requests per cycle:
+
+  'all'         : no arbitration, every ready port is served
+  'fixed'       : lower ports have priority
+  'round_robin' : the port after the last granted one has priority
+
+and bytes_per_cycle limits the bandwidth of the shared channel: a request
+of n bytes keeps the channel busy for ceil(n / bytes_per_cycle) cycles.
+The grants and the cycles ready requests waited are counted per port,
+see queue_stats.
+
 Author : Shunning Jiang, edited by Xiaoyu Yan (xy97)
 Date   : Mar 12, 2018
 """
 
+from functools import lru_cache
+
 from pymtl3 import *
-from pymtl3.stdlib.mem import MagicMemoryFL, MemMsgType, mk_mem_msg, MemMinionIfcCL
+from pymtl3.stdlib.mem import MemMsgType, mk_mem_msg, MemMinionIfcCL
 from pymtl3.stdlib.delays import DelayPipeDeqCL, DelayPipeSendCL, StallCL
 
+from .MmapMemory import MmapMemoryFL
+
+#-------------------------------------------------------------------------
+# Bulk line access
+#-------------------------------------------------------------------------
+# Reads and writes a whole line of the bytes of a MagicMemoryFL in one
+# slice instead of a call per word or a loop per byte.
+
+def read_line( mem, addr, nbytes ):
+  addr = int(addr)
+  assert addr + nbytes <= len(mem.mem)
+  return Bits( nbytes << 3, int.from_bytes( mem.mem[ addr : addr + nbytes ], 'little' ) )
+
+# Bit mask of the bytes of the set words of a word-level write mask
+@lru_cache( maxsize=None )
+def word_mask_bits( wr_mask, nwords ):
+  mask = 0
+  for j in range(nwords):
+    if ( wr_mask >> j ) & 1:
+      mask |= 0xffffffff << ( 32 * j )
+  return mask
+
+def write_line_masked( mem, addr, data, wr_mask ):
+  addr   = int(addr)
+  nbytes = data.nbits >> 3
+  nwords = wr_mask.nbits
+  assert addr + nbytes <= len(mem.mem)
+  wr_mask = int(wr_mask)
+  if wr_mask == ( 1 << nwords ) - 1:
+    mem.mem[ addr : addr + nbytes ] = int(data).to_bytes( nbytes, 'little' )
+  elif wr_mask:
+    mask = word_mask_bits( wr_mask, nwords )
+    old  = int.from_bytes( mem.mem[ addr : addr + nbytes ], 'little' )
+    new  = ( old & ~mask ) | ( int(data) & mask )
+    mem.mem[ addr : addr + nbytes ] = new.to_bytes( nbytes, 'little' )
+
+#-------------------------------------------------------------------------
+# serve_req
+#-------------------------------------------------------------------------
+# Performs a memory request on a MagicMemoryFL and returns the response
+
+def serve_req( mem, req, RespType ):
+  data_nbits = req.data.nbits
+  len_ = int(req.len)
+  if len_ == 0: len_ = data_nbits >> 3
+
+  if   req.type_ == MemMsgType.READ:
+    if hasattr( req, "wr_mask" ):
+      resp = RespType( req.type_, req.opaque, 0, req.len,
+                       req.wr_mask, read_line( mem, req.addr, len_ ) )
+    else:
+      resp = RespType( req.type_, req.opaque, 0, req.len,
+                       read_line( mem, req.addr, len_ ) )
+  elif req.type_ == MemMsgType.WRITE:
+
+    if hasattr(req, "wr_mask"):
+      # check if the request has a word-level write mask (1 word = 32 bits)
+      assert req.wr_mask.nbits == req.data.nbits // 32
+      write_line_masked( mem, req.addr, req.data, req.wr_mask )
+      resp = RespType( req.type_, req.opaque, 0, 0, 0, 0 )
+    else:
+      # no write mask
+      mem.write( req.addr, len_, req.data )
+    # FIXME do we really set len=0 in response when doing subword wr?
+    # resp = RespType( req.type_, req.opaque, 0, req.len, 0 )
+      resp = RespType( req.type_, req.opaque, 0, 0, 0 )
+
+  else: # AMOS
+    # Assume AMO operations are always a word
+    amo_result = mem.amo( req.type_, req.addr, len_, req.data[0:32] )
+    resp = RespType( req.type_, req.opaque, 0, req.len, 0,
+      zext(amo_result, data_nbits) )
+
+  return resp
+
 class MemoryCL( Component ):
 
   # Magical methods
@@ -27,9 +120,20 @@ class MemoryCL( Component ):
   def write_mem( s, addr, data ):
     return s.mem.write_mem( addr, data )
 
+  def write_words( s, addrs, data_ints ):
+    return s.mem.write_words( addrs, data_ints )
+
+  def load_image( s, addr, image ):
+    return s.mem.load_image( addr, image )
+
+  def load_elf( s, path ):
+    return s.mem.load_elf( path )
+
   # Actual stuff
   def construct( s, nports, mem_ifc_dtypes=[mk_mem_msg(8,32,32), mk_mem_msg(8,32,32)],
-                 stall_prob=0, latency=1, mem_nbytes=2**20 ):
+                 stall_prob=0, latency=1, mem_nbytes=2**20, mem_path=None,
+                 arbitration='all', max_grants=1, bytes_per_cycle=0 ):
+    assert arbitration in [ 'all', 'fixed', 'round_robin' ]
 
     # Local constants
 
@@ -37,7 +141,7 @@ class MemoryCL( Component ):
     req_classes  = [ x for (x,y) in mem_ifc_dtypes ]
     resp_classes = [ y for (x,y) in mem_ifc_dtypes ]
     
-    s.mem = MagicMemoryFL( mem_nbytes )
+    s.mem = MmapMemoryFL( mem_nbytes, mem_path )
 
     # Interface
 
@@ -57,52 +161,58 @@ class MemoryCL( Component ):
 
       s.req_qs[i].enq      //= s.req_stalls[i].send
 
-    data_nbits = req_classes[i].data_nbits
+    # Arbitration state and per port statistics
+
+    s.cycle        = 0
+    s.rr_next      = 0   # port with priority for round robin
+    s.channel_free = 0   # cycle the shared channel is free
+    s.grants       = [ 0 ] * nports
+    s.wait_cycles  = [ 0 ] * nports
+    s.max_wait     = [ 0 ] * nports
+    s.cur_wait     = [ 0 ] * nports
 
     @update_once
     def up_mem():
 
-      for i in range(s.nports):
+      if arbitration == 'round_robin':
+        ports = [ ( s.rr_next + k ) % s.nports for k in range(s.nports) ]
+      else:
+        ports = range(s.nports)
+
+      ngrants = 0
+      for i in ports:
 
         if s.req_qs[i].deq.rdy() and s.resp_qs[i].enq.rdy():
 
+          if ( ( arbitration != 'all' and ngrants == max_grants ) or
+               s.cycle < s.channel_free ):
+            s.wait_cycles[i] += 1
+            s.cur_wait[i]    += 1
+            s.max_wait[i] = max( s.max_wait[i], s.cur_wait[i] )
+            continue
+
           # Dequeue memory request message
 
           req = s.req_qs[i].deq()
-          len_ = int(req.len)
-          if len_ == 0: len_ = req_classes[i].data_nbits >> 3
-
-          if   req.type_ == MemMsgType.READ:
-            if hasattr( req, "wr_mask" ):
-              resp = resp_classes[i]( req.type_, req.opaque, 0, req.len,
-                                    req.wr_mask, s.mem.read( req.addr, len_ ) )
-            else:
-              resp = resp_classes[i]( req.type_, req.opaque, 0, req.len,
-                                    s.mem.read( req.addr, len_ ) )
-          elif req.type_ == MemMsgType.WRITE:
-
-            if hasattr(req, "wr_mask"):
-              # check if the request has a word-level write mask (1 word = 32 bits)
-              assert req.wr_mask.nbits == req.data.nbits // 32
-              for j in range(req.wr_mask.nbits):
-                if req.wr_mask[j]:
-                  s.mem.write( req.addr + 4 * j, 4, req.data[32*j:32*(j+1)] )
-              resp = resp_classes[i]( req.type_, req.opaque, 0, 0, 0, 0 )
-            else:
-              # no write mask
-              s.mem.write( req.addr, len_, req.data )
-            # FIXME do we really set len=0 in response when doing subword wr?
-            # resp = resp_classes[i]( req.type_, req.opaque, 0, req.len, 0 )
-              resp = resp_classes[i]( req.type_, req.opaque, 0, 0, 0 )
-
-          else: # AMOS
-            # Assume AMO operations are always a word
-            amo_result = s.mem.amo( req.type_, req.addr, len_, req.data[0:32] )
-            resp = resp_classes[i]( req.type_, req.opaque, 0, req.len, 0,
-              zext(amo_result, data_nbits) )
+          resp = serve_req( s.mem, req, resp_classes[i] )
 
           s.resp_qs[i].enq( resp )
 
+          ngrants += 1
+          s.grants[i]  += 1
+          s.cur_wait[i] = 0
+          s.rr_next = ( i + 1 ) % s.nports
+          if bytes_per_cycle:
+            nbytes = int(req.len) or req.data.nbits >> 3
+            s.channel_free = s.cycle + ( nbytes + bytes_per_cycle - 1 ) // bytes_per_cycle
+
+      s.cycle += 1
+
+  def queue_stats( s ):
+    return [ { 'grants'     : s.grants[i],
+               'wait_cycles': s.wait_cycles[i],
+               'max_wait'   : s.max_wait[i] } for i in range(s.nports) ]
+
   #-----------------------------------------------------------------------
   # line_trace
   #-----------------------------------------------------------------------
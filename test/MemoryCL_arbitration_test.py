@@ -0,0 +1,61 @@
+"""
+=========================================================================
+MemoryCL_arbitration_test.py
+=========================================================================
+Tests for the arbitration of MemoryCL between its ports
+
+Date   : 17 October 2026
+"""
+
+import pytest
+
+from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+from blocking_cache.test.MultiCacheTestCases import inv_fl_4c, multicache_mem
+
+from test.sim_utils import (
+  run_sim, MultiCacheTestHarness, CacheTestParams, CacheReqType, CacheRespType,
+  MemReqType, MemRespType
+)
+from test.MemoryCL import MemoryCL
+from .BankedMemoryCL_test import run_mem
+
+addrs = [ 0x0, 0x4, 0x8, 0xc, 0x10 ]
+
+def test_no_arbitration():
+  cycles, mem = run_mem( MemoryCL, addrs, nports=4 )
+  assert cycles == run_mem( MemoryCL, addrs, nports=1 )[0]
+  assert all( stats['wait_cycles'] == 0 for stats in mem.queue_stats() )
+
+def test_fixed():
+  cycles, mem = run_mem( MemoryCL, addrs, nports=4, arbitration='fixed' )
+  stats = mem.queue_stats()
+  assert cycles > run_mem( MemoryCL, addrs, nports=4 )[0]
+  assert [ x['grants'] for x in stats ] == [ 2 * len( addrs ) ] * 4
+  assert stats[0]['wait_cycles'] == 0
+  assert stats[0]['wait_cycles'] < stats[1]['wait_cycles'] < stats[3]['wait_cycles']
+
+def test_round_robin():
+  cycles, mem = run_mem( MemoryCL, addrs, nports=4, arbitration='round_robin' )
+  stats = mem.queue_stats()
+  assert all( 0 < x['max_wait'] <= 3 for x in stats )
+  cycles2, mem = run_mem( MemoryCL, addrs, nports=4, arbitration='round_robin',
+                          max_grants=2 )
+  assert cycles2 < cycles
+
+def test_bandwidth():
+  cycles = [ run_mem( MemoryCL, addrs, nports=2, bytes_per_cycle=bpc )[0]
+             for bpc in [ 0, 4, 2 ] ]
+  assert cycles[0] < cycles[1] < cycles[2]
+
+@pytest.mark.parametrize( "arbitration", [ 'fixed', 'round_robin' ] )
+def test_multicache( arbitration, cmdline_opts ):
+  associativities, cache_sizes, msgs = inv_fl_4c()
+  tp = CacheTestParams( msgs, multicache_mem(), CacheReqType, CacheRespType,
+                        MemReqType, MemRespType, associativities, cache_sizes,
+                        mem_opts={ 'arbitration': arbitration,
+                                   'bytes_per_cycle': 8 } )
+  th = MultiCacheTestHarness( BlockingCacheRTL, tp )
+  th.elaborate()
+  th.load()
+  run_sim( th, cmdline_opts, False, False )
+  assert sum( x['wait_cycles'] for x in th.mem.queue_stats() ) > 0
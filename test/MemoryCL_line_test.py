@@ -0,0 +1,37 @@
+"""
+=========================================================================
+MemoryCL_line_test.py
+=========================================================================
+Checks the bulk line accesses of MemoryCL against word accesses
+
+Date   : 17 October 2026
+"""
+
+import random
+
+from pymtl3 import *
+from pymtl3.stdlib.mem import MagicMemoryFL
+
+from .MemoryCL   import read_line, write_line_masked
+from .MmapMemory import MmapMemoryFL
+
+def test_masked_writes():
+  rgen = random.Random( 0x5eed )
+  for nwords in [ 1, 4, 16 ]:
+    ref = MagicMemoryFL( 1024 )
+    mem = MmapMemoryFL( 1024 )
+    ref.elaborate()
+    mem.elaborate()
+    for _ in range( 100 ):
+      addr    = rgen.randrange( 0, 1024 - 4 * nwords, 4 )
+      data    = Bits( 32 * nwords, rgen.getrandbits( 32 * nwords ) )
+      wr_mask = Bits( nwords, rgen.getrandbits( nwords ) )
+      if rgen.random() < 0.2:
+        wr_mask = Bits( nwords, -1 )
+      for j in range( nwords ):
+        if wr_mask[j]:
+          ref.write( addr + 4 * j, 4, data[32*j:32*(j+1)] )
+      write_line_masked( mem, addr, data, wr_mask )
+      assert mem.mem[:] == ref.mem
+      assert read_line( mem, addr, 4 * nwords ) == ref.read( addr, 4 * nwords )
+      assert read_line( mem, addr + 1, 2 ) == ref.read( addr + 1, 2 )
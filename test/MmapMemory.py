@@ -0,0 +1,88 @@
+"""
+========================================================================
+MmapMemoryFL
+========================================================================
+A MagicMemoryFL whose bytes are an mmap instead of a bytearray. The
+mapping is anonymous, or a sparse file when a path is given, so only the
+pages that are touched use memory and multi-GB address spaces are cheap.
+A file backed memory keeps its contents after the simulation.
+
+Memory images are loaded with a single copy each: raw binaries with
+load_image and the loadable segments of ELF files with load_elf.
+
+Date   : 17 October 2026
+"""
+
+import mmap
+import struct
+
+from pymtl3.stdlib.mem import MagicMemoryFL
+
+# ELF header fields after e_ident up to e_phnum, and program headers, of
+# 32 and 64 bit little endian files
+ELF_MAGIC    = b'\x7fELF'
+PT_LOAD      = 1
+elf32_header = struct.Struct( '<HHIIIIIHHH' )
+elf64_header = struct.Struct( '<HHIQQQIHHH' )
+elf32_phdr   = struct.Struct( '<IIIIIIII' )
+elf64_phdr   = struct.Struct( '<IIQQQQQQ' )
+
+class MmapMemoryFL( MagicMemoryFL ):
+
+  def construct( s, mem_nbytes=1<<20, path=None ):
+    super().construct( 0 )
+
+    if path is None:
+      s.mem = mmap.mmap( -1, mem_nbytes )
+    else:
+      with open( path, 'a+b' ) as f:
+        if f.seek( 0, 2 ) < mem_nbytes:
+          f.truncate( mem_nbytes )
+        s.mem = mmap.mmap( f.fileno(), mem_nbytes )
+
+  # Writes 32 bit words straight into the mapping
+  def write_words( s, addrs, data_ints ):
+    for addr, data_int in zip( addrs, data_ints ):
+      struct.pack_into( '<I', s.mem, addr, data_int )
+
+  # Copies a raw binary image, bytes or a file path, to addr
+  def load_image( s, addr, image ):
+    if not isinstance( image, ( bytes, bytearray, memoryview ) ):
+      with open( image, 'rb' ) as f:
+        image = f.read()
+    s.write_mem( addr, image )
+
+  # Copies the PT_LOAD segments of an ELF file to their physical addresses
+  # and zeroes their bss. Returns the entry point.
+  def load_elf( s, path ):
+    with open( path, 'rb' ) as f:
+      elf = f.read()
+
+    if elf[:4] != ELF_MAGIC or elf[5] != 1:
+      raise ValueError( f"{path} is not a little endian ELF file" )
+    if elf[4] == 1:
+      header, phdr = elf32_header, elf32_phdr
+    elif elf[4] == 2:
+      header, phdr = elf64_header, elf64_phdr
+    else:
+      raise ValueError( f"{path} has an unknown ELF class {elf[4]}" )
+
+    ( e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,
+      e_ehsize, e_phentsize, e_phnum ) = header.unpack_from( elf, 16 )
+
+    for i in range( e_phnum ):
+      fields = phdr.unpack_from( elf, e_phoff + i * e_phentsize )
+      if phdr is elf32_phdr:
+        p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags, p_align = fields
+      else:
+        p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_align = fields
+      if p_type != PT_LOAD:
+        continue
+      s.write_mem( p_paddr, elf[ p_offset : p_offset + p_filesz ] )
+      if p_memsz > p_filesz:
+        s.write_mem( p_paddr + p_filesz, bytes( p_memsz - p_filesz ) )
+
+    return e_entry
+
+  def close( s ):
+    s.mem.close()
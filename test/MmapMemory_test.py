@@ -0,0 +1,87 @@
+"""
+=========================================================================
+MmapMemory_test.py
+=========================================================================
+Tests for the mmap backed memory
+
+Date   : 17 October 2026
+"""
+
+import struct
+
+from pymtl3 import *
+
+from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+from blocking_cache.test.GenericTestCases import wr_miss_1wd_cn
+
+from test.sim_utils import run_sim, TestHarness
+from test.MmapMemory import MmapMemoryFL
+
+def mk_mem( mem_nbytes, path=None ):
+  mem = MmapMemoryFL( mem_nbytes, path )
+  mem.elaborate()
+  return mem
+
+def test_sparse( tmp_path ):
+  # A 4GB space only allocates the pages that are written
+  mem = mk_mem( 1 << 32, tmp_path / 'mem.bin' )
+  mem.write( 0xfff00000, 4, b32(0xdeadbeef) )
+  mem.write_words( [ 0x10, 0x14 ], [ 1, 2 ] )
+  assert mem.read( 0xfff00000, 4 ) == 0xdeadbeef
+  assert mem.read( 0x10, 8 ) == 0x0000000200000001
+  assert mem.read( 0x80000000, 4 ) == 0
+  mem.close()
+  assert ( tmp_path / 'mem.bin' ).stat().st_blocks * 512 < 1 << 20
+
+  # The file keeps the contents
+  mem = mk_mem( 1 << 32, tmp_path / 'mem.bin' )
+  assert mem.read( 0xfff00000, 4 ) == 0xdeadbeef
+  mem.close()
+
+def test_load_image( tmp_path ):
+  ( tmp_path / 'image.bin' ).write_bytes( bytes( range( 64 ) ) )
+  mem = mk_mem( 1 << 16 )
+  mem.load_image( 0x100, tmp_path / 'image.bin' )
+  mem.load_image( 0x200, b'\x01\x02' )
+  assert mem.read_mem( 0x100, 64 ) == bytes( range( 64 ) )
+  assert mem.read( 0x200, 2 ) == 0x0201
+
+def mk_elf32( entry, segments ):
+  # Header, then the program headers, then the segment data
+  phoff = 52
+  data  = phoff + 32 * len( segments )
+  elf   = bytearray( b'\x7fELF\x01\x01\x01' + bytes( 9 ) )
+  elf  += struct.pack( '<HHIIIIIHHHHHH', 2, 0xf3, 1, entry, phoff, 0, 0, 52,
+                       32, len( segments ), 40, 0, 0 )
+  for p_type, paddr, contents, memsz in segments:
+    elf += struct.pack( '<IIIIIIII', p_type, data, paddr, paddr,
+                        len( contents ), memsz, 5, 4 )
+    data += len( contents )
+  for p_type, paddr, contents, memsz in segments:
+    elf += contents
+  return bytes( elf )
+
+def test_load_elf( tmp_path ):
+  ( tmp_path / 'prog.elf' ).write_bytes( mk_elf32( 0x200, [
+    ( 1, 0x200, b'\x13\x00\x00\x00' * 4, 16 ),
+    ( 4, 0x400, b'\xff' * 8,             8  ), # not loaded
+    ( 1, 0x800, b'\xaa' * 4,             12 ), # with bss
+  ] ) )
+  mem = mk_mem( 1 << 16 )
+  mem.write_mem( 0x800, b'\xff' * 16 )
+  assert mem.load_elf( tmp_path / 'prog.elf' ) == 0x200
+  assert mem.read_mem( 0x200, 16 ) == b'\x13\x00\x00\x00' * 4
+  assert mem.read_mem( 0x400, 8 ) == bytes( 8 )
+  assert mem.read_mem( 0x800, 16 ) == b'\xaa' * 4 + bytes( 8 ) + b'\xff' * 4
+
+def test_harness( tmp_path, cmdline_opts ):
+  p = wr_miss_1wd_cn()
+  th = TestHarness( p.msg[::2], p.msg[1::2], 0, 1, 0, 0, BlockingCacheRTL,
+                    p.CacheReqType, p.CacheRespType, p.MemReqType,
+                    p.MemRespType, p.size, p.associativity,
+                    mem_opts={ 'mem_nbytes': 1 << 32,
+                               'mem_path'  : tmp_path / 'mem.bin' } )
+  th.elaborate()
+  th.load( p.mem[::2], p.mem[1::2] )
+  run_sim( th, cmdline_opts, False, False )
+  assert th.mem.read_mem( 0x1000, 4 ) == struct.pack( '<I', 0x01020304 )
@@ -14,7 +14,8 @@ from pymtl3.stdlib.basic_rtl import RegRst
 
 class ProcModel( Component ):
 
-  def construct( s, CacheReqType, CacheRespType ):
+  # tracer, e.g. a LatencyTracer, is given the handshakes of every cycle
+  def construct( s, CacheReqType, CacheRespType, tracer=None ):
     # src -> |  ProcModel  |  -> cache
     # requests and responses
     s.proc  = MemMinionIfcRTL( CacheReqType, CacheRespType )
@@ -28,13 +29,13 @@ class ProcModel( Component ):
     s.proc.resp.en   //= s.cache.resp.en
     # s.cache.resp.rdy //= s.proc.resp.rdy
 
-    s.trans_in_flight = RegRst(Bits2) # keeps track of transactions in flight
+    s.trans_in_flight = RegRst(Bits8) # keeps track of transactions in flight
 
     @update
     def signal_model():
       # If the cache request is not ready, then the processor's response rdy is
       # low.
-      if s.trans_in_flight.out == b2(0):
+      if s.trans_in_flight.out == b8(0):
         s.cache.resp.rdy @= s.proc.resp.rdy & s.cache.req.rdy
       else:
         s.cache.resp.rdy @= s.proc.resp.rdy
@@ -45,9 +46,15 @@ class ProcModel( Component ):
     def update_trans_in_flight():
       s.trans_in_flight.in_ @= s.trans_in_flight.out
       if s.cache.req.en and ~s.cache.resp.en:
-        s.trans_in_flight.in_ @= s.trans_in_flight.out + b2(1)
+        s.trans_in_flight.in_ @= s.trans_in_flight.out + b8(1)
       elif ~s.cache.req.en and s.cache.resp.en:
-        s.trans_in_flight.in_ @= s.trans_in_flight.out - b2(1)
+        s.trans_in_flight.in_ @= s.trans_in_flight.out - b8(1)
+
+    if tracer is not None:
+      @update_ff
+      def up_trace_latency():
+        tracer.sample( s.proc.req.en, s.proc.req.msg, s.proc.resp.en,
+                       s.proc.resp.msg )
 
   def line_trace( s ):
     msg = ''
@@ -0,0 +1,184 @@
+"""
+=========================================================================
+TraceFile.py
+=========================================================================
+Compact binary format for cache request streams so they can be saved
+once and replayed, e.g. production address traces.
+
+A trace is a 16 byte header followed by fixed width little endian
+records. The file is memory mapped for reading, so records are unpacked
+straight from the page cache and traces much larger than memory can be
+replayed.
+
+  header : magic 'PMTR', version (u8), flags (u8), data bytes (u16),
+           8 reserved bytes
+  record : type (u8), opaque (u8), len (u8), cache (u8), order (u32),
+           addr (u32), data (data bytes)
+
+With the HAS_RESPS flag the records alternate between requests and
+their expected responses, like the msgs lists of the tests, and the addr
+field of a response holds its test field. Otherwise all records are
+requests and the responses come from the FL model. cache and order are
+only used by multicache traces (see mreq).
+
+Date   : 17 October 2026
+"""
+
+import itertools
+import mmap
+import struct
+
+MAGIC     = b'PMTR'
+VERSION   = 1
+HAS_RESPS = 0x1
+
+header_struct = struct.Struct( '<4sBBH8x' )
+
+# Data of up to 64 bits is one field, wider data is split in 64 bit words
+def mk_record_struct( data_nbytes ):
+  if data_nbytes == 4:
+    data_fmt = 'I'
+  elif data_nbytes % 8 == 0:
+    data_fmt = 'Q' * ( data_nbytes // 8 )
+  else:
+    raise ValueError( f"Unsupported trace data width: {data_nbytes} bytes" )
+  return struct.Struct( '<BBBBII' + data_fmt )
+
+#-------------------------------------------------------------------------
+# TraceWriter
+#-------------------------------------------------------------------------
+
+class TraceWriter:
+  def __init__( self, path, data_nbits=32, has_resps=False ):
+    self.data_nbytes = data_nbits // 8
+    self.has_resps   = has_resps
+    self.record      = mk_record_struct( self.data_nbytes )
+    self.nwords      = self.data_nbytes // 8
+    self.file        = open( path, 'wb' )
+    self.file.write( header_struct.pack( MAGIC, VERSION,
+                     HAS_RESPS if has_resps else 0, self.data_nbytes ) )
+
+  def write( self, type_, opaque, addr, len_, data, cache=0, order=0 ):
+    if self.nwords > 1:
+      data = [ ( data >> ( 64 * i ) ) & 0xffffffffffffffff
+               for i in range( self.nwords ) ]
+      self.file.write( self.record.pack( type_, opaque, len_, cache, order,
+                                         addr, *data ) )
+    else:
+      self.file.write( self.record.pack( type_, opaque, len_, cache, order,
+                                         addr, data ) )
+
+  # Writes a request or response message, or an mreq tuple
+  def write_msg( self, msg ):
+    cache = order = 0
+    if isinstance( msg, tuple ):
+      cache, order, msg = msg
+    if hasattr( msg, 'addr' ):
+      addr = msg.addr
+    else:
+      addr = msg.test
+    self.write( int( msg.type_ ), int( msg.opaque ), int( addr ),
+                int( msg.len ), int( msg.data ), cache, order )
+
+  def close( self ):
+    self.file.close()
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, *args ):
+    self.close()
+
+# Saves a msgs list of the tests, i.e. alternating requests and responses
+def write_trace( path, msgs, data_nbits=32 ):
+  with TraceWriter( path, data_nbits, has_resps=True ) as writer:
+    for msg in msgs:
+      writer.write_msg( msg )
+
+#-------------------------------------------------------------------------
+# TraceFile
+#-------------------------------------------------------------------------
+# Iterating a trace yields (type, opaque, addr, len, data) ints. The
+# generators hold a view of the mapping until they are exhausted or
+# closed.
+
+class TraceFile:
+  def __init__( self, path ):
+    self.file = open( path, 'rb' )
+    self.mm   = mmap.mmap( self.file.fileno(), 0, access=mmap.ACCESS_READ )
+    magic, version, flags, self.data_nbytes = \
+      header_struct.unpack_from( self.mm, 0 )
+    if magic != MAGIC or version != VERSION:
+      raise ValueError( f"{path} is not a version {VERSION} cache trace" )
+    self.has_resps = bool( flags & HAS_RESPS )
+    self.record    = mk_record_struct( self.data_nbytes )
+    self.nwords    = self.data_nbytes // 8
+    nbytes = len( self.mm ) - header_struct.size
+    if nbytes % self.record.size:
+      raise ValueError( f"{path} ends in a partial record" )
+    self.nrecords = nbytes // self.record.size
+
+  def __len__( self ):
+    return self.nrecords
+
+  # Raw records as (type, opaque, len, cache, order, addr, *data)
+  def records( self, step=1 ):
+    with memoryview( self.mm ) as view:
+      yield from itertools.islice(
+        self.record.iter_unpack( view[ header_struct.size: ] ), 0, None, step )
+
+  def unpack( self, step=1 ):
+    if self.nwords > 1:
+      for type_, opaque, len_, cache, order, addr, *words in self.records( step ):
+        data = 0
+        for i, word in enumerate( words ):
+          data |= word << ( 64 * i )
+        yield type_, opaque, addr, len_, data, cache, order
+    else:
+      for type_, opaque, len_, cache, order, addr, data in self.records( step ):
+        yield type_, opaque, addr, len_, data, cache, order
+
+  def __iter__( self ):
+    for type_, opaque, addr, len_, data, cache, order in self.unpack():
+      yield type_, opaque, addr, len_, data
+
+  # Requests as (type, addr, len, data), the form ModelCache.stream and
+  # ModelCache.replay take
+  def requests( self ):
+    for type_, opaque, addr, len_, data, cache, order in \
+        self.unpack( step=2 if self.has_resps else 1 ):
+      yield type_, addr, len_, data
+
+  def opaques( self ):
+    for record in self.records( step=2 if self.has_resps else 1 ):
+      yield record[1]
+
+  # (request, response) messages of a trace with responses
+  def transactions( self, CacheReqType, CacheRespType ):
+    for req_rec, resp_rec in self.pairs():
+      yield ( CacheReqType ( *req_rec[:5] ), CacheRespType( *resp_rec[:5] ) )
+
+  # msgs list of a multicache trace, mreq tuples alternating with
+  # responses
+  def multicache_msgs( self, CacheReqType, CacheRespType ):
+    msgs = []
+    for req_rec, resp_rec in self.pairs():
+      msgs.append( ( req_rec[5], req_rec[6], CacheReqType( *req_rec[:5] ) ) )
+      msgs.append( CacheRespType( *resp_rec[:5] ) )
+    return msgs
+
+  def pairs( self ):
+    assert self.has_resps, "Trace has no responses, replay it on the FL model"
+    records = self.unpack()
+    for req_rec in records:
+      yield req_rec, next( records )
+
+  def close( self ):
+    self.mm.close()
+    self.file.close()
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, *args ):
+    self.close()
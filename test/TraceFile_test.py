@@ -0,0 +1,85 @@
+"""
+=========================================================================
+TraceFile_test.py
+=========================================================================
+Tests for saving and replaying binary cache traces
+
+Date   : 17 October 2026
+"""
+
+from pymtl3 import *
+from mem_ifcs.MemMsg import mk_mem_msg
+
+from blocking_cache.BlockingCacheRTL import BlockingCacheRTL
+from blocking_cache.test.GenericTestCases import rd_hit_1wd, gen_mem
+from blocking_cache.test.MultiCacheTestCases import rd_wr_2c, multicache_mem
+from blocking_cache.test.RandomTestCases import random_trace
+
+from .sim_utils import (
+  run_sim, gen_req_resp, gen_trace_stream, mk_req, TestHarness,
+  MultiCacheTestHarness, CacheTestParams, CacheReqType, CacheRespType,
+  MemReqType, MemRespType
+)
+from .TraceFile import TraceFile, TraceWriter, write_trace
+
+def test_roundtrip( tmp_path ):
+  for dbw in [ 32, 64, 128 ]:
+    ReqType, RespType = mk_mem_msg( 8, 32, dbw, False )
+    msgs = [ ReqType ( 1, 0x12, 0xabcd0, 0, ( 1 << dbw ) - 2 ),
+             RespType( 1, 0x12, 1, 0, 0 ),
+             ReqType ( 0, 0xff, 0xfffffffc, 2, 0 ),
+             RespType( 0, 0xff, 0, 2, 0xbeef ) ]
+    write_trace( tmp_path / f'{dbw}.trace', msgs, dbw )
+    with TraceFile( tmp_path / f'{dbw}.trace' ) as trace:
+      assert trace.has_resps and len( trace ) == 4
+      got = []
+      for req_msg, resp_msg in trace.transactions( ReqType, RespType ):
+        got += [ req_msg, resp_msg ]
+      assert got == msgs
+      assert list( trace.requests() ) == [ ( 1, 0xabcd0, 0, ( 1 << dbw ) - 2 ),
+                                           ( 0, 0xfffffffc, 2, 0 ) ]
+      assert list( trace.opaques() ) == [ 0x12, 0xff ]
+
+def test_fl_replay( tmp_path ):
+  ReqType, RespType = mk_mem_msg( 8, 32, 64, False )
+  MemReqType, MemRespType = mk_mem_msg( 8, 32, 128, True )
+  reqs = []
+  with TraceWriter( tmp_path / 'reqs.trace', 64 ) as writer:
+    for i, ( type_, addr, len_, data ) in enumerate( random_trace( 3, 300, 0x1ff, 64 ) ):
+      writer.write( type_, i & 0xff, addr, len_, data )
+      reqs.append( ( type_, i & 0xff, addr, len_, data ) )
+  mem = gen_mem
+  expected = gen_req_resp( mk_req( ReqType, reqs ), mem, ReqType, RespType,
+                           MemReqType, MemRespType, 2, 64 )
+  with TraceFile( tmp_path / 'reqs.trace' ) as trace:
+    assert not trace.has_resps
+    stream = gen_trace_stream( trace, mem, ReqType, RespType, MemReqType,
+                               MemRespType, 2, 64 )
+    msgs = []
+    while stream:
+      msgs.append( stream.popleft() )
+    assert msgs == expected[::2]
+    assert list( stream.pending ) == expected[1::2]
+
+def test_harness( tmp_path, cmdline_opts ):
+  p = rd_hit_1wd()
+  write_trace( tmp_path / 'rd_hit_1wd.trace', p.msg )
+  with TraceFile( tmp_path / 'rd_hit_1wd.trace' ) as trace:
+    th = TestHarness( trace, None, 0, 1, 0, 0, BlockingCacheRTL,
+                      p.CacheReqType, p.CacheRespType, p.MemReqType,
+                      p.MemRespType, p.size, p.associativity )
+    th.elaborate()
+    th.load( p.mem[::2], p.mem[1::2] )
+    run_sim( th, cmdline_opts, False, False )
+
+def test_multicache_harness( tmp_path, cmdline_opts ):
+  associativities, cache_sizes, msgs = rd_wr_2c()
+  write_trace( tmp_path / 'rd_wr_2c.trace', msgs )
+  with TraceFile( tmp_path / 'rd_wr_2c.trace' ) as trace:
+    tp = CacheTestParams( trace, multicache_mem(), CacheReqType, CacheRespType,
+                          MemReqType, MemRespType, associativities, cache_sizes )
+  assert tp.msgs == msgs
+  th = MultiCacheTestHarness( BlockingCacheRTL, tp )
+  th.elaborate()
+  th.load()
+  run_sim( th, cmdline_opts, False, False )
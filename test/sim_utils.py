@@ -8,13 +8,14 @@ Author : Xiaoyu Yan (xy97), Eric Tang (et396)
 Date   : 21 Decemeber 2019
 """
 
-import struct
 import random
+from collections import deque
 
 from pymtl3 import *
 from pymtl3.stdlib.mem        import MemMasterIfcRTL, MemMinionIfcRTL
 from pymtl3.stdlib.test_utils import TestSrcCL
 from pymtl3.stdlib.test_utils import TestSinkCL
+from pymtl3.stdlib.test_utils.test_sinks import PyMTLTestSinkError
 
 from pymtl3.passes.tracing import VcdGenerationPass
 from pymtl3.passes.backends.verilog import (
@@ -27,9 +28,12 @@ from mem_ifcs.MemMsg import MemMsgType, mk_mem_msg
 
 from .ProcModel import ProcModel
 from .MemoryCL  import MemoryCL as CiferMemoryCL
+from .BankedMemoryCL import BankedMemoryCL
 from .MulticoreModel import MulticoreModel
+from .TraceFile import TraceFile
 
 from blocking_cache.BlockingCacheFL import ModelCache
+from blocking_cache.cache_constants import PERF_SEL_NBITS, PERF_COUNTER_NBITS
 from blocking_cache.translate import replace_sram, sram_wrapper_file
 import subprocess
 
@@ -37,11 +41,32 @@ import subprocess
 # Run the simulation
 #---------------------------------------------------------------------
 
-def run_sim( th, cmdline_opts, trace, sram_wrapper ):
+# stats, e.g. a CacheStats, is sampled every cycle
+def run_sim( th, cmdline_opts, trace, sram_wrapper, stats=None ):
+  max_cycles   = cmdline_opts['max_cycles'] or 20000
+  assert not ( stats and cmdline_opts['test_verilog'] ), \
+    "Statistics sample internal signals, which needs python simulation"
+
+  th = setup_sim( th, cmdline_opts, sram_wrapper )
+
+  while not th.done() and th.sim_cycle_count() < max_cycles:
+    th.sim_tick()
+    if stats:
+      stats.sample()
+
+  # Check timeout
+  assert th.sim_cycle_count() < max_cycles
+
+  th.sim_tick()
+  th.sim_tick()
+  th.sim_tick()
+
+# Translates and imports the cache if testing verilog, and resets the
+# simulation. Returns the harness to simulate
+def setup_sim( th, cmdline_opts, sram_wrapper, linetrace=True ):
   test_verilog = cmdline_opts['test_verilog']
   dump_vcd     = cmdline_opts['dump_vcd']
   dump_vtb     = cmdline_opts['dump_vtb']
-  max_cycles   = cmdline_opts['max_cycles'] or 20000
 
   if dump_vcd:
     th.set_metadata( VcdGenerationPass.vcd_file_name, dump_vcd )
@@ -69,43 +94,38 @@ def run_sim( th, cmdline_opts, trace, sram_wrapper ):
       process = subprocess.Popen(bashCommand, stdout=subprocess.PIPE, shell=True)
       output, error = process.communicate()
 
-  th.apply( DefaultPassGroup( linetrace=True ) )
+  th.apply( DefaultPassGroup( linetrace=linetrace ) )
   th.sim_reset()
-
-  while not th.done() and th.sim_cycle_count() < max_cycles:
-    th.sim_tick()
-
-  # Check timeout
-  assert th.sim_cycle_count() < max_cycles
-
-  th.sim_tick()
-  th.sim_tick()
-  th.sim_tick()
+  return th
 
 #----------------------------------------------------------------------
 # Generate req/response pair from the requests using ref model
 #---------------------------------------------------------------------
 
 def gen_req_resp( reqs, mem, CacheReqType, CacheRespType, MemReqType, MemRespType,
-                  associativity, cacheSize ):
+                  associativity, cacheSize, policy='lru' ):
   cache = ModelCache( cacheSize, associativity, 0, CacheReqType, CacheRespType,
-                      MemReqType, MemRespType, mem )
-  for request in reqs:
-    if request.type_ == MemMsgType.READ:
-      cache.read(request.addr, request.opaque, request.len)
-    elif request.type_ == MemMsgType.WRITE:
-      cache.write(request.addr, request.data, request.opaque, request.len)
-    elif request.type_ == MemMsgType.WRITE_INIT:
-      cache.init(request.addr, request.data, request.opaque, request.len)
-    elif request.type_ >= MemMsgType.AMO_ADD and request.type_ <= MemMsgType.AMO_XOR:
-      cache.amo(request.addr, request.data, request.opaque, request.len, request.type_)
-    elif request.type_ == MemMsgType.INV:
-      cache.invalidate(request.opaque)
-    elif request.type_ == MemMsgType.FLUSH:
-      cache.flush(request.opaque)
-    else:
-      assert False, "FL model: Undefined transaction type"
-  return cache.get_transactions()
+                      MemReqType, MemRespType, mem, policy=policy )
+  types = [ int( request.type_ ) for request in reqs ]
+  addrs = [ int( request.addr  ) for request in reqs ]
+  lens  = [ int( request.len   ) for request in reqs ]
+  datas = [ int( request.data  ) for request in reqs ]
+  hits, rdata = cache.replay( types, addrs, lens, datas )
+  msgs = []
+  for req_msg, resp_msg in cache.iter_transactions( types, addrs, lens, datas,
+      hits, rdata, [ request.opaque for request in reqs ] ):
+    msgs += [ req_msg, resp_msg ]
+  return msgs
+
+# Expected transactions of a saved trace. Traces without responses are
+# replayed on the FL model as the test pulls them
+def gen_trace_stream( trace, mem, CacheReqType, CacheRespType, MemReqType,
+                      MemRespType, associativity, cacheSize, policy='lru' ):
+  if trace.has_resps:
+    return TransactionStream( trace.transactions( CacheReqType, CacheRespType ) )
+  cache = ModelCache( cacheSize, associativity, 0, CacheReqType, CacheRespType,
+                      MemReqType, MemRespType, mem, policy=policy )
+  return TransactionStream( cache.stream( trace.requests(), trace.opaques() ) )
 
 def rand_mem(addr_min=0, addr_max=0xfff):
   '''
@@ -120,23 +140,191 @@ def rand_mem(addr_min=0, addr_max=0xfff):
     curr_addr += 4
   return mem
 
+#-------------------------------------------------------------------------
+# UnorderedTestSinkCL
+#-------------------------------------------------------------------------
+# A nonblocking cache answers hits under misses, so the responses can come
+# back in a different order than the requests. Each message is checked
+# against all the messages not received yet.
+
+class UnorderedTestSinkCL( TestSinkCL ):
+
+  @non_blocking( lambda s: s.count==0 )
+  def recv( s, msg ):
+    assert s.count == 0, "Invalid en/rdy transaction! Sink is stalled (not ready), but receives a message."
+
+    for i in range( s.idx, len( s.msgs ) ):
+      if s.cmp_fn( msg, s.msgs[i] ):
+        s.msgs[s.idx], s.msgs[i] = s.msgs[i], s.msgs[s.idx]
+        s.idx += 1
+        s.recv_called = True
+        return
+
+    if s.idx >= len( s.msgs ):
+      s.error_msg = ( 'Test Sink received more msgs than expected!\n'
+                      f'Received : {msg}' )
+    else:
+      s.error_msg = (
+        f'Test sink {s} received WRONG message!\n'
+        f'Expected one of : {s.msgs[ s.idx: ]}\n'
+        f'Received : { msg }'
+      )
+
+#-------------------------------------------------------------------------
+# TransactionStream
+#-------------------------------------------------------------------------
+# Feeds a test from an iterator of (request, expected response) pairs,
+# such as ModelCache.stream, instead of materialized message lists. The
+# source pulls the next request when it sends and the expected response
+# waits in pending until the sink receives it, so only the transactions
+# in flight are held in memory.
+
+class TransactionStream:
+  def __init__( self, transactions ):
+    self.transactions = iter( transactions )
+    self.pending      = deque()
+    self.next_msgs    = next( self.transactions, None )
+
+  # deque interface used by TestSrcCL
+  def __bool__( self ):
+    return self.next_msgs is not None
+
+  def popleft( self ):
+    req_msg, resp_msg = self.next_msgs
+    self.pending.append( resp_msg )
+    self.next_msgs = next( self.transactions, None )
+    return req_msg
+
+  def done( self ):
+    return self.next_msgs is None and not self.pending
+
+class StreamTestSrcCL( TestSrcCL ):
+
+  def construct( s, Type, stream, initial_delay=0, interval_delay=0 ):
+    super().construct( Type, [], initial_delay, interval_delay )
+    s.msgs = stream
+
+#-------------------------------------------------------------------------
+# StreamTestSinkCL
+#-------------------------------------------------------------------------
+# Checks the responses against the pending responses of a
+# TransactionStream. Unordered sinks take any pending response, like
+# UnorderedTestSinkCL.
+
+class StreamTestSinkCL( Component ):
+
+  def construct( s, Type, stream, initial_delay=0, interval_delay=0,
+                 ordered=True, cmp_fn=lambda a, b : a == b ):
+
+    s.recv.Type = Type
+
+    s.stream    = stream
+    s.ordered   = ordered
+    s.cmp_fn    = cmp_fn
+    s.error_msg = ''
+
+    s.all_msg_recved = False
+    s.done_flag      = False
+
+    s.count = initial_delay
+    s.intv  = interval_delay
+
+    s.recv_called = False
+
+    @update_once
+    def up_stream_sink_count():
+      # Raise exception at the start of next cycle so that the errored
+      # line trace gets printed out
+      if s.error_msg:
+        raise PyMTLTestSinkError( s.error_msg )
+
+      # Tick one more cycle after all message is received so that the
+      # exception gets thrown
+      if s.all_msg_recved:
+        s.done_flag = True
+
+      if s.stream.done():
+        s.all_msg_recved = True
+
+      # if recv was called in previous cycle
+      if s.recv_called:
+        s.count = s.intv
+      elif s.count != 0:
+        s.count -= 1
+      else:
+        s.count = 0
+
+      s.recv_called = False
+
+    s.add_constraints(
+      U( up_stream_sink_count ) < M( s.recv ),
+      U( up_stream_sink_count ) < M( s.recv.rdy )
+    )
+
+  @non_blocking( lambda s: s.count==0 )
+  def recv( s, msg ):
+    assert s.count == 0, "Invalid en/rdy transaction! Sink is stalled (not ready), but receives a message."
+
+    pending = s.stream.pending
+    for i in range( len( pending ) if not s.ordered else min( len( pending ), 1 ) ):
+      if s.cmp_fn( msg, pending[i] ):
+        del pending[i]
+        s.recv_called = True
+        return
+
+    if not pending:
+      s.error_msg = ( 'Test Sink received more msgs than expected!\n'
+                      f'Received : {msg}' )
+    else:
+      expected = list( pending ) if not s.ordered else pending[0]
+      s.error_msg = (
+        f'Test sink {s} received WRONG message!\n'
+        f'Expected{"" if s.ordered else " one of"} : {expected}\n'
+        f'Received : { msg }'
+      )
+
+  def done( s ):
+    return s.done_flag
+
+  def line_trace( s ):
+    return "{}".format( s.recv )
+
 #-------------------------------------------------------------------------
 # TestHarness
 #-------------------------------------------------------------------------
+# src_msgs may also be a TransactionStream or a TraceFile with responses,
+# sink_msgs is then unused. tracer, e.g. a LatencyTracer, records the
+# latency of every request. MemModel is the memory model, e.g.
+# BankedMemoryCL, and mem_opts its extra options. cmp_fn compares a
+# response with the expected one
 
 class TestHarness( Component ):
 
   def construct( s, src_msgs, sink_msgs, stall_prob, latency, src_delay,
                  sink_delay, CacheModel, CacheReqType, CacheRespType,
-                 MemReqType, MemRespType, cacheSize=128, associativity=1 ):
+                 MemReqType, MemRespType, cacheSize=128, associativity=1,
+                 cache_opts=None, ordered=True, tracer=None,
+                 MemModel=CiferMemoryCL, mem_opts=None,
+                 cmp_fn=lambda a, b : a == b ):
     # Instantiate models
-    s.src   = TestSrcCL(CacheReqType, src_msgs, src_delay, src_delay)
-    s.proc_model = ProcModel(CacheReqType, CacheRespType)
+    if isinstance( src_msgs, TraceFile ):
+      src_msgs = TransactionStream( src_msgs.transactions( CacheReqType,
+                                                           CacheRespType ) )
+    if isinstance( src_msgs, TransactionStream ):
+      s.src  = StreamTestSrcCL(CacheReqType, src_msgs, src_delay, src_delay)
+      s.sink = StreamTestSinkCL(CacheRespType, src_msgs, src_delay, sink_delay,
+                                ordered, cmp_fn)
+    else:
+      s.src  = TestSrcCL(CacheReqType, src_msgs, src_delay, src_delay)
+      Sink   = TestSinkCL if ordered else UnorderedTestSinkCL
+      s.sink = Sink(CacheRespType, sink_msgs, src_delay, sink_delay,
+                    cmp_fn=cmp_fn)
+    s.proc_model = ProcModel(CacheReqType, CacheRespType, tracer)
     s.cache = CacheModel(CacheReqType, CacheRespType, MemReqType, MemRespType,
-                         cacheSize, associativity)
-    s.mem   = CiferMemoryCL( 1, [(MemReqType, MemRespType)],
-                             stall_prob=stall_prob, latency=latency) # Use our own modified mem
-    s.sink  = TestSinkCL(CacheRespType, sink_msgs, src_delay, sink_delay)
+                         cacheSize, associativity, **(cache_opts or {}))
+    s.mem   = MemModel( 1, [(MemReqType, MemRespType)],
+                        stall_prob=stall_prob, latency=latency,
+                        **(mem_opts or {}) ) # Use our own modified mem
 
     # Set the test signals to better model the processor
 
@@ -149,11 +337,17 @@ class TestHarness( Component ):
     # Connect the cache req and resp ports to test memory
     s.mem.ifc[0] //= s.cache.mem_master_ifc
 
+    # The performance counters are read through the harness
+    if ( cache_opts or {} ).get( 'perf_counters' ):
+      s.perf_sel   = InPort ( PERF_SEL_NBITS )
+      s.perf_clear = InPort ()
+      s.perf_count = OutPort( PERF_COUNTER_NBITS )
+      s.cache.perf_sel   //= s.perf_sel
+      s.cache.perf_clear //= s.perf_clear
+      s.cache.perf_count //= s.perf_count
+
   def load( s, addrs, data_ints ):
-    for addr, data_int in zip( addrs, data_ints ):
-      data_bytes_a = bytearray()
-      data_bytes_a.extend( struct.pack("<I",data_int) )
-      s.mem.write_mem( addr, data_bytes_a )
+    s.mem.write_words( addrs, data_ints )
 
   def done( s ):
     return s.src.done() and s.sink.done()
@@ -250,13 +444,17 @@ def mreq( cache, order, type_, opaque, addr, len, data ):
 class CacheTestParams:
   def __init__( self, msgs, mem, CacheReqType, CacheRespType, MemReqType,
                 MemRespType, associativity=[1], cache_size=[64], stall_prob=0,
-                latency=1, src_delay=0, sink_delay=0 ):
+                latency=1, src_delay=0, sink_delay=0, MemModel=CiferMemoryCL,
+                mem_opts=None, cache_opts=None ):
     assert isinstance(associativity, list) and len(associativity) > 0, \
       f'associativity must be an array, len={len(associativity)}'
     assert isinstance(associativity, list) and len(cache_size) > 0, \
       f'cache_size must be an array, len={len(cache_size)}'
     assert len(associativity) == len(cache_size), \
       f'cache_size must equal to Assoc, cache_size={len(associativity)} Assoc={len(cache_size)}'
+    # msgs may be a TraceFile with cache, order and responses
+    if isinstance( msgs, TraceFile ):
+      msgs = msgs.multicache_msgs( CacheReqType, CacheRespType )
     self.msgs = msgs
     self.mem = mem
     self.CacheReqType = CacheReqType
@@ -269,6 +467,9 @@ class CacheTestParams:
     self.latency = latency
     self.src_delay = src_delay
     self.sink_delay = sink_delay
+    self.MemModel = MemModel
+    self.mem_opts = mem_opts or {}
+    self.cache_opts = cache_opts or {}
     self.ncaches = len(associativity)
     self.src_init_delay = 0
     self.sink_init_delay = 0
@@ -289,7 +490,8 @@ class MultiCache( Component ):
     s.mem_master_ifc = [ MemMasterIfcRTL( p.MemReqType, p.MemRespType ) for i in range( p.ncaches ) ]
 
     s.caches = [ Cache( p.CacheReqType, p.CacheRespType, p.MemReqType, p.MemRespType,
-                        p.cache_size[i], p.associativity[i] ) for i in range( p.ncaches ) ]
+                        p.cache_size[i], p.associativity[i], **p.cache_opts )
+                  for i in range( p.ncaches ) ]
     for i in range( p.ncaches ):
       s.caches[i].mem_minion_ifc //= s.mem_minion_ifc[i]
       s.caches[i].mem_master_ifc //= s.mem_master_ifc[i]
@@ -307,19 +509,15 @@ class MultiCacheTestHarness( Component ):
     # Module that integrates all the caches into one for easier translation
     s.cache = MultiCache( Cache, p )
     # L2 cache or main memory model
-    s.mem   = CiferMemoryCL( p.ncaches, [(p.MemReqType, p.MemRespType)]*p.ncaches, latency=p.latency )
+    s.mem   = p.MemModel( p.ncaches, [(p.MemReqType, p.MemRespType)]*p.ncaches,
+                          latency=p.latency, **p.mem_opts )
     for i in range( p.ncaches ):
       connect( s.proc.mem_master_ifc[i],  s.cache.mem_minion_ifc[i] )
       # connect( s.cache.mem_master_ifc[i], s.mem.ifc[i]              )
       s.cache.mem_master_ifc[i] //= s.mem.ifc[i]
 
   def load( s ):
-    addrs = s.tp.mem[::2]
-    data_ints = s.tp.mem[1::2]
-    for addr, data_int in zip( addrs, data_ints ):
-      data_bytes_a = bytearray()
-      data_bytes_a.extend( struct.pack("<I",data_int) )
-      s.mem.write_mem( addr, data_bytes_a )
+    s.mem.write_words( s.tp.mem[::2], s.tp.mem[1::2] )
 
   def done( s ):
     return s.proc.done()